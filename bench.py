@@ -0,0 +1,349 @@
+"""Benchmarks for the main data paths against a seeded database.
+
+Usage:
+    python bench.py --scale 1k --scale 100k --save-baseline bench_baseline.json
+    python bench.py --scale 100k --baseline bench_baseline.json
+    python bench.py --scale 1k --mongomock
+
+A throwaway database (``crime_analysis_bench`` by default) is dropped and
+seeded with synthetic criminals, cases, assignments, evidence and GridFS
+images, then each operation is run headless through the service layer.
+Latency percentiles, server round trips and peak RSS are reported per
+operation; with ``--baseline`` any operation whose p95 latency or query count
+has grown past the tolerance is flagged and the exit status is non-zero.
+Operations that could not run, such as the text search under ``--mongomock``,
+are listed as skipped rather than left out of the comparison silently.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from PIL import Image
+from pymongo import MongoClient, monitoring
+
+from schema import run_migrations
+from search import with_name_terms
+from services import DEFAULT_URI, CrimeService
+from uploads import file_summaries
+
+logger = logging.getLogger("bench")
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+DEFAULT_DATABASE = "crime_analysis_bench"
+DEFAULT_REPEAT = 20
+DEFAULT_TOLERANCE = 0.25
+SEED_BATCH_SIZE = 10_000
+MAX_IMAGES = 1_000
+
+FIRST_NAMES = ["John", "Jane", "Ravi", "Priya", "Amudha", "Gopika", "Harini", "Arun", "Meena", "Karthik",
+               "Lakshmi", "Suresh", "Divya", "Vijay", "Anita", "Rahul", "Sneha", "Ramesh", "Kavya", "Mohan"]
+LAST_NAMES = ["Smith", "Kumar", "Ganesan", "Raman", "Iyer", "Nair", "Reddy", "Pillai", "Das", "Menon",
+              "Sharma", "Rao", "Singh", "Patel", "Joseph", "Thomas", "Varghese", "Krishnan", "Bose", "Shah"]
+CRIMES = ["Theft", "Burglary", "Fraud", "Assault", "Robbery", "Arson", "Forgery", "Smuggling"]
+EVIDENCE_TYPES = ["Photo", "Video", "Document", "Weapon", "Fingerprint", "Fibre", "Audio"]
+EVIDENCE_WORDS = ["knife", "glove", "receipt", "phone", "car", "footprint", "bag", "jacket", "laptop", "key"]
+
+
+class QueryCounter(monitoring.CommandListener):
+    """Counts commands sent to the server."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        with self._lock:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def peak_rss_mb():
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def make_image(rng, size=(320, 240)):
+    image = Image.new("RGB", size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    # A few random pixels so every image has a different hash
+    for _ in range(8):
+        image.putpixel((rng.randrange(size[0]), rng.randrange(size[1])), (rng.randrange(256),) * 3)
+    out = io.BytesIO()
+    image.save(out, "PNG")
+    return out.getvalue()
+
+
+def _insert_batches(collection, docs):
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= SEED_BATCH_SIZE:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+
+def seed(service, count, images, rng):
+    """Fill the database with ``count`` criminals and proportional related records."""
+    db = service.db
+    case_count = max(count // 2, 1)
+    officer_count = max(count // 100, 1)
+    started = time.perf_counter()
+
+    _insert_batches(db["criminals"], (with_name_terms({
+        "custom_id": f"CR{i:07d}",
+        "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        "age": str(rng.randint(18, 80)),
+        "gender": rng.choice(["Male", "Female", "Other"]),
+        "crime": rng.choice(CRIMES),
+        "status": rng.choice(["Active", "Inactive", "Incarcerated"]),
+    }) for i in range(count)))
+    _insert_batches(db["cases"], ({
+        "case_id": f"CS{i:07d}",
+        "description": f"{rng.choice(CRIMES)} reported",
+        "status": rng.choice(["Open", "Closed"]),
+        "officer": f"OF{rng.randrange(officer_count):05d}",
+    } for i in range(case_count)))
+    _insert_batches(db["officer_assignments"], ({
+        "case_id": f"CS{i:07d}",
+        "officer_id": f"OF{rng.randrange(officer_count):05d}",
+    } for i in range(case_count)))
+
+    # Only some evidence carries a file; files are shared with the biometric images below
+    file_ids = []
+    for i in range(images):
+        upload = service.files.upload_stream(io.BytesIO(make_image(rng)), f"seed_{i}.png")
+        if upload.error:
+            raise upload.error
+        file_ids.append(upload.file_id)
+    if file_ids:
+        # One record through the normal path so it has a thumbnail sidecar; the rest are bulk inserted
+        service.biometrics.add("CR0000000", "Face", [{"file_id": file_ids[0], "filename": "seed_0.png"}])
+        _insert_batches(db["biometric_data"], ({
+            "criminal_id": f"CR{rng.randrange(count):07d}",
+            "type": rng.choice(["Fingerprint", "Face"]),
+            "file_id": file_id,
+        } for file_id in file_ids[1:]))
+    # Evidence carries its file's metadata, as EvidenceRepository stores it
+    summaries = file_summaries(db, file_ids) if file_ids else {}
+
+    def evidence(i):
+        file_id = file_ids[i % len(file_ids)] if file_ids and i % 10 == 0 else None
+        return {
+            "type": rng.choice(EVIDENCE_TYPES),
+            "description": f"{rng.choice(EVIDENCE_WORDS)} found near {rng.choice(EVIDENCE_WORDS)}",
+            "case_id": f"CS{rng.randrange(case_count):07d}",
+            "file_id": file_id,
+            **summaries.get(file_id, {}),
+        }
+
+    _insert_batches(db["evidence"], (evidence(i) for i in range(count)))
+    logger.info("Seeded %d criminals, %d cases, %d images in %.1fs",
+                count, case_count, images, time.perf_counter() - started)
+
+
+def operations(service, image_dir, rng):
+    """Return ``{name: callable}`` for each benchmarked data path."""
+    image_paths = [os.path.join(image_dir, f"upload_{i}.png") for i in range(3)]
+
+    def view_criminals():
+        # First screenful plus two scrolled pages, as the virtual list loads them
+        after = None
+        for _ in range(3):
+            _, after = service.criminals.browse(after, 50)
+            if after is None:
+                break
+
+    def search_criminal():
+        service.criminals.search(rng.choice(LAST_NAMES)[:4].lower())
+
+    def lookup_criminal():
+        # An investigation keeps returning to the same few records
+        service.criminals.get(f"CR{rng.randrange(10):07d}")
+
+    def view_evidence():
+        # First two pages of the evidence grid, as scrolling loads them
+        _, after = service.evidence.grid()
+        if after is not None:
+            service.evidence.grid(after=after)
+
+    def search_evidence():
+        service.evidence.search(rng.choice(EVIDENCE_WORDS))
+
+    def generate_officer_report():
+        service.reports.officer_report()
+
+    def add_biometric():
+        # Fresh images every run so deduplication does not short-circuit the upload
+        for path in image_paths:
+            with open(path, "wb") as f:
+                f.write(make_image(rng))
+        results = service.files.upload_many(image_paths, {"criminal_id": "CR0000001"})
+        service.biometrics.add("CR0000001", "Face", [result.to_dict() for result in results])
+
+    return {
+        "view_criminals": view_criminals,
+        "search_criminal": search_criminal,
+        "lookup_criminal": lookup_criminal,
+        "view_evidence": view_evidence,
+        "search_evidence": search_evidence,
+        "generate_officer_report": generate_officer_report,
+        "add_biometric": add_biometric,
+    }
+
+
+def run_operation(operation, repeat, counter):
+    timings = []
+    queries_before = counter.count if counter else None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        operation()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "runs": repeat,
+        "p50_ms": round(percentile(timings, 0.50), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "p99_ms": round(percentile(timings, 0.99), 3),
+        "max_ms": round(timings[-1], 3),
+        "queries": (counter.count - queries_before) / repeat if counter else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regression messages for operations slower or chattier than the baseline."""
+    regressions = []
+    for scale, ops in results.items():
+        for name, current in ops.items():
+            previous = baseline.get(scale, {}).get(name)
+            if not previous or "error" in current or "error" in previous \
+                    or "skipped" in current or "skipped" in previous:
+                continue
+            if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{scale} {name}: p95 {previous['p95_ms']:.1f}ms -> {current['p95_ms']:.1f}ms")
+            if current["queries"] is not None and previous["queries"] is not None \
+                    and current["queries"] > previous["queries"]:
+                regressions.append(f"{scale} {name}: queries {previous['queries']:g} -> {current['queries']:g}")
+    return regressions
+
+
+def not_compared(results, baseline, only=None):
+    """Return a message for each baseline operation that has no comparable result this run."""
+    messages = []
+    for scale, ops in baseline.items():
+        for name, previous in ops.items():
+            current = results.get(scale, {}).get(name)
+            if current is None:
+                if scale in results and (not only or name in only):
+                    messages.append(f"{scale} {name}: not run")
+            elif "skipped" in current or "error" in current:
+                messages.append(f"{scale} {name}: {current.get('skipped') or current['error']}")
+    return messages
+
+
+def connect(args):
+    if args.mongomock:
+        import mongomock
+        import mongomock.gridfs
+        mongomock.gridfs.enable_gridfs_integration()
+        return mongomock.MongoClient(), None
+    counter = QueryCounter()
+    return MongoClient(args.uri, event_listeners=[counter]), counter
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the crime_analysis data paths")
+    parser.add_argument("--scale", action="append", choices=sorted(SCALES), help="repeatable; default 1k")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--images", type=int, help=f"GridFS images to seed (default scale/10, max {MAX_IMAGES})")
+    parser.add_argument("--only", action="append", help="run only the named operation (repeatable)")
+    parser.add_argument("--uri", default=DEFAULT_URI)
+    parser.add_argument("--database", default=DEFAULT_DATABASE)
+    parser.add_argument("--mongomock", action="store_true", help="use an in-process mongomock database")
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument("--save-baseline", help="write results to this file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    client, counter = connect(args)
+    image_dir = tempfile.mkdtemp(prefix="crime_bench_")
+    results = {}
+    try:
+        for scale in args.scale or ["1k"]:
+            count = SCALES[scale]
+            rng = random.Random(args.seed)
+            client.drop_database(args.database)
+            # mongomock has no change streams; the repositories' own notifications are enough here
+            service = CrimeService(client[args.database], change_stream=not args.mongomock)
+            run_migrations(service.db)
+            images = args.images if args.images is not None else min(count // 10, MAX_IMAGES)
+            seed(service, count, images, rng)
+
+            results[scale] = {}
+            for name, operation in operations(service, image_dir, rng).items():
+                if args.only and name not in args.only:
+                    continue
+                try:
+                    operation()  # warm-up: vocabularies, caches and connections
+                    results[scale][name] = run_operation(operation, args.repeat, counter)
+                except NotImplementedError as e:
+                    # A server feature the in-process database lacks, such as $text
+                    results[scale][name] = {"skipped": f"not supported by this database: {e}"}
+                    print(f"{scale:>5} {name:<24} SKIPPED ({results[scale][name]['skipped']})")
+                    continue
+                except Exception as e:
+                    logger.warning("%s %s failed: %s", scale, name, e)
+                    results[scale][name] = {"error": f"{type(e).__name__}: {e}"}
+                    print(f"{scale:>5} {name:<24} FAILED ({results[scale][name]['error']})")
+                    continue
+                result = results[scale][name]
+                print(f"{scale:>5} {name:<24} p50 {result['p50_ms']:9.2f}ms  p95 {result['p95_ms']:9.2f}ms  "
+                      f"p99 {result['p99_ms']:9.2f}ms  queries {result['queries'] if counter else '-'}  "
+                      f"rss {result['peak_rss_mb']}MB")
+    finally:
+        shutil.rmtree(image_dir, ignore_errors=True)
+        client.drop_database(args.database)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        for message in not_compared(results, baseline, args.only):
+            print(f"NOT COMPARED {message}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
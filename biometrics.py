@@ -0,0 +1,43 @@
+"""Bulk loading of biometric metadata for pages of criminals."""
+import logging
+
+logger = logging.getLogger(__name__)
+
+BIOMETRIC_COLLECTION = "biometric_data"
+BIOMETRIC_PROJECTION = {"criminal_id": 1, "type": 1, "file_id": 1, "thumb_id": 1, "sha256": 1, "md5": 1}
+
+# Collections known to exist, so existence is checked once per session rather than once per row.
+# Only a positive answer is kept: the collection may be created later by bootstrap or another client.
+_known_collections = set()
+
+
+def collection_exists(db, name):
+    if name not in _known_collections and name in db.list_collection_names():
+        _known_collections.add(name)
+    return name in _known_collections
+
+
+def load_biometrics_for_page(db, criminal_ids):
+    """Return ``({criminal_id: [biometric docs]}, query_count)`` for a page.
+
+    All biometric metadata for the page is fetched with a single ``$in``
+    query, so the number of round trips does not depend on the page size.
+    """
+    criminal_ids = [cid for cid in criminal_ids if cid is not None]
+    by_criminal = {cid: [] for cid in criminal_ids}
+    queries = 0
+
+    if BIOMETRIC_COLLECTION not in _known_collections:
+        queries += 1
+    if not criminal_ids or not collection_exists(db, BIOMETRIC_COLLECTION):
+        return by_criminal, queries
+
+    cursor = db[BIOMETRIC_COLLECTION].find(
+        {"criminal_id": {"$in": criminal_ids}}, BIOMETRIC_PROJECTION
+    ).sort("_id", 1)
+    queries += 1
+    for bio in cursor:
+        by_criminal[bio["criminal_id"]].append(bio)
+
+    logger.debug("Loaded biometrics for %d criminals with %d queries", len(criminal_ids), queries)
+    return by_criminal, queries
@@ -0,0 +1,161 @@
+"""Read-through cache of documents looked up by a unique key.
+
+Flows such as updating a criminal or adding biometrics fetch the same
+criminal or case document by ``custom_id``/``case_id`` over and over.
+``RecordCache`` keeps recently used documents in an LRU bounded by
+``max_entries``, each for at most ``ttl`` seconds.
+
+Writes made through the repositories invalidate their entry directly, and
+the change feed invalidates entries for writes it sees. Every write also
+increments the document's ``version`` field, so a cached document older than
+``revalidate_after`` seconds is checked against a projected read of just that
+field before being served: a write by another client is caught by one small
+query instead of re-reading the document.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+VERSION_FIELD = "version"
+RECORD_CACHE_SIZE = 2000
+RECORD_TTL = 300  # seconds
+REVALIDATE_AFTER = 5  # seconds a cached document is served without checking its version
+
+
+class RecordCache:
+    def __init__(self, collection, key, max_entries=RECORD_CACHE_SIZE, ttl=RECORD_TTL,
+                 revalidate_after=REVALIDATE_AFTER):
+        self.collection = collection
+        self.key = key
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.revalidate_after = revalidate_after
+        self._entries = OrderedDict()  # key value -> {"doc", "loaded_at", "checked_at"}
+        self._keys_by_id = {}  # str(_id) -> key value, for deletes reported by _id only
+        # key value -> {token of each load in progress: True once a write may have made it stale}
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.stale = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, value):
+        """The document whose key is ``value``, or None; callers get their own copy."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(value)
+            if entry is not None and now - entry["loaded_at"] >= self.ttl:
+                self._forget(value)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(value)
+                if now - entry["checked_at"] < self.revalidate_after:
+                    self.hits += 1
+                    return dict(entry["doc"])
+
+        if entry is not None:
+            current = self.collection.find_one({self.key: value}, {VERSION_FIELD: 1})
+            with self._lock:
+                if (current is not None and current["_id"] == entry["doc"]["_id"]
+                        and current.get(VERSION_FIELD) == entry["doc"].get(VERSION_FIELD)):
+                    self.revalidations += 1
+                    entry["checked_at"] = now
+                    return dict(entry["doc"])
+                self.stale += 1
+                if self._entries.get(value) is entry:
+                    self._forget(value)
+
+        # Each load has its own token, so a concurrent load of the same key cannot clear this one's stale mark
+        token = object()
+        with self._lock:
+            self.misses += 1
+            self._loading.setdefault(value, {})[token] = False
+        try:
+            doc = self.collection.find_one({self.key: value})
+        except BaseException:
+            with self._lock:
+                self._finish_load(value, token)
+            raise
+        with self._lock:
+            # A write seen while loading may already have made this document out of date
+            if not self._finish_load(value, token) and doc is not None:
+                self._remember(value, doc, now)
+        return dict(doc) if doc is not None else None
+
+    def prime(self, docs):
+        """Cache documents read by another query, such as a search page.
+
+        They were not read under the write guard ``get`` uses, so each one is
+        version-checked the first time it is served.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for doc in docs:
+                value = doc.get(self.key)
+                if value is None or value in self._entries or value in self._loading:
+                    continue
+                self._remember(value, doc, now)
+                self._entries[value]["checked_at"] = float("-inf")
+
+    def invalidate(self, value=None):
+        """Drop the entry for ``value``, or every entry."""
+        with self._lock:
+            values = list(self._entries) if value is None else [value]
+            self._mark_stale(list(self._loading) if value is None else values)
+            for cached in values:
+                if cached in self._entries:
+                    self.invalidations += 1
+                    self._forget(cached)
+
+    def on_change(self, event):
+        """Change feed subscriber (see ``changes.ChangeFeed``)."""
+        if event["op"] == "reset":
+            self.invalidate()
+            return
+        doc = event["doc"] or {}
+        with self._lock:
+            values = {doc.get(self.key), self._keys_by_id.get(event["id"])} - {None}
+            if not values:
+                # A document that is not cached may still be the one being loaded
+                self._mark_stale(list(self._loading))
+        for value in values:
+            self.invalidate(value)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "revalidations": self.revalidations, "stale": self.stale,
+                    "evictions": self.evictions, "invalidations": self.invalidations}
+
+    def _mark_stale(self, values):
+        for value in values:
+            loads = self._loading.get(value, {})
+            for token in loads:
+                loads[token] = True
+
+    def _finish_load(self, value, token):
+        """Stop tracking a load; returns whether a write may have made it stale."""
+        loads = self._loading.get(value, {})
+        stale = loads.pop(token, True)
+        if not loads:
+            self._loading.pop(value, None)
+        return stale
+
+    def _remember(self, value, doc, now):
+        self._forget(value)
+        self._entries[value] = {"doc": doc, "loaded_at": now, "checked_at": now}
+        self._keys_by_id[str(doc["_id"])] = value
+        while len(self._entries) > self.max_entries:
+            self.evictions += 1
+            self._forget(next(iter(self._entries)))
+
+    def _forget(self, value):
+        entry = self._entries.pop(value, None)
+        if entry is not None:
+            self._keys_by_id.pop(str(entry["doc"]["_id"]), None)
@@ -0,0 +1,150 @@
+"""Change notifications that keep open views in step with the database.
+
+``ChangeFeed`` delivers ``{"seq", "collection", "op", "id", "doc"}`` events
+(``op`` is insert, update or delete; ``doc`` is the document after the change,
+None for deletes) to subscribers. Against a replica set the events come from a
+MongoDB change stream, so writes by every client are seen. On a standalone
+server, where change streams are not available, the repositories' own write
+handlers feed it instead.
+
+The feed keeps a short history so the HTTP front end can serve it to remote
+clients by long polling (``since``); a client that falls further behind than
+the history receives a single ``reset`` event and reloads.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+WATCHED_COLLECTIONS = ("criminals", "cases", "victims_witnesses", "evidence", "officer_assignments")
+HISTORY_SIZE = 1000
+LONG_POLL_SECONDS = 25
+RETRY_SECONDS = 5
+# Server error codes meaning change streams are not supported by this deployment
+UNSUPPORTED_CODES = {40573, 40324}
+STREAM_OPERATIONS = {"insert": "insert", "update": "update", "replace": "update", "delete": "delete"}
+
+
+class ChangeBus:
+    """Subscriber registry shared by the local feed and the remote client."""
+
+    def __init__(self):
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+
+    def subscribe(self, collections, callback):
+        """Call ``callback(event)`` for changes to ``collections``; returns an unsubscribe function.
+
+        Callbacks run on the thread that delivers the event, not the Tk thread.
+        """
+        entry = (frozenset(collections), callback)
+        with self._subscribers_lock:
+            self._subscribers.append(entry)
+        self.start()
+
+        def unsubscribe():
+            with self._subscribers_lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+
+        return unsubscribe
+
+    def start(self):
+        pass
+
+    def _dispatch(self, event):
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for collections, callback in subscribers:
+            # Resets go to everyone: any view may have missed changes
+            if event["op"] == "reset" or event["collection"] in collections:
+                try:
+                    callback(event)
+                except Exception:
+                    logger.exception("Change subscriber failed")
+
+
+class ChangeFeed(ChangeBus):
+    def __init__(self, db, collections=WATCHED_COLLECTIONS, history=HISTORY_SIZE, stream=True):
+        super().__init__()
+        self.db = db
+        self.collections = tuple(collections)
+        # Without stream only the write handlers feed it, e.g. for databases with no watch() at all
+        self.stream = stream
+        self.streaming = False
+        self._events = deque(maxlen=history)
+        self._seq = 0
+        self._condition = threading.Condition()
+        self._watcher = None
+
+    def start(self):
+        """Start following the change stream, if there is one (idempotent)."""
+        with self._condition:
+            if self._watcher is not None or not self.stream:
+                return
+            self._watcher = threading.Thread(target=self._watch, name="change-stream", daemon=True)
+        self._watcher.start()
+
+    def record(self, collection, op, doc_id, doc=None):
+        """Called by write handlers; ignored while the change stream reports the same writes."""
+        if not self.streaming:
+            self._publish(collection, op, doc_id, doc)
+
+    def since(self, seq=None, timeout=LONG_POLL_SECONDS):
+        """Events after ``seq``, waiting up to ``timeout`` seconds for one: ``{"seq", "events"}``.
+
+        With ``seq`` None this returns the current position without events.
+        """
+        with self._condition:
+            if seq is None:
+                return {"seq": self._seq, "events": []}
+            self._condition.wait_for(lambda: self._seq != seq, timeout)
+            events = [event for event in self._events if event["seq"] > seq]
+            # Behind the history, or ahead of it because this process restarted: start over
+            if self._seq != seq and (not events or events[0]["seq"] != seq + 1):
+                events = [{"seq": self._seq, "collection": None, "op": "reset", "id": None, "doc": None}]
+            return {"seq": self._seq, "events": events}
+
+    def _publish(self, collection, op, doc_id, doc):
+        with self._condition:
+            self._seq += 1
+            event = {"seq": self._seq, "collection": collection, "op": op,
+                     "id": str(doc_id) if doc_id is not None else None, "doc": doc}
+            self._events.append(event)
+            self._condition.notify_all()
+        self._dispatch(event)
+
+    def _watch(self):
+        pipeline = [{"$match": {"ns.coll": {"$in": list(self.collections)},
+                                "operationType": {"$in": list(STREAM_OPERATIONS)}}}]
+        resume_token = None
+        lost = False
+        while True:
+            try:
+                with self.db.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                    self.streaming = True
+                    if lost:
+                        # Changes made while the stream was down cannot be replayed
+                        self._publish(None, "reset", None, None)
+                        lost = False
+                    logger.info("Following the change stream for %s", ", ".join(self.collections))
+                    for change in stream:
+                        resume_token = stream.resume_token
+                        self._publish(change["ns"]["coll"], STREAM_OPERATIONS[change["operationType"]],
+                                      change["documentKey"]["_id"], change.get("fullDocument"))
+            except OperationFailure as e:
+                self.streaming = False
+                if e.code in UNSUPPORTED_CODES:
+                    logger.info("Change streams unavailable (%s); using in-process notifications", e)
+                    return
+                logger.warning("Change stream failed: %s", e)
+                resume_token = None
+                lost = True
+            except PyMongoError as e:
+                self.streaming = False
+                logger.warning("Change stream interrupted, retrying: %s", e)
+            time.sleep(RETRY_SECONDS)
@@ -0,0 +1,344 @@
+"""Columnar snapshots of criminals, cases and assignments for vectorised analysis.
+
+Usage:
+    python columnar.py            # bring the snapshots up to date
+    python columnar.py --full     # rebuild them from scratch
+
+Each collection is exported to one ``.npy`` file per column under the
+snapshot directory. Text fields such as ``crime`` and ``status`` are stored as
+int32 codes into shared dictionaries, ``age`` is parsed once into an int16
+(-1 when it is not a number or does not fit), and every row keeps the creation
+time taken from its ObjectId. Files are memory-mapped when loaded, so opening a
+snapshot costs nothing until a column is used.
+
+Refreshes are incremental: only documents with an ``_id`` greater than the
+last one exported are read and appended. If the collection's document count
+no longer matches afterwards (deletes, or inserts from another client that
+sorted below the last ``_id``), that table is rebuilt in full. In-place
+updates are only picked up by a full rebuild.
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+from bson.objectid import ObjectId
+
+from connection import open_database
+from stats import AGE_BANDS, UNKNOWN
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "crime_analysis", "snapshots")
+MANIFEST = "manifest.json"
+DICTIONARIES = "dictionaries.json"
+READ_BATCH_SIZE = 10_000
+
+CATEGORY, AGE, CLOSED, CREATED = "category", "age", "closed", "created"
+
+# table: [(column, kind, source field, dictionary)]; the table name is also the collection name
+TABLES = {
+    "criminals": [
+        ("crime", CATEGORY, "crime", "crime"),
+        ("status", CATEGORY, "status", "criminal_status"),
+        ("gender", CATEGORY, "gender", "gender"),
+        ("age", AGE, "age", None),
+        ("created", CREATED, "_id", None),
+    ],
+    "cases": [
+        ("case_id", CATEGORY, "case_id", "case_id"),
+        ("status", CATEGORY, "status", "case_status"),
+        ("closed", CLOSED, "status", None),
+        ("officer", CATEGORY, "officer", "officer_id"),
+        ("created", CREATED, "_id", None),
+    ],
+    "officer_assignments": [
+        ("case_id", CATEGORY, "case_id", "case_id"),
+        ("officer_id", CATEGORY, "officer_id", "officer_id"),
+        ("created", CREATED, "_id", None),
+    ],
+}
+DTYPES = {CATEGORY: np.int32, AGE: np.int16, CLOSED: np.bool_, CREATED: np.int64}
+AGE_RANGE = np.iinfo(DTYPES[AGE])
+AGE_BAND = "age_band"
+AGE_BAND_LABELS = [label for _, _, label in AGE_BANDS] + [UNKNOWN]
+
+
+def snapshot_dir():
+    return os.environ.get("CRIME_SNAPSHOT_DIR", DEFAULT_SNAPSHOT_DIR)
+
+
+def _parse_age(value):
+    try:
+        age = int(str(value).strip())
+    except ValueError:
+        return -1
+    # Age is free text on the form; anything an int16 cannot hold would abort the whole export
+    return age if AGE_RANGE.min <= age <= AGE_RANGE.max else -1
+
+
+def _write_json(path, value):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class Dictionaries:
+    """Shared value -> code mappings; codes never change once assigned."""
+
+    def __init__(self, values=None):
+        self.values = {name: list(items) for name, items in (values or {}).items()}
+        self._codes = {name: {value: code for code, value in enumerate(items)}
+                       for name, items in self.values.items()}
+
+    def encode(self, name, value):
+        value = "" if value is None else str(value).strip()
+        codes = self._codes.setdefault(name, {})
+        code = codes.get(value)
+        if code is None:
+            items = self.values.setdefault(name, [])
+            code = codes[value] = len(items)
+            items.append(value)
+        return code
+
+    def code(self, name, value):
+        return self._codes.get(name, {}).get(str(value).strip(), -1)
+
+
+def _append_column(path, rows, new):
+    """Write ``path`` as its first ``rows`` values followed by ``new``."""
+    old = np.load(path, mmap_mode="r")[:rows] if rows and os.path.exists(path) else np.empty(0, new.dtype)
+    tmp_path = f"{path}.tmp.npy"
+    out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=new.dtype, shape=(len(old) + len(new),))
+    out[:len(old)] = old
+    out[len(old):] = new
+    out.flush()
+    del out, old
+    os.replace(tmp_path, path)
+
+
+def _export_table(db, table, dictionaries, after=None):
+    """Read documents past ``after`` and return ``(columns, count, last_id)``."""
+    spec = TABLES[table]
+    projection = {field: 1 for _, _, field, _ in spec}
+    query = {"_id": {"$gt": ObjectId(after)}} if after else {}
+    cursor = db[table].find(query, projection).sort("_id", 1).batch_size(READ_BATCH_SIZE)
+    values = {column: [] for column, _, _, _ in spec}
+    last_id = after
+    for doc in cursor:
+        for column, kind, field, dictionary in spec:
+            if kind == CATEGORY:
+                value = dictionaries.encode(dictionary, doc.get(field))
+            elif kind == AGE:
+                value = _parse_age(doc.get(field))
+            elif kind == CLOSED:
+                value = str(doc.get(field) or "").strip().lower() == "closed"
+            else:
+                value = int(doc["_id"].generation_time.timestamp())
+            values[column].append(value)
+        last_id = str(doc["_id"])
+    count = len(values[spec[0][0]])
+    columns = {column: np.asarray(values[column], dtype=DTYPES[kind]) for column, kind, _, _ in spec}
+    return columns, count, last_id
+
+
+def refresh_snapshots(db, directory=None, full=False):
+    """Bring every table's snapshot up to date; returns ``{table: rows}``."""
+    directory = directory or snapshot_dir()
+    manifest = {} if full else _read_json(os.path.join(directory, MANIFEST), {})
+    dictionaries = Dictionaries(None if full else _read_json(os.path.join(directory, DICTIONARIES), {}))
+
+    for table in TABLES:
+        table_dir = os.path.join(directory, table)
+        os.makedirs(table_dir, exist_ok=True)
+        entry = manifest.get(table, {"rows": 0, "last_id": None})
+        expected = db[table].estimated_document_count()
+
+        columns, count, last_id = _export_table(db, table, dictionaries, entry["last_id"])
+        if entry["rows"] + count != expected and entry["rows"]:
+            logger.info("Snapshot of %s is out of step with the collection; rebuilding it", table)
+            entry = {"rows": 0, "last_id": None}
+            columns, count, last_id = _export_table(db, table, dictionaries)
+        if count or not entry["rows"]:
+            for column, array in columns.items():
+                _append_column(os.path.join(table_dir, f"{column}.npy"), entry["rows"], array)
+        manifest[table] = {"rows": entry["rows"] + count, "last_id": last_id}
+        logger.info("Snapshot of %s: %d rows (%d new)", table, manifest[table]["rows"], count)
+
+    # Readers trust only the row counts in the manifest, so it is written last
+    _write_json(os.path.join(directory, DICTIONARIES), dictionaries.values)
+    _write_json(os.path.join(directory, MANIFEST), manifest)
+    return {table: entry["rows"] for table, entry in manifest.items()}
+
+
+class Snapshot:
+    """Memory-mapped columns of every table, as recorded in the manifest."""
+
+    def __init__(self, directory=None):
+        directory = directory or snapshot_dir()
+        self.manifest = _read_json(os.path.join(directory, MANIFEST), {})
+        self.dictionaries = Dictionaries(_read_json(os.path.join(directory, DICTIONARIES), {}))
+        self.tables = {}
+        for table, spec in TABLES.items():
+            rows = self.manifest.get(table, {}).get("rows", 0)
+            self.tables[table] = {}
+            for column, kind, _, _ in spec:
+                path = os.path.join(directory, table, f"{column}.npy")
+                self.tables[table][column] = (np.load(path, mmap_mode="r")[:rows] if rows
+                                              else np.empty(0, DTYPES[kind]))
+
+    def column(self, table, column):
+        if column == AGE_BAND:
+            return self._age_bands(self.tables[table]["age"])
+        return self.tables[table][column]
+
+    @staticmethod
+    def _age_bands(ages):
+        # Codes index AGE_BAND_LABELS; ages outside every band (or unparsed) fall into Unknown
+        bands = np.full(len(ages), len(AGE_BANDS), dtype=np.int32)
+        for code, (low, high, _) in enumerate(AGE_BANDS):
+            bands[(ages >= low) & (ages <= high)] = code
+        return bands
+
+    def labels(self, table, column):
+        if column == AGE_BAND:
+            return AGE_BAND_LABELS
+        dictionary = next(d for name, kind, _, d in TABLES[table] if name == column and kind == CATEGORY)
+        return self.dictionaries.values.get(dictionary, [])
+
+    def _encode(self, table, column, value):
+        if column == AGE_BAND:
+            return AGE_BAND_LABELS.index(value) if value in AGE_BAND_LABELS else -1
+        for name, kind, _, dictionary in TABLES[table]:
+            if name == column and kind == CATEGORY:
+                return self.dictionaries.code(dictionary, value)
+        return value
+
+    def mask(self, table, where=None):
+        """Boolean row mask for ``{column: value or [values]}`` filters."""
+        rows = self.manifest.get(table, {}).get("rows", 0)
+        mask = np.ones(rows, dtype=bool)
+        for column, wanted in (where or {}).items():
+            wanted = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            codes = [self._encode(table, column, value) for value in wanted]
+            mask &= np.isin(self.column(table, column), codes)
+        return mask
+
+
+class Analytics:
+    """Vectorised group-bys and filters over a ``Snapshot``; results are plain Python values."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def group_count(self, table, column, where=None):
+        """``{value: count}`` for a categorical column (or ``age_band``)."""
+        codes = self.snapshot.column(table, column)[self.snapshot.mask(table, where)]
+        labels = self.snapshot.labels(table, column)
+        counts = np.bincount(codes, minlength=len(labels))
+        return {labels[code]: int(count) for code, count in enumerate(counts) if count}
+
+    def crosstab(self, table, row, column, where=None):
+        """Co-occurrence counts of two categorical columns, e.g. crime by age band."""
+        mask = self.snapshot.mask(table, where)
+        row_codes = self.snapshot.column(table, row)[mask].astype(np.int64)
+        column_codes = self.snapshot.column(table, column)[mask].astype(np.int64)
+        row_labels = self.snapshot.labels(table, row)
+        column_labels = self.snapshot.labels(table, column)
+        width = len(column_labels)
+        counts = np.bincount(row_codes * width + column_codes, minlength=len(row_labels) * width)
+        counts = counts.reshape(len(row_labels), width)
+        used_rows, used_columns = counts.any(axis=1), counts.any(axis=0)
+        return {
+            "rows": [label for label, used in zip(row_labels, used_rows) if used],
+            "columns": [label for label, used in zip(column_labels, used_columns) if used],
+            "counts": counts[used_rows][:, used_columns].tolist(),
+        }
+
+    def age_distribution(self, bins=10, where=None):
+        ages = self.snapshot.column("criminals", "age")[self.snapshot.mask("criminals", where)]
+        ages = ages[ages >= 0]
+        if not len(ages):
+            return {"count": 0, "edges": [], "counts": []}
+        counts, edges = np.histogram(ages, bins=bins)
+        return {
+            "count": int(len(ages)),
+            "mean": float(ages.mean()),
+            "median": float(np.median(ages)),
+            "edges": edges.tolist(),
+            "counts": counts.tolist(),
+        }
+
+    def officer_case_ratios(self, period="M"):
+        """Per period (``M`` month, ``W`` week, ``D`` day): new cases, assignments and cases per officer."""
+        unit = f"datetime64[{period}]"
+        cases = self.snapshot.column("cases", "created").astype("datetime64[s]").astype(unit)
+        assigned = self.snapshot.column("officer_assignments", "created").astype("datetime64[s]").astype(unit)
+        officers = self.snapshot.column("officer_assignments", "officer_id").astype(np.int64)
+
+        periods = np.union1d(cases, assigned)
+        new_cases = np.bincount(np.searchsorted(periods, cases), minlength=len(periods))
+        period_index = np.searchsorted(periods, assigned)
+        assignments = np.bincount(period_index, minlength=len(periods))
+        # Distinct officers per period: unique (period, officer) pairs, counted by period
+        pairs = np.unique(period_index * (int(officers.max(initial=0)) + 1) + officers)
+        active = np.bincount(pairs // (int(officers.max(initial=0)) + 1), minlength=len(periods))
+        return [{
+            "period": str(periods[i]),
+            "new_cases": int(new_cases[i]),
+            "assignments": int(assignments[i]),
+            "active_officers": int(active[i]),
+            "cases_per_officer": round(float(assignments[i] / active[i]), 2) if active[i] else 0.0,
+        } for i in range(len(periods))]
+
+
+class AnalyticsEngine:
+    """Loads the snapshot lazily and reloads it after each refresh."""
+
+    def __init__(self, db, directory=None):
+        self.db = db
+        self.directory = directory
+        self._analytics = None
+        self._lock = threading.Lock()
+
+    @property
+    def analytics(self):
+        with self._lock:
+            if self._analytics is None:
+                self._analytics = Analytics(Snapshot(self.directory))
+            return self._analytics
+
+    def refresh(self, full=False):
+        with self._lock:
+            rows = refresh_snapshots(self.db, self.directory, full)
+            self._analytics = None
+        return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Refresh the columnar analytics snapshots")
+    parser.add_argument("--full", action="store_true", help="rebuild every table from scratch")
+    parser.add_argument("--dir", help=f"snapshot directory (default $CRIME_SNAPSHOT_DIR or {DEFAULT_SNAPSHOT_DIR})")
+    parser.add_argument("--uri", help="default from the connection settings")
+    parser.add_argument("--database", help="default from the connection settings")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    rows = refresh_snapshots(open_database(uri=args.uri, database=args.database, operation_class="reports"),
+                             args.dir, args.full)
+    for table, count in rows.items():
+        print(f"{table}: {count} rows")
+
+
+if __name__ == "__main__":
+    main()
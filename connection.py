@@ -0,0 +1,192 @@
+"""MongoDB connection settings, per-operation-class options and retries.
+
+Settings start from ``DEFAULT_SETTINGS``, are overridden by a JSON config
+file (``$CRIME_CONFIG``, or ``~/.config/crime_analysis/config.json`` when it
+exists), and then by ``CRIME_<SETTING>`` environment variables, for example
+``CRIME_URI=mongodb://db-host/`` or ``CRIME_MAX_POOL_SIZE=50``. Environment
+values are parsed as JSON where they can be, so numbers, booleans and the
+nested settings can be given that way too.
+
+Operations are grouped into classes, each with its own read preference and
+write concern:
+
+    records   interactive reads and writes of single records
+    reports   heavy report, listing and analysis reads, which may be served by secondaries
+    bulk      imports, backfills, migrations and index rebuilds
+
+Reads are retried with exponential backoff when they fail with a transient
+error (see ``RetryPolicy``). Writes rely on the driver's retryable writes,
+which retry a single statement exactly once without applying it twice.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from pymongo import MongoClient, ReadPreference, WriteConcern
+from pymongo.errors import (AutoReconnect, ConnectionFailure, ExecutionTimeout, NetworkTimeout, PyMongoError,
+                            ServerSelectionTimeoutError, WaitQueueTimeoutError)
+
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = os.path.join(os.path.expanduser("~"), ".config", "crime_analysis", "config.json")
+ENV_PREFIX = "CRIME_"
+OPERATION_CLASSES = ("records", "reports", "bulk")
+
+DEFAULT_SETTINGS = {
+    "uri": "mongodb://localhost:27017/",
+    "database": "crime_analysis",
+    "app_name": "crime_analysis",
+    "max_pool_size": 50,
+    "min_pool_size": 0,
+    "max_idle_time_ms": 300000,
+    "connect_timeout_ms": 5000,
+    "server_selection_timeout_ms": 10000,
+    # Report aggregations and exports can legitimately run for a long time
+    "socket_timeout_ms": 300000,
+    "wait_queue_timeout_ms": 30000,
+    "retry_reads": True,
+    "retry_writes": True,
+    "read_preferences": {"records": "primary", "reports": "secondaryPreferred", "bulk": "primary"},
+    "write_concerns": {"records": {"w": "majority", "wtimeout": 10000}, "reports": {}, "bulk": {"w": 1}},
+    "retry": {"attempts": 3, "backoff_ms": 200, "max_backoff_ms": 3000},
+    # Shared secret that clients of server.py must send; required to serve beyond localhost
+    "server_token": None,
+}
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+# Error labels the server attaches to errors that are safe to retry
+TRANSIENT_LABELS = ("RetryableWriteError", "TransientTransactionError")
+
+
+def _env_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _merge(settings, overrides):
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(settings.get(key), dict):
+            settings[key] = {**settings[key], **value}
+        else:
+            settings[key] = value
+
+
+def load_settings(path=None, environ=None):
+    """Connection settings from the defaults, the config file and the environment."""
+    environ = os.environ if environ is None else environ
+    settings = json.loads(json.dumps(DEFAULT_SETTINGS))
+    path = path or environ.get(f"{ENV_PREFIX}CONFIG")
+    if path or os.path.exists(CONFIG_PATH):
+        with open(path or CONFIG_PATH, encoding="utf-8") as f:
+            _merge(settings, json.load(f))
+    _merge(settings, {key: _env_value(environ[f"{ENV_PREFIX}{key.upper()}"])
+                      for key in DEFAULT_SETTINGS if f"{ENV_PREFIX}{key.upper()}" in environ})
+    for operation_class in OPERATION_CLASSES:
+        if settings["read_preferences"].get(operation_class, "primary") not in READ_PREFERENCES:
+            raise ValueError(f"Unknown read preference for {operation_class}: "
+                             f"{settings['read_preferences'][operation_class]}")
+    # An all-digit token given in the environment parses as a number
+    if settings["server_token"] is not None:
+        settings["server_token"] = str(settings["server_token"])
+    return settings
+
+
+def client_options(settings):
+    """``MongoClient`` keyword arguments for ``settings``."""
+    return {
+        "appname": settings["app_name"],
+        "maxPoolSize": settings["max_pool_size"],
+        "minPoolSize": settings["min_pool_size"],
+        "maxIdleTimeMS": settings["max_idle_time_ms"],
+        "connectTimeoutMS": settings["connect_timeout_ms"],
+        "serverSelectionTimeoutMS": settings["server_selection_timeout_ms"],
+        "socketTimeoutMS": settings["socket_timeout_ms"],
+        "waitQueueTimeoutMS": settings["wait_queue_timeout_ms"],
+        "retryReads": settings["retry_reads"],
+        "retryWrites": settings["retry_writes"],
+    }
+
+
+def database_for(db, settings, operation_class):
+    """``db`` with the read preference and write concern of ``operation_class``."""
+    write_concern = settings["write_concerns"].get(operation_class)
+    return db.with_options(
+        read_preference=READ_PREFERENCES[settings["read_preferences"].get(operation_class, "primary")],
+        write_concern=WriteConcern(**write_concern) if write_concern else None)
+
+
+def open_database(settings=None, uri=None, database=None, operation_class="records", **options):
+    """Connect with ``settings`` (loaded if not given); ``options`` go to ``MongoClient`` as-is."""
+    settings = settings or load_settings()
+    client = MongoClient(uri or settings["uri"], **{**client_options(settings), **options})
+    return database_for(client[database or settings["database"]], settings, operation_class)
+
+
+def is_transient(error):
+    """Whether ``error`` may well succeed if the operation is simply tried again."""
+    # Server selection already waited out its own timeout; retrying would only multiply the wait
+    if isinstance(error, ServerSelectionTimeoutError):
+        return False
+    if isinstance(error, (AutoReconnect, WaitQueueTimeoutError)):
+        return True
+    return isinstance(error, PyMongoError) and any(error.has_error_label(label) for label in TRANSIENT_LABELS)
+
+
+def describe_error(error):
+    """A one-line message for ``error`` fit for a dialog; driver messages can run to pages."""
+    if isinstance(error, WaitQueueTimeoutError):
+        return "All database connections are busy. Try again shortly."
+    if isinstance(error, (NetworkTimeout, ExecutionTimeout)):
+        return "The database did not answer in time. Try again shortly."
+    if isinstance(error, ConnectionFailure):
+        return "The database could not be reached. Check the connection and try again."
+    return str(error)
+
+
+class RetryPolicy:
+    """Calls an operation, retrying transient failures with jittered exponential backoff."""
+
+    def __init__(self, attempts=3, backoff_ms=200, max_backoff_ms=3000):
+        self.attempts = max(1, attempts)
+        self.backoff_ms = backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self._local = threading.local()
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(**settings["retry"])
+
+    def call(self, operation, *args, **kwargs):
+        # Operations nested in a retried one are not retried again, or attempts would multiply
+        if getattr(self._local, "active", False):
+            return operation(*args, **kwargs)
+        self._local.active = True
+        try:
+            for attempt in range(1, self.attempts + 1):
+                try:
+                    return operation(*args, **kwargs)
+                except PyMongoError as e:
+                    if attempt == self.attempts or not is_transient(e):
+                        raise
+                    delay_ms = min(self.max_backoff_ms, self.backoff_ms * 2 ** (attempt - 1))
+                    delay_ms *= random.uniform(0.5, 1.0)
+                    metrics.record_retry()
+                    logger.warning("%s failed (%s), retrying in %.0fms", getattr(operation, "__qualname__", operation),
+                                   e, delay_ms)
+                    time.sleep(delay_ms / 1000)
+        finally:
+            self._local.active = False
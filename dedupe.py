@@ -0,0 +1,295 @@
+"""Deduplicating the files already stored in GridFS.
+
+Uploads are deduplicated by content as they arrive (see ``uploads``), but
+files stored before that, or before they were hashed at all, can hold the
+same CCTV export or photo many times over. ``dedupe_files``:
+
+1. hashes every stored file without a ``metadata.sha256``, streaming
+   ``workers`` of them at a time;
+2. groups the files by hash and length, and for each group points every
+   record at the oldest copy, keeps one thumbnail sidecar for it and deletes
+   the other copies, merging ``workers`` groups at a time;
+3. recounts each file's references (``uploads.REFS_FIELD``) from the records.
+
+Finally it builds the unique content index (``schema.enforce_unique_content``),
+which migration 9 could not while duplicates remained.
+
+It streams every unhashed file, so it is a maintenance step run by hand
+(``python dedupe.py``, or ``storage.deduplicate`` through the server), not at
+startup. Records saved while their file's group is being merged can be left
+pointing at a removed copy, so run it when few uploads are in progress. Only
+one run at a time is allowed across all workstations: a run holds a lease
+document in ``maintenance_locks``, renewed while it works, and another run
+refuses to start until the lease is released or has expired.
+
+Usage:
+    python dedupe.py
+"""
+import argparse
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from bson.objectid import ObjectId
+from gridfs import GridFSBucket
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from orphans import CONTENT_REFERENCES, THUMBNAIL_REFERENCES, reference_counts
+from paging import fetch_page
+from schema import enforce_unique_content
+from uploads import DEFAULT_CHUNK_SIZE, REFS_FIELD
+
+logger = logging.getLogger(__name__)
+
+DEDUPE_WORKERS = 8
+DEDUPE_BATCH_SIZE = 1000
+# Thumbnail sidecars are never hashed or merged themselves; they follow their original
+ORIGINALS_QUERY = {"thumbnail_of": {"$exists": False}}
+LOCKS_COLLECTION = "maintenance_locks"
+LEASE_SECONDS = 600  # a run that stops renewing its lease for this long is presumed dead
+
+
+class LeaseHeld(Exception):
+    pass
+
+
+class Lease:
+    """Exclusive claim on a maintenance job across processes, renewed on a daemon thread while held."""
+
+    def __init__(self, db, name, seconds=LEASE_SECONDS):
+        self.collection = db[LOCKS_COLLECTION]
+        self.name = name
+        self.seconds = seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{ObjectId()}"
+        self.lost = False
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _expiry(self):
+        return datetime.now(timezone.utc) + timedelta(seconds=self.seconds)
+
+    def acquire(self):
+        """Take the lease if it is free or its holder stopped renewing it; returns whether it was taken."""
+        try:
+            self.collection.insert_one({"_id": self.name, "owner": self.owner, "expires_at": self._expiry()})
+            return True
+        except DuplicateKeyError:
+            taken = self.collection.find_one_and_update(
+                {"_id": self.name, "expires_at": {"$lt": datetime.now(timezone.utc)}},
+                {"$set": {"owner": self.owner, "expires_at": self._expiry()}})
+            return taken is not None
+
+    def check(self):
+        if self.lost:
+            raise LeaseHeld(f"The {self.name} lease was taken over by another run")
+
+    def _renew(self):
+        while not self._stopped.wait(self.seconds / 3):
+            try:
+                renewed = self.collection.update_one({"_id": self.name, "owner": self.owner},
+                                                     {"$set": {"expires_at": self._expiry()}})
+            except PyMongoError as e:
+                logger.warning("Could not renew the %s lease: %s", self.name, e)
+                continue
+            if not renewed.matched_count:
+                self.lost = True
+                return
+
+    def __enter__(self):
+        if not self.acquire():
+            holder = self.collection.find_one({"_id": self.name}) or {}
+            raise LeaseHeld(f"{self.name} is already running ({holder.get('owner')}, "
+                            f"lease until {holder.get('expires_at')})")
+        self._thread = threading.Thread(target=self._renew, name=f"{self.name}-lease", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self.collection.delete_one({"_id": self.name, "owner": self.owner})
+
+
+def _hash_file(bucket, file_id):
+    sha256 = hashlib.sha256()
+    grid_out = bucket.open_download_stream(file_id)
+    try:
+        for chunk in iter(lambda: grid_out.read(DEFAULT_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    finally:
+        grid_out.close()
+    return sha256.hexdigest()
+
+
+def _merge(db, canonical, duplicates):
+    """Point the references to ``duplicates`` at ``canonical`` and delete them; returns what that saved."""
+    fs_files = db["fs.files"]
+    ids = [file["_id"] for file in duplicates]
+    sidecars = list(fs_files.find({"thumbnail_of": {"$in": [canonical] + ids}}, {"thumbnail_of": 1, "length": 1})
+                    .sort("_id", 1))
+    kept = next((sidecar for sidecar in sidecars if sidecar["thumbnail_of"] == canonical),
+                sidecars[0] if sidecars else None)
+    extra = [sidecar for sidecar in sidecars if sidecar is not kept]
+
+    # The files documents go first, so no upload can take a reference to a copy that is going
+    fs_files.delete_many({"_id": {"$in": ids + [sidecar["_id"] for sidecar in extra]}})
+    moved = 0
+    for collection, field in CONTENT_REFERENCES:
+        moved += db[collection].update_many({field: {"$in": ids}}, {"$set": {field: canonical}}).modified_count
+    if kept is not None:
+        if kept["thumbnail_of"] != canonical:
+            fs_files.update_one({"_id": kept["_id"]}, {"$set": {"thumbnail_of": canonical}})
+        for collection, field in THUMBNAIL_REFERENCES:
+            db[collection].update_many({field: {"$in": [sidecar["_id"] for sidecar in extra]}},
+                                       {"$set": {field: kept["_id"]}})
+    db["fs.chunks"].delete_many({"files_id": {"$in": ids + [sidecar["_id"] for sidecar in extra]}})
+    return {"removed": len(ids), "moved": moved,
+            "bytes": sum(file.get("length", 0) for file in duplicates + extra)}
+
+
+def hash_files(db, report, workers=DEDUPE_WORKERS, batch_size=DEDUPE_BATCH_SIZE, check=None):
+    """Hash the stored files that have no content hash yet, in parallel."""
+    bucket = GridFSBucket(db)
+    fs_files = db["fs.files"]
+    query = {"metadata.sha256": {"$exists": False}, **ORIGINALS_QUERY}
+
+    def compute(file):
+        try:
+            return file, _hash_file(bucket, file["_id"])
+        except Exception as e:
+            logger.warning("Could not hash file %s: %s", file["_id"], e)
+            return file, None
+
+    after = None
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dedupe-hash") as pool:
+        while True:
+            if check:
+                check()
+            page, after = fetch_page(fs_files, "_id", after=after, limit=batch_size, query=query,
+                                     projection={"length": 1})
+            for file, sha256 in pool.map(compute, page):
+                if sha256 is None:
+                    report["hash_failures"] += 1
+                    continue
+                report["files_hashed"] += 1
+                report["bytes_hashed"] += file.get("length", 0)
+                try:
+                    fs_files.update_one({"_id": file["_id"]}, {"$set": {"metadata.sha256": sha256}})
+                except DuplicateKeyError:
+                    # The unique content index is already built: fold this copy into the stored one
+                    stored = fs_files.find_one({"metadata.sha256": sha256, "length": file.get("length")}, {"_id": 1})
+                    _count_merge(report, _merge(db, stored["_id"], [file]))
+            if after is None:
+                break
+    logger.info("Hashed %d stored files (%d failed)", report["files_hashed"], report["hash_failures"])
+
+
+def _count_merge(report, merged):
+    report["duplicates_removed"] += merged["removed"]
+    report["references_moved"] += merged["moved"]
+    report["bytes_saved"] += merged["bytes"]
+
+
+def merge_duplicates(db, report, workers=DEDUPE_WORKERS, batch_size=DEDUPE_BATCH_SIZE, check=None):
+    """Merge every group of stored files with the same content into its oldest copy, in parallel."""
+    groups = db["fs.files"].aggregate([
+        {"$match": {"metadata.sha256": {"$exists": True}, **ORIGINALS_QUERY}},
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": {"sha256": "$metadata.sha256", "length": "$length"},
+                    "files": {"$push": {"_id": "$_id", "length": "$length"}}}},
+        {"$match": {"files.1": {"$exists": True}}},
+    ], allowDiskUse=True, batchSize=batch_size)
+
+    def merge(group):
+        canonical, *duplicates = group["files"]
+        return _merge(db, canonical["_id"], duplicates)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dedupe-merge") as pool:
+        batch = []
+        for group in groups:
+            batch.append(group)
+            if len(batch) >= batch_size:
+                _merge_batch(pool, merge, batch, report, check)
+                batch = []
+        if batch:
+            _merge_batch(pool, merge, batch, report, check)
+    logger.info("Merged %d sets of duplicate files", report["duplicate_sets"])
+
+
+def _merge_batch(pool, merge, batch, report, check):
+    if check:
+        check()
+    for merged in pool.map(merge, batch):
+        report["duplicate_sets"] += 1
+        _count_merge(report, merged)
+
+
+def recount_references(db, report, batch_size=DEDUPE_BATCH_SIZE, check=None):
+    """Set every stored file's reference count from the records referring to it."""
+    fs_files = db["fs.files"]
+    after = None
+    while True:
+        if check:
+            check()
+        page, after = fetch_page(fs_files, "_id", after=after, limit=batch_size, query=ORIGINALS_QUERY,
+                                 projection={REFS_FIELD: 1})
+        counts = reference_counts(db, [file["_id"] for file in page]) if page else {}
+        # Only counts that have not changed since they were read, so a reference taken meanwhile is not lost
+        updates = [UpdateOne({"_id": file["_id"], REFS_FIELD: (file.get("metadata") or {}).get("refs")},
+                             {"$set": {REFS_FIELD: counts.get(file["_id"], 0)}})
+                   for file in page if (file.get("metadata") or {}).get("refs") != counts.get(file["_id"], 0)]
+        if updates:
+            report["files_recounted"] += fs_files.bulk_write(updates, ordered=False).modified_count
+        if after is None:
+            break
+
+
+def dedupe_files(db, workers=DEDUPE_WORKERS, batch_size=DEDUPE_BATCH_SIZE, check=None):
+    """Hash, merge and recount the stored files; returns a report of the work and the space saved.
+
+    Raises ``LeaseHeld`` if another run is in progress.
+    """
+    started = time.perf_counter()
+    report = {"files_hashed": 0, "bytes_hashed": 0, "hash_failures": 0, "duplicate_sets": 0,
+              "duplicates_removed": 0, "references_moved": 0, "bytes_saved": 0, "files_recounted": 0}
+    with Lease(db, "dedupe") as lease:
+        def checked():
+            # Stop between batches if the lease was lost, so two runs never merge the same groups
+            lease.check()
+            if check:
+                check()
+
+        hash_files(db, report, workers, batch_size, checked)
+        merge_duplicates(db, report, workers, batch_size, checked)
+        recount_references(db, report, batch_size, checked)
+        report["unique_index"] = enforce_unique_content(db)
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    report["mb_saved"] = round(report["bytes_saved"] / 2 ** 20, 1)
+    logger.info("Deduplicated stored files: %s", report)
+    return report
+
+
+def main(argv=None):
+    from services import CrimeService
+
+    parser = argparse.ArgumentParser(description="Merge the GridFS files that hold the same content")
+    parser.add_argument("--workers", type=int, default=DEDUPE_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=DEDUPE_BATCH_SIZE)
+    parser.add_argument("--uri", help="default from the connection settings")
+    parser.add_argument("--database", help="default from the connection settings")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    service = CrimeService.connect(args.uri, args.database)
+    report = service.storage.deduplicate(args.workers, args.batch_size)
+    for key, value in report.items():
+        print(f"{key:<24}{value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""Case dossiers: a case with its evidence, assignments and related people.
+
+A dossier is built by one aggregation on ``cases``. Its ``$lookup`` stages
+pull in the case's evidence (file metadata is stored on it), its officer
+assignments, and the criminals and victims/witnesses whose ``crime`` is
+mentioned in the case description. Every lookup is keyed by a literal
+``case_id`` or crime list, so each one is answered from an index.
+
+Built dossiers are cached. ``DossierCache`` follows the change feed and drops
+only the dossiers that a write can affect: the case's own records, plus any
+dossier mentioning a changed person's crime. Writes the feed cannot see, such
+as bulk imports, age out after ``DOSSIER_TTL`` seconds.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import json_util
+
+from instrumentation import current_handler, tagged
+from reports import CASE_FIELDS, CLOSED_CASES_QUERY, CRIMINAL_FIELDS, PdfWriter, format_record
+
+DOSSIER_CACHE_SIZE = 500
+DOSSIER_TTL = 300  # seconds
+RELATED_LIMIT = 50  # criminals and victims/witnesses listed per dossier
+CRIMES_TTL = 60  # seconds before the list of known crimes is re-read
+EXPORT_WORKERS = 8
+EXPORT_FORMATS = ("txt", "pdf", "json")
+OPEN_CASES_QUERY = {"status": {"$nin": CLOSED_CASES_QUERY["status"]["$in"]}}
+DOSSIER_COLLECTIONS = ("cases", "evidence", "officer_assignments", "criminals", "victims_witnesses")
+
+EVIDENCE_FIELDS = [("Type", "type"), ("Description", "description"), ("File", "file_name")]
+ASSIGNMENT_FIELDS = [("Officer ID", "officer_id")]
+VICTIM_WITNESS_FIELDS = [("Name", "name"), ("Role", "role"), ("Crime", "crime"), ("Statement", "statement")]
+
+
+def crimes_mentioned(text, crimes):
+    """The known crime names that appear as words in ``text``."""
+    text = str(text or "")
+    return sorted(crime for crime in crimes
+                  if crime and re.search(rf"\b{re.escape(crime)}\b", text, re.IGNORECASE))
+
+
+def _related(collection, crimes, sort_key):
+    # No crimes means no related records; an empty $in would still scan the index
+    match = {"crime": {"$in": crimes}} if crimes else {"_id": None}
+    return {"$lookup": {"from": collection, "as": collection, "pipeline": [
+        {"$match": match},
+        {"$sort": {sort_key: 1}},
+        {"$limit": RELATED_LIMIT},
+        {"$project": {"name_terms": 0}},
+    ]}}
+
+
+def dossier_pipeline(case_id, crimes):
+    """Aggregation on ``cases`` returning the dossier for ``case_id``."""
+    return [
+        {"$match": {"case_id": case_id}},
+        {"$lookup": {"from": "evidence", "as": "evidence", "pipeline": [
+            {"$match": {"case_id": case_id}},
+        ]}},
+        {"$lookup": {"from": "officer_assignments", "as": "assignments", "pipeline": [
+            {"$match": {"case_id": case_id}},
+            {"$sort": {"officer_id": 1}},
+        ]}},
+        _related("criminals", crimes, "custom_id"),
+        _related("victims_witnesses", crimes, "name"),
+    ]
+
+
+class DossierBuilder:
+    def __init__(self, db, get_case=None):
+        self.db = db
+        # Reads the case by case_id, e.g. through the cases repository's record cache
+        self.get_case = get_case or (lambda case_id: db["cases"].find_one({"case_id": case_id}, {"description": 1}))
+        self._crimes = None
+        self._crimes_at = 0
+
+    def known_crimes(self):
+        # Answered from the crime indexes; small, so kept for a minute
+        if self._crimes is None or time.monotonic() - self._crimes_at > CRIMES_TTL:
+            crimes = set(self.db["criminals"].distinct("crime")) | set(self.db["victims_witnesses"].distinct("crime"))
+            self._crimes = sorted(str(crime) for crime in crimes if crime)
+            self._crimes_at = time.monotonic()
+        return self._crimes
+
+    def build(self, case_id):
+        """Return the dossier for ``case_id``, or None if there is no such case."""
+        case = self.get_case(case_id)
+        if case is None:
+            return None
+        crimes = crimes_mentioned(case.get("description"), self.known_crimes())
+        for dossier in self.db["cases"].aggregate(dossier_pipeline(case_id, crimes)):
+            dossier["crimes"] = crimes
+            # Officers on the case record and on assignments, without repeats
+            officers = [dossier.get("officer")] + [a.get("officer_id") for a in dossier["assignments"]]
+            dossier["officers"] = list(dict.fromkeys(officer for officer in officers if officer))
+            dossier["built_at"] = time.time()
+            return dossier
+        return None
+
+
+class DossierCache:
+    """LRU cache of built dossiers, invalidated from the change feed."""
+
+    def __init__(self, builder, changes=None, max_entries=DOSSIER_CACHE_SIZE, ttl=DOSSIER_TTL):
+        self.builder = builder
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._cases_by_record = {}  # str(_id) of an embedded record -> case_ids
+        self._cases_by_crime = {}  # lower-cased crime -> case_ids
+        self._building = {}  # case_id -> False, or True once a write may have made the build stale
+        self._lock = threading.Lock()
+        if changes is not None:
+            changes.subscribe(DOSSIER_COLLECTIONS, self._on_change)
+
+    def get(self, case_id):
+        with self._lock:
+            entry = self._entries.get(case_id)
+            if entry is not None and time.time() - entry["built_at"] < self.ttl:
+                self._entries.move_to_end(case_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            self._building[case_id] = False
+        try:
+            dossier = self.builder.build(case_id)
+        except BaseException:
+            with self._lock:
+                self._building.pop(case_id, None)
+            raise
+        with self._lock:
+            # A write seen while building may already have made this dossier out of date
+            if not self._building.pop(case_id, True) and dossier is not None:
+                self._forget(case_id)
+                self._remember(case_id, dossier)
+        return dossier
+
+    def invalidate(self, case_ids=None):
+        """Drop the given dossiers, or all of them."""
+        with self._lock:
+            for case_id in list(self._building) if case_ids is None else case_ids:
+                if case_id in self._building:
+                    self._building[case_id] = True
+            for case_id in list(self._entries) if case_ids is None else case_ids:
+                self._forget(case_id)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _remember(self, case_id, dossier):
+        self._entries[case_id] = dossier
+        for key in ("evidence", "assignments", "criminals", "victims_witnesses"):
+            for record in dossier[key]:
+                self._cases_by_record.setdefault(str(record["_id"]), set()).add(case_id)
+        self._cases_by_record.setdefault(str(dossier["_id"]), set()).add(case_id)
+        for crime in dossier["crimes"]:
+            self._cases_by_crime.setdefault(crime.lower(), set()).add(case_id)
+        while len(self._entries) > self.max_entries:
+            self._forget(next(iter(self._entries)))
+
+    def _forget(self, case_id):
+        dossier = self._entries.pop(case_id, None)
+        if dossier is None:
+            return
+        for key in ("evidence", "assignments", "criminals", "victims_witnesses"):
+            for record in dossier[key]:
+                self._discard(self._cases_by_record, str(record["_id"]), case_id)
+        self._discard(self._cases_by_record, str(dossier["_id"]), case_id)
+        for crime in dossier["crimes"]:
+            self._discard(self._cases_by_crime, crime.lower(), case_id)
+
+    @staticmethod
+    def _discard(index, key, case_id):
+        cases = index.get(key)
+        if cases is not None:
+            cases.discard(case_id)
+            if not cases:
+                del index[key]
+
+    def _on_change(self, event):
+        if event["op"] == "reset":
+            self.invalidate()
+            return
+        doc = event["doc"] or {}
+        with self._lock:
+            affected = set(self._cases_by_record.get(event["id"], ()))
+            if doc.get("case_id"):
+                affected.add(doc["case_id"])
+            if doc.get("crime") and event["collection"] in ("criminals", "victims_witnesses"):
+                affected |= self._cases_by_crime.get(str(doc["crime"]).lower(), set())
+            # Builds in flight have no index entries yet, so judge them more coarsely
+            unknown = not doc or event["collection"] in ("criminals", "victims_witnesses")
+            for case_id in self._building:
+                if unknown or case_id in affected:
+                    self._building[case_id] = True
+            for case_id in affected:
+                self._forget(case_id)
+
+
+def format_dossier(dossier):
+    """Plain-text rendering of a dossier, shared by the text and PDF exports."""
+    sections = [
+        ("Evidence", dossier["evidence"], EVIDENCE_FIELDS),
+        ("Officer assignments", dossier["assignments"], ASSIGNMENT_FIELDS),
+        ("Related criminals", dossier["criminals"], CRIMINAL_FIELDS),
+        ("Related victims/witnesses", dossier["victims_witnesses"], VICTIM_WITNESS_FIELDS),
+    ]
+    text = f"Case Dossier {dossier['case_id']}\n" + format_record(dossier, CASE_FIELDS)
+    # Spelling variants such as "Theft" and "theft" are all matched but listed once
+    crimes = {}
+    for crime in dossier["crimes"]:
+        crimes.setdefault(crime.lower(), crime)
+    text += f"Crimes mentioned: {', '.join(crimes.values()) or 'None'}\n"
+    for title, records, fields in sections:
+        text += f"\n{title} ({len(records)}):\n"
+        for record in records:
+            text += "".join(f"  {line}\n" for line in format_record(record, fields).splitlines()) + "\n"
+    return text
+
+
+def export_dossiers(service, path, fmt="txt", workers=EXPORT_WORKERS, progress=None, check=None):
+    """Build the dossier of every open case in parallel and write them to ``path``.
+
+    Works with a local or remote service; returns the number written. Dossiers
+    are built ``workers`` at a time and written in case_id order as they finish.
+    """
+    case_ids = service.dossiers.open_cases()
+    handler = current_handler()
+
+    def build(case_id):
+        # Pool threads report their queries under the caller's handler
+        with tagged(handler):
+            return service.dossiers.get(case_id)
+
+    part_path = f"{path}.part"
+    mode = {"mode": "wb"} if fmt == "pdf" else {"mode": "w", "encoding": "utf-8"}
+    written = 0
+    try:
+        with open(part_path, **mode) as f, ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dossier") as pool:
+            pdf = PdfWriter(f) if fmt == "pdf" else None
+            # Submit a bounded window ahead of the writer so memory stays flat
+            pending = [pool.submit(build, case_id) for case_id in case_ids[:workers * 2]]
+            next_index = len(pending)
+            while pending:
+                dossier = pending.pop(0).result()
+                if next_index < len(case_ids):
+                    pending.append(pool.submit(build, case_ids[next_index]))
+                    next_index += 1
+                if check:
+                    check()
+                if dossier is not None:
+                    if fmt == "json":
+                        f.write(json_util.dumps(dossier) + "\n")
+                    elif pdf is not None:
+                        for line in format_dossier(dossier).splitlines() + [""]:
+                            pdf.add_line(line)
+                    else:
+                        f.write(format_dossier(dossier) + "\n")
+                    written += 1
+                if progress:
+                    progress(written, len(case_ids))
+            if pdf is not None:
+                pdf.close()
+        os.replace(part_path, path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return written
@@ -0,0 +1,251 @@
+"""Headless bulk importer for criminals, cases, victims/witnesses and evidence.
+
+Usage:
+    python importer.py criminals legacy_criminals.csv --batch-size 5000
+    python importer.py cases cases.jsonl --resume
+
+Rows are streamed from CSV or JSONL, validated against the same fields the
+entry forms collect, and written with unordered ``insert_many`` in batches.
+Progress is checkpointed after every batch so an interrupted import can be
+resumed with ``--resume``; rows that fail validation or collide with an
+existing unique ID are written to a ``.rejects.jsonl`` file next to the input.
+Each row's ``_id`` is derived from the input file and its line number, so a
+batch the server applied before the import was interrupted, but after its
+last checkpoint, is recognised and skipped when it is replayed; such rows are
+reported as ``replayed``, not inserted.
+
+The importer runs in its own process, so it has no in-process change feed to
+notify: against a replica set open views see the imported records through the
+change stream, and on a standalone server they show them once reloaded.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import time
+
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
+
+from cache import VERSION_FIELD
+from connection import open_database
+from search import with_name_terms
+from stats import CASES_SUMMARY, CRIMINALS_SUMMARY, case_delta, criminal_delta, record_inserts
+
+logger = logging.getLogger("importer")
+
+DEFAULT_BATCH_SIZE = 5000
+DUPLICATE_KEY = 11000
+
+# collection: (fields collected by the entry form, required fields, unique field)
+IMPORT_SPECS = {
+    "criminals": (["custom_id", "name", "age", "gender", "crime", "status"], ["custom_id", "name"], "custom_id"),
+    "cases": (["case_id", "description", "status", "officer"], ["case_id"], "case_id"),
+    "victims_witnesses": (["name", "age", "gender", "crime", "role", "statement"], ["name"], None),
+    "evidence": (["type", "description", "case_id"], ["case_id"], None),
+}
+NAME_INDEXED = {"criminals", "victims_witnesses"}
+# Collections whose records carry a version for the record caches (see cache.RecordCache)
+VERSIONED = {"criminals", "cases"}
+# collection: (dashboard summary, counter delta) for collections the statistics cover
+STATS_SUMMARIES = {"criminals": (CRIMINALS_SUMMARY, criminal_delta), "cases": (CASES_SUMMARY, case_delta)}
+
+
+def read_rows(path):
+    """Yield ``(line_number, row)`` from a CSV or JSONL file."""
+    if path.endswith(".jsonl") or path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            for number, line in enumerate(f, start=1):
+                if line.strip():
+                    try:
+                        yield number, json.loads(line)
+                    except ValueError as e:
+                        yield number, e
+    else:
+        with open(path, encoding="utf-8", newline="") as f:
+            for number, row in enumerate(csv.DictReader(f), start=2):
+                yield number, row
+
+
+def validate(row, fields, required):
+    """Return ``(record, None)`` or ``(None, reason)``."""
+    if isinstance(row, Exception):
+        return None, f"unparseable row: {row}"
+    if not isinstance(row, dict):
+        return None, "row is not an object"
+    record = {}
+    for field in fields:
+        value = row.get(field)
+        record[field] = "" if value is None else str(value).strip()
+    missing = [field for field in required if not record[field]]
+    if missing:
+        return None, f"missing required field(s): {', '.join(missing)}"
+    return record, None
+
+
+def source_key(path):
+    """Identifies one version of an input file, for ``row_id``."""
+    stat = os.stat(path)
+    return f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def row_id(source, line):
+    """Deterministic ``_id`` for the row at ``line`` of ``source``."""
+    return ObjectId(hashlib.sha256(f"{source}:{line}".encode("utf-8")).digest()[:12])
+
+
+class Checkpoint:
+    def __init__(self, path):
+        self.path = path
+        self.state = {"line": 0, "inserted": 0, "rejected": 0, "replayed": 0}
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.state = {**self.state, **json.load(f)}
+        return self.state
+
+    def save(self, line, inserted, rejected, replayed):
+        self.state = {"line": line, "inserted": inserted, "rejected": rejected, "replayed": replayed}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Importer:
+    def __init__(self, db, collection_name, batch_size=DEFAULT_BATCH_SIZE):
+        self.db = db
+        self.collection = db[collection_name]
+        self.collection_name = collection_name
+        self.fields, self.required, self.unique = IMPORT_SPECS[collection_name]
+        self.batch_size = batch_size
+        self.source = None
+        self.replayed = 0
+
+    def _existing_ids(self, records):
+        ids = [record[self.unique] for record in records]
+        cursor = self.collection.find({self.unique: {"$in": ids}}, {self.unique: 1, "_id": 0})
+        return {doc[self.unique] for doc in cursor}
+
+    def _write_batch(self, batch, reject):
+        """Insert a batch of ``(line, record)``; returns the number inserted, not counting replayed rows."""
+        for line, record in batch:
+            record["_id"] = row_id(self.source, line)
+        # Rows already written by an attempt that failed before its checkpoint was saved
+        applied = set(self.collection.distinct("_id", {"_id": {"$in": [record["_id"] for _, record in batch]}}))
+        if applied:
+            self.replayed += len(applied)
+            batch = [(line, record) for line, record in batch if record["_id"] not in applied]
+        if self.unique:
+            # One $in query per batch for uniqueness, plus duplicates within the batch itself
+            existing = self._existing_ids([record for _, record in batch])
+            accepted = []
+            for line, record in batch:
+                key = record[self.unique]
+                if key in existing:
+                    record.pop("_id", None)
+                    reject(line, record, f"duplicate {self.unique} '{key}'")
+                else:
+                    existing.add(key)
+                    accepted.append((line, record))
+            batch = accepted
+        if not batch:
+            return 0
+
+        docs = [with_name_terms(record) if self.collection_name in NAME_INDEXED else record
+                for _, record in batch]
+        if self.collection_name in VERSIONED:
+            for doc in docs:
+                doc[VERSION_FIELD] = 1
+        try:
+            inserted = len(self.collection.insert_many(docs, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            # A concurrent writer (or a resumed partial batch) can still hit the unique index
+            failed = set()
+            for error in e.details.get("writeErrors", []):
+                failed.add(error["index"])
+                line, record = batch[error["index"]]
+                record.pop("_id", None)
+                reason = "duplicate key" if error["code"] == DUPLICATE_KEY else error.get("errmsg")
+                reject(line, record, reason)
+            docs = [doc for index, doc in enumerate(docs) if index not in failed]
+            inserted = e.details.get("nInserted", 0)
+        if self.collection_name in STATS_SUMMARIES:
+            summary, delta_for = STATS_SUMMARIES[self.collection_name]
+            record_inserts(self.db, summary, delta_for, docs)
+        return inserted
+
+    def run(self, path, resume=False):
+        checkpoint = Checkpoint(f"{path}.checkpoint")
+        self.source = source_key(path)
+        state = checkpoint.load() if resume else dict(checkpoint.state)
+        inserted, rejected = state["inserted"], state["rejected"]
+        self.replayed = state["replayed"]
+        start_line = state["line"]
+        started = time.perf_counter()
+        session_rows = 0
+
+        with open(f"{path}.rejects.jsonl", "a" if resume else "w", encoding="utf-8") as rejects:
+            def reject(line, row, reason):
+                nonlocal rejected
+                rejected += 1
+                rejects.write(json.dumps({"line": line, "reason": reason, "row": row}, default=str) + "\n")
+
+            batch = []
+            last_line = start_line
+            for line, row in read_rows(path):
+                if line <= start_line:
+                    continue
+                last_line = line
+                session_rows += 1
+                record, reason = validate(row, self.fields, self.required)
+                if reason:
+                    reject(line, row if isinstance(row, dict) else None, reason)
+                else:
+                    batch.append((line, record))
+                if len(batch) >= self.batch_size:
+                    inserted += self._write_batch(batch, reject)
+                    batch = []
+                    rejects.flush()
+                    checkpoint.save(last_line, inserted, rejected, self.replayed)
+                    elapsed = time.perf_counter() - started
+                    logger.info("%s: %d inserted, %d replayed, %d rejected (%.0f rows/s)",
+                                self.collection_name, inserted, self.replayed, rejected,
+                                session_rows / max(elapsed, 1e-9))
+            if batch:
+                inserted += self._write_batch(batch, reject)
+
+        elapsed = time.perf_counter() - started
+        checkpoint.clear()
+        logger.info("%s import finished: %d inserted, %d replayed, %d rejected in %.1fs (%.0f rows/s)",
+                    self.collection_name, inserted, self.replayed, rejected, elapsed,
+                    session_rows / max(elapsed, 1e-9))
+        return {"inserted": inserted, "replayed": self.replayed, "rejected": rejected, "seconds": elapsed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import records into the crime_analysis database")
+    parser.add_argument("collection", choices=sorted(IMPORT_SPECS))
+    parser.add_argument("path", help="CSV file with a header row, or JSONL file")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint")
+    parser.add_argument("--uri", help="default from the connection settings")
+    parser.add_argument("--database", help="default from the connection settings")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    db = open_database(uri=args.uri, database=args.database, operation_class="bulk")
+    result = Importer(db, args.collection, args.batch_size).run(args.path, args.resume)
+    print(f"Inserted {result['inserted']}, already imported {result['replayed']}, "
+          f"rejected {result['rejected']} in {result['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
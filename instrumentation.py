@@ -0,0 +1,337 @@
+"""Per-handler query metrics collected from pymongo command monitoring.
+
+``QueryMetrics`` is a ``CommandListener``; pass it to ``MongoClient`` through
+``event_listeners``. Every command is attributed to the handler active on the
+issuing thread: TaskRunner tags each task with its name (``view_criminals``,
+``generate_officer_report``...), and code outside a task can use ``tagged``.
+Metrics can be read as a snapshot, or exported as JSON or Prometheus text;
+caches registered with ``register_cache`` report their counters alongside, and
+``PoolMetrics`` (``metrics.pools``, a ``ConnectionPoolListener``) reports how
+busy each connection pool is.
+"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import bson
+from pymongo import monitoring
+
+UNTAGGED = "untagged"
+SLOW_COMMAND_MS = 100
+SLOW_LOG_SIZE = 50
+GRIDFS_CHUNKS = "fs.chunks"
+
+_local = threading.local()
+
+
+def current_handler():
+    return getattr(_local, "handler", None) or UNTAGGED
+
+
+@contextmanager
+def tagged(handler):
+    """Attribute commands issued by this thread inside the block to ``handler``."""
+    previous = getattr(_local, "handler", None)
+    _local.handler = handler or previous
+    try:
+        yield
+    finally:
+        _local.handler = previous
+
+
+def _reply_documents(reply):
+    cursor = reply.get("cursor")
+    if cursor:
+        return cursor.get("firstBatch") or cursor.get("nextBatch") or []
+    return []
+
+
+class HandlerStats:
+    def __init__(self):
+        self.commands = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.bytes_returned = 0
+        self.documents_returned = 0
+        self.chunk_reads = 0
+        self.retries = 0
+        self.by_command = {}
+
+    def to_dict(self):
+        return {
+            "commands": self.commands,
+            "failures": self.failures,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.commands, 3) if self.commands else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "bytes_returned": self.bytes_returned,
+            "documents_returned": self.documents_returned,
+            "chunk_reads": self.chunk_reads,
+            "retries": self.retries,
+            "by_command": dict(self.by_command),
+        }
+
+
+class PoolStats:
+    def __init__(self):
+        self.open = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.clears = 0
+
+    def reset_counters(self):
+        # open and in_use are current levels, not counters
+        self.max_in_use = self.in_use
+        self.checkouts = self.checkout_failures = self.clears = 0
+        self.wait_ms = self.max_wait_ms = 0.0
+
+    def to_dict(self):
+        return {
+            "open": self.open,
+            "in_use": self.in_use,
+            "max_in_use": self.max_in_use,
+            "checkouts": self.checkouts,
+            "checkout_failures": self.checkout_failures,
+            "wait_ms": round(self.wait_ms, 3),
+            "mean_wait_ms": round(self.wait_ms / self.checkouts, 3) if self.checkouts else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 3),
+            "clears": self.clears,
+        }
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool usage per server: open and in-use connections, checkout waits."""
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, event):
+        return self._pools.setdefault("%s:%s" % event.address, PoolStats())
+
+    def pool_created(self, event):
+        with self._lock:
+            self._stats(event)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._stats(event).clears += 1
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop("%s:%s" % event.address, None)
+
+    def connection_created(self, event):
+        with self._lock:
+            self._stats(event).open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            stats = self._stats(event)
+            stats.open = max(0, stats.open - 1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            stats = self._stats(event)
+            stats.checkout_failures += 1
+            stats.wait_ms += getattr(event, "duration", 0) * 1000
+
+    def connection_checked_out(self, event):
+        # duration is the time spent waiting for the connection (pymongo 4.7+)
+        wait_ms = getattr(event, "duration", 0) * 1000
+        with self._lock:
+            stats = self._stats(event)
+            stats.checkouts += 1
+            stats.in_use += 1
+            stats.max_in_use = max(stats.max_in_use, stats.in_use)
+            stats.wait_ms += wait_ms
+            stats.max_wait_ms = max(stats.max_wait_ms, wait_ms)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            stats = self._stats(event)
+            stats.in_use = max(0, stats.in_use - 1)
+
+    def reset(self):
+        with self._lock:
+            for stats in self._pools.values():
+                stats.reset_counters()
+
+    def snapshot(self):
+        with self._lock:
+            return {address: stats.to_dict() for address, stats in self._pools.items()}
+
+
+class QueryMetrics(monitoring.CommandListener):
+    def __init__(self, slow_ms=SLOW_COMMAND_MS, measure_bytes=True):
+        self.slow_ms = slow_ms
+        self.measure_bytes = measure_bytes
+        self.pools = PoolMetrics()
+        self.started_at = time.time()
+        self._handlers = {}
+        self._pending = {}
+        self._slow = deque(maxlen=SLOW_LOG_SIZE)
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def record_retry(self):
+        """Count a retried operation against the handler active on this thread."""
+        with self._lock:
+            self._handlers.setdefault(current_handler(), HandlerStats()).retries += 1
+
+    def register_cache(self, name, cache):
+        """Report ``cache.stats()`` under ``name``; ``reset`` calls ``cache.reset_counters()``."""
+        with self._lock:
+            self._caches[name] = cache
+
+    # CommandListener: started runs on the thread that issued the command, so the tag is read here
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        namespace = f"{event.database_name}.{collection}" if isinstance(collection, str) else event.database_name
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (current_handler(), namespace)
+
+    def succeeded(self, event):
+        self._record(event, event.reply)
+
+    def failed(self, event):
+        self._record(event, None)
+
+    def _record(self, event, reply):
+        duration_ms = event.duration_micros / 1000
+        documents = _reply_documents(reply) if reply else []
+        size = len(bson.encode(reply)) if reply and self.measure_bytes else 0
+        with self._lock:
+            handler, namespace = self._pending.pop((event.connection_id, event.request_id),
+                                                   (UNTAGGED, event.database_name))
+            stats = self._handlers.setdefault(handler, HandlerStats())
+            stats.commands += 1
+            stats.total_ms += duration_ms
+            stats.max_ms = max(stats.max_ms, duration_ms)
+            stats.bytes_returned += size
+            stats.documents_returned += len(documents)
+            stats.by_command[event.command_name] = stats.by_command.get(event.command_name, 0) + 1
+            if reply is None:
+                stats.failures += 1
+            if namespace.endswith(f".{GRIDFS_CHUNKS}"):
+                stats.chunk_reads += len(documents)
+            if duration_ms >= self.slow_ms:
+                self._slow.append({"handler": handler, "command": event.command_name, "namespace": namespace,
+                                   "ms": round(duration_ms, 3), "at": time.time()})
+
+    def reset(self):
+        with self._lock:
+            self._handlers.clear()
+            self._slow.clear()
+            self.started_at = time.time()
+            caches = list(self._caches.values())
+        for cache in caches:
+            cache.reset_counters()
+        self.pools.reset()
+
+    def snapshot(self):
+        """Return ``{"handlers": {name: stats}, "slow": [...], "caches": {...}, "pools": {...}}``.
+
+        Handlers are listed slowest first.
+        """
+        with self._lock:
+            handlers = sorted(((name, stats.to_dict()) for name, stats in self._handlers.items()),
+                              key=lambda item: item[1]["total_ms"], reverse=True)
+            slow = list(self._slow)
+            caches = dict(self._caches)
+        return {"since": self.started_at, "handlers": dict(handlers), "slow": slow,
+                "caches": {name: cache.stats() for name, cache in caches.items()},
+                "pools": self.pools.snapshot()}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        return format_prometheus(self.snapshot())
+
+
+PROMETHEUS_METRICS = [
+    ("crime_db_commands_total", "counter", "Commands sent to MongoDB", "commands"),
+    ("crime_db_command_failures_total", "counter", "Commands that failed", "failures"),
+    ("crime_db_command_seconds_total", "counter", "Time spent in MongoDB commands", "total_ms"),
+    ("crime_db_command_seconds_max", "gauge", "Slowest single command", "max_ms"),
+    ("crime_db_bytes_returned_total", "counter", "BSON bytes in command replies", "bytes_returned"),
+    ("crime_db_documents_returned_total", "counter", "Documents in cursor batches", "documents_returned"),
+    ("crime_gridfs_chunk_reads_total", "counter", "GridFS chunks read", "chunk_reads"),
+    ("crime_db_retries_total", "counter", "Operations retried after a transient error", "retries"),
+]
+
+PROMETHEUS_POOL_METRICS = [
+    ("crime_pool_connections_open", "gauge", "Connections open in the pool", "open"),
+    ("crime_pool_connections_in_use", "gauge", "Connections checked out of the pool", "in_use"),
+    ("crime_pool_connections_in_use_max", "gauge", "Most connections checked out at once", "max_in_use"),
+    ("crime_pool_checkouts_total", "counter", "Connections checked out", "checkouts"),
+    ("crime_pool_checkout_failures_total", "counter", "Checkouts that failed or timed out", "checkout_failures"),
+    ("crime_pool_checkout_wait_seconds_total", "counter", "Time spent waiting for a connection", "wait_ms"),
+    ("crime_pool_checkout_wait_seconds_max", "gauge", "Longest wait for a connection", "max_wait_ms"),
+    ("crime_pool_clears_total", "counter", "Times the pool was cleared after an error", "clears"),
+]
+
+PROMETHEUS_CACHE_METRICS = [
+    ("crime_cache_hits_total", "counter", "Lookups answered from the cache", "hits"),
+    ("crime_cache_misses_total", "counter", "Lookups read from MongoDB", "misses"),
+    ("crime_cache_revalidations_total", "counter", "Cached records confirmed by a version check", "revalidations"),
+    ("crime_cache_stale_total", "counter", "Cached records found changed by a version check", "stale"),
+    ("crime_cache_evictions_total", "counter", "Records evicted to stay within the size bound", "evictions"),
+    ("crime_cache_invalidations_total", "counter", "Records dropped because they were written", "invalidations"),
+    ("crime_cache_entries", "gauge", "Records held", "entries"),
+]
+
+
+def format_prometheus(snapshot):
+    """Render a ``QueryMetrics.snapshot()`` in the Prometheus text exposition format."""
+    lines = []
+    for metric, kind, description, field in PROMETHEUS_METRICS:
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for handler, stats in snapshot["handlers"].items():
+            value = stats[field] / 1000 if field.endswith("_ms") else stats[field]
+            lines.append(f'{metric}{{handler="{handler}"}} {value:g}')
+    caches = snapshot.get("caches") or {}
+    for metric, kind, description, field in PROMETHEUS_CACHE_METRICS if caches else ():
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for cache, stats in caches.items():
+            lines.append(f'{metric}{{cache="{cache}"}} {stats[field]:g}')
+    pools = snapshot.get("pools") or {}
+    for metric, kind, description, field in PROMETHEUS_POOL_METRICS if pools else ():
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for pool, stats in pools.items():
+            value = stats[field] / 1000 if field.endswith("_ms") else stats[field]
+            lines.append(f'{metric}{{pool="{pool}"}} {value:g}')
+    return "\n".join(lines) + "\n"
+
+
+def export_snapshot(snapshot, path):
+    """Write a snapshot to ``path``: Prometheus text for ``.prom``/``.txt``, JSON otherwise."""
+    text = format_prometheus(snapshot) if path.endswith((".prom", ".txt")) else json.dumps(snapshot, indent=2)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+# Shared by the GUI, server and scripts in this process
+metrics = QueryMetrics()
@@ -1,876 +1,1523 @@
-import tkinter as tk
-from tkinter import messagebox, simpledialog, ttk, filedialog
-from pymongo import MongoClient
-import gridfs
-from bson.objectid import ObjectId
-from datetime import datetime
-from PIL import Image, ImageTk
-import os
-
-client = MongoClient("mongodb://localhost:27017/")
-db = client["crime_analysis"]
-fs = gridfs.GridFS(db)
-criminals = db["criminals"]
-cases = db["cases"]
-
-root = tk.Tk()
-root.title("Crime Analysis System")
-root.geometry("600x400")
-
-def add_criminal():
-    def submit():
-        criminal_id = id_entry.get()
-        # Check if criminal ID already exists
-        if criminals.find_one({"custom_id": criminal_id}):
-            messagebox.showerror("Error", "Criminal ID must be unique.")
-            return
-        
-        data = {
-            "custom_id": criminal_id,
-            "name": name_entry.get(),
-            "age": age_entry.get(),
-            "gender": gender_entry.get(),
-            "crime": crime_entry.get(),
-            "status": status_entry.get()
-        }
-        criminals.insert_one(data)
-        messagebox.showinfo("Success", "Criminal added successfully")
-        window.destroy()
-
-    window = tk.Toplevel(root)
-    window.title("Add Criminal")
-    
-    # Create form fields
-    tk.Label(window, text="Criminal ID*").grid(row=0, column=0)
-    tk.Label(window, text="Name*").grid(row=1, column=0)
-    tk.Label(window, text="Age").grid(row=2, column=0)
-    tk.Label(window, text="Gender").grid(row=3, column=0)
-    tk.Label(window, text="Crime").grid(row=4, column=0)
-    tk.Label(window, text="Status").grid(row=5, column=0)
-
-    id_entry = tk.Entry(window)
-    name_entry = tk.Entry(window)
-    age_entry = tk.Entry(window)
-    gender_entry = ttk.Combobox(window, values=["Male", "Female", "Other"])
-    crime_entry = tk.Entry(window)
-    status_entry = ttk.Combobox(window, values=["Active", "Inactive", "Incarcerated", "Deceased"])
-
-    id_entry.grid(row=0, column=1)
-    name_entry.grid(row=1, column=1)
-    age_entry.grid(row=2, column=1)
-    gender_entry.grid(row=3, column=1)
-    crime_entry.grid(row=4, column=1)
-    status_entry.grid(row=5, column=1)
-
-    tk.Button(window, text="Submit", command=submit).grid(row=6, columnspan=2)
-
-def add_biometric():
-    selected_files = []
-
-    def browse_images():
-        files = filedialog.askopenfilenames(filetypes=[("Image Files", "*.png;*.jpg;*.jpeg")])
-        if files:
-            selected_files.clear()
-            selected_files.extend(files)
-            entry_path.delete(0, tk.END)
-            entry_path.insert(0, "; ".join(os.path.basename(f) for f in selected_files))
-
-    def submit():
-        criminal_id = entry_criminal_id.get().strip()
-        bio_type = entry_type.get()
-
-        if not all([criminal_id, bio_type, selected_files]):
-            messagebox.showwarning("Warning", "Please fill in all fields and select images.")
-            return
-
-        # Check if criminal exists (using custom_id field)
-        criminal = criminals.find_one({"custom_id": criminal_id})
-        if not criminal:
-            messagebox.showerror("Error", f"No criminal found with ID '{criminal_id}'")
-            return
-
-        # Create biometric_data collection if it doesn't exist
-        if "biometric_data" not in db.list_collection_names():
-            db.create_collection("biometric_data")
-
-        # Upload each image
-        for image_path in selected_files:
-            try:
-                with open(image_path, "rb") as f:
-                    file_id = fs.put(f, filename=os.path.basename(image_path), criminal_id=criminal_id)
-                    db["biometric_data"].insert_one({
-                        "criminal_id": criminal_id,
-                        "type": bio_type,
-                        "file_id": file_id,
-                        "timestamp": datetime.now()
-                    })
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to upload {os.path.basename(image_path)}: {str(e)}")
-                return
-
-        messagebox.showinfo("Success", "Biometric data added successfully")
-        add_window.destroy()
-
-    add_window = tk.Toplevel(root)
-    add_window.title("Add Biometric Data")
-
-    tk.Label(add_window, text="Criminal ID*:").grid(row=0, column=0)
-    tk.Label(add_window, text="Biometric Type*:").grid(row=1, column=0)
-    tk.Label(add_window, text="Images*:").grid(row=2, column=0)
-
-    entry_criminal_id = tk.Entry(add_window)
-    entry_type = ttk.Combobox(add_window, values=["Fingerprint", "Face", "DNA", "Other"])
-    entry_path = tk.Entry(add_window, width=40)
-
-    entry_criminal_id.grid(row=0, column=1)
-    entry_type.grid(row=1, column=1)
-    entry_path.grid(row=2, column=1)
-    tk.Button(add_window, text="Browse", command=browse_images).grid(row=2, column=2)
-
-    tk.Button(add_window, text="Submit", command=submit).grid(row=3, columnspan=3, pady=10)
-
-def view_criminals():
-    view_window = tk.Toplevel(root)
-    view_window.title("View Criminals")
-    view_window.geometry("800x600")
-    
-    # Create a canvas and scrollbar for scrollable content
-    canvas = tk.Canvas(view_window)
-    scrollbar = ttk.Scrollbar(view_window, orient="vertical", command=canvas.yview)
-    scrollable_frame = ttk.Frame(canvas)
-    
-    scrollable_frame.bind(
-        "<Configure>",
-        lambda e: canvas.configure(
-            scrollregion=canvas.bbox("all")
-        )
-    )
-    
-    canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-    canvas.configure(yscrollcommand=scrollbar.set)
-    
-    canvas.pack(side="left", fill="both", expand=True)
-    scrollbar.pack(side="right", fill="y")
-    
-    row = 0
-    for criminal in criminals.find():
-        # Create a frame for each criminal
-        criminal_frame = ttk.LabelFrame(scrollable_frame, text=f"Criminal: {criminal.get('name', 'N/A')}")
-        criminal_frame.grid(row=row, column=0, padx=10, pady=5, sticky="ew")
-        
-        # Criminal information
-        info_text = (
-            f"ID: {criminal.get('custom_id', 'N/A')}\n"
-            f"Age: {criminal.get('age', 'N/A')}\n"
-            f"Gender: {criminal.get('gender', 'N/A')}\n"
-            f"Crime: {criminal.get('crime', 'N/A')}\n"
-            f"Status: {criminal.get('status', 'N/A')}"
-        )
-        
-        info_label = ttk.Label(criminal_frame, text=info_text)
-        info_label.grid(row=0, column=0, padx=5, pady=5, sticky="w")
-        
-        # Get biometric images for this criminal
-        bio_images = []
-        if "biometric_data" in db.list_collection_names():
-            bios = db["biometric_data"].find({"criminal_id": criminal.get("custom_id")})
-            
-            col = 1  # Start column for images
-            for bio in bios:
-                try:
-                    file_id = bio.get("file_id")
-                    if file_id:
-                        img_data = fs.get(file_id).read()
-                        
-                        # Create temporary file
-                        temp_filename = f"temp_img_{file_id}.jpg"
-                        with open(temp_filename, "wb") as f:
-                            f.write(img_data)
-                            
-                        # Open and resize image
-                        image = Image.open(temp_filename)
-                        image.thumbnail((150, 150))
-                        photo = ImageTk.PhotoImage(image)
-                        bio_images.append(photo)  # Keep reference
-                        
-                        # Create image label
-                        img_frame = ttk.Frame(criminal_frame)
-                        img_frame.grid(row=0, column=col, padx=5, pady=5)
-                        
-                        img_label = ttk.Label(img_frame, image=photo)
-                        img_label.image = photo  # Keep reference
-                        img_label.pack()
-                        
-                        # Add image info
-                        ttk.Label(img_frame, 
-                                  text=f"Type: {bio.get('type', 'N/A')}",
-                                  font=('Arial', 8)).pack()
-                        
-                        col += 1
-                except Exception as e:
-                    print(f"Error loading image: {e}")
-                    continue
-        
-        row += 1
-    
-    # Add a button to refresh the view
-    refresh_btn = ttk.Button(scrollable_frame, text="Refresh", 
-                            command=lambda: [view_window.destroy(), view_criminals()])
-    refresh_btn.grid(row=row, column=0, pady=10)
-
-
-def update_criminal():
-    custom_id = simpledialog.askstring("Input", "Enter Custom ID of criminal to update")
-    crim = criminals.find_one({"custom_id": custom_id})
-    if not crim:
-        messagebox.showerror("Error", "Criminal not found")
-        return
-
-    def submit():
-        criminals.update_one({"custom_id": custom_id}, {"$set": {
-            "age": age_entry.get(),
-            "gender": gender_entry.get(),
-            "crime": crime_entry.get(),
-            "status": status_entry.get()
-        }})
-        messagebox.showinfo("Success", "Criminal updated successfully")
-        window.destroy()
-
-    window = tk.Toplevel(root)
-    window.title("Update Criminal")
-    tk.Label(window, text="Age").grid(row=0, column=0)
-    tk.Label(window, text="Gender").grid(row=1, column=0)
-    tk.Label(window, text="Crime").grid(row=2, column=0)
-    tk.Label(window, text="Status").grid(row=3, column=0)
-
-    age_entry = tk.Entry(window)
-    gender_entry = tk.Entry(window)
-    crime_entry = tk.Entry(window)
-    status_entry = tk.Entry(window)
-
-    age_entry.insert(0, crim["age"])
-    gender_entry.insert(0, crim["gender"])
-    crime_entry.insert(0, crim["crime"])
-    status_entry.insert(0, crim["status"])
-
-    age_entry.grid(row=0, column=1)
-    gender_entry.grid(row=1, column=1)
-    crime_entry.grid(row=2, column=1)
-    status_entry.grid(row=3, column=1)
-
-    tk.Button(window, text="Submit", command=submit).grid(row=4, columnspan=2)
-
-
-
-def delete_criminal():
-    custom_id = simpledialog.askstring("Input", "Enter Custom ID of criminal to delete")
-    result = criminals.delete_one({"custom_id": custom_id})
-    if result.deleted_count:
-        messagebox.showinfo("Success", "Criminal deleted successfully")
-    else:
-        messagebox.showerror("Error", "Criminal not found")
-
-def search_criminal():
-    name = simpledialog.askstring("Input", "Enter name to search")
-    crim = criminals.find_one({"name": name})
-    if crim:
-        info = f"Name: {crim['name']}\nAge: {crim['age']}\nGender: {crim['gender']}\nCrime: {crim['crime']}\nStatus: {crim['status']}"
-        messagebox.showinfo("Result", info)
-    else:
-        messagebox.showerror("Error", "Criminal not found")
-
-def criminal_menu():
-    window = tk.Toplevel(root)
-    window.title("Criminal Management")
-    options = [
-        ("Add Criminal", add_criminal),
-        ("View Criminals", view_criminals),
-        ("Update Criminal", update_criminal),
-        ("Delete Criminal", delete_criminal),
-        ("Search Criminal", search_criminal),
-        ("Add Biometric", add_biometric)
-    ]
-    for text, cmd in options:
-        tk.Button(window, text=text, width=30, command=cmd).pack(pady=5)
-
-def add_case():
-    def submit():
-        data = {
-            "case_id": case_id_entry.get(),
-            "description": description_entry.get(),
-            "status": status_entry.get(),
-            "officer": officer_entry.get()
-        }
-        cases.insert_one(data)
-        messagebox.showinfo("Success", "Case added successfully")
-        window.destroy()
-
-    window = tk.Toplevel(root)
-    window.title("Add Case")
-    tk.Label(window, text="Case ID").grid(row=0, column=0)
-    tk.Label(window, text="Description").grid(row=1, column=0)
-    tk.Label(window, text="Status").grid(row=2, column=0)
-    tk.Label(window, text="Officer Assigned").grid(row=3, column=0)
-
-    case_id_entry = tk.Entry(window)
-    description_entry = tk.Entry(window)
-    status_entry = tk.Entry(window)
-    officer_entry = tk.Entry(window)
-
-    case_id_entry.grid(row=0, column=1)
-    description_entry.grid(row=1, column=1)
-    status_entry.grid(row=2, column=1)
-    officer_entry.grid(row=3, column=1)
-
-    tk.Button(window, text="Submit", command=submit).grid(row=4, columnspan=2)
-
-def view_cases():
-    window = tk.Toplevel(root)
-    window.title("View Cases")
-    tree = ttk.Treeview(window, columns=("case_id", "description", "status", "officer"), show="headings")
-    for col in tree["columns"]:
-        tree.heading(col, text=col)
-    for case in cases.find():
-        tree.insert("", "end", values=(case["case_id"], case["description"], case["status"], case["officer"]))
-    tree.pack(fill="both", expand=True)
-
-def case_menu():
-    window = tk.Toplevel(root)
-    window.title("Case Management")
-    options = [
-        ("Add Case", add_case),
-        ("View Cases", view_cases)
-    ]
-    for text, cmd in options:
-        tk.Button(window, text=text, width=30, command=cmd).pack(pady=5)
-
-def add_victim_witness():
-    def submit():
-        data = {
-            "name": name_entry.get(),
-            "age": age_entry.get(),
-            "gender": gender_entry.get(),
-            "crime": crime_entry.get(),
-            "role": role_entry.get(),  # Victim or Witness
-            "statement": statement_entry.get()
-        }
-        db["victims_witnesses"].insert_one(data)
-        messagebox.showinfo("Success", "Victim/Witness added successfully")
-        window.destroy()
-
-    window = tk.Toplevel(root)
-    window.title("Add Victim/Witness")
-    tk.Label(window, text="Name").grid(row=0, column=0)
-    tk.Label(window, text="Age").grid(row=1, column=0)
-    tk.Label(window, text="Gender").grid(row=2, column=0)
-    tk.Label(window, text="Crime").grid(row=3, column=0)
-    tk.Label(window, text="Role (Victim/Witness)").grid(row=4, column=0)
-    tk.Label(window, text="Statement").grid(row=5, column=0)
-
-    name_entry = tk.Entry(window)
-    age_entry = tk.Entry(window)
-    gender_entry = tk.Entry(window)
-    crime_entry = tk.Entry(window)
-    role_entry = tk.Entry(window)
-    statement_entry = tk.Entry(window)
-
-    name_entry.grid(row=0, column=1)
-    age_entry.grid(row=1, column=1)
-    gender_entry.grid(row=2, column=1)
-    crime_entry.grid(row=3, column=1)
-    role_entry.grid(row=4, column=1)
-    statement_entry.grid(row=5, column=1)
-
-    tk.Button(window, text="Submit", command=submit).grid(row=6, columnspan=2)
-
-def view_victims_witnesses():
-    window = tk.Toplevel(root)
-    window.title("View Victims/Witnesses")
-    tree = ttk.Treeview(window, columns=("name", "age", "gender", "crime", "role", "statement"), show="headings")
-    for col in tree["columns"]:
-        tree.heading(col, text=col)
-    for vic_wit in db["victims_witnesses"].find():
-        tree.insert("", "end", values=(vic_wit["name"], vic_wit["age"], vic_wit["gender"], vic_wit["crime"], vic_wit["role"], vic_wit["statement"]))
-    tree.pack(fill="both", expand=True)
-
-def update_victim_witness():
-    name = simpledialog.askstring("Input", "Enter name of victim/witness to update")
-    vic_wit = db["victims_witnesses"].find_one({"name": name})
-    if not vic_wit:
-        messagebox.showerror("Error", "Victim/Witness not found")
-        return
-
-    def submit():
-        db["victims_witnesses"].update_one({"name": name}, {"$set": {
-            "age": age_entry.get(),
-            "gender": gender_entry.get(),
-            "crime": crime_entry.get(),
-            "role": role_entry.get(),
-            "statement": statement_entry.get()
-        }})
-        messagebox.showinfo("Success", "Victim/Witness updated successfully")
-        window.destroy()
-
-    window = tk.Toplevel(root)
-    window.title("Update Victim/Witness")
-    tk.Label(window, text="Age").grid(row=0, column=0)
-    tk.Label(window, text="Gender").grid(row=1, column=0)
-    tk.Label(window, text="Crime").grid(row=2, column=0)
-    tk.Label(window, text="Role (Victim/Witness)").grid(row=3, column=0)
-    tk.Label(window, text="Statement").grid(row=4, column=0)
-
-    age_entry = tk.Entry(window)
-    gender_entry = tk.Entry(window)
-    crime_entry = tk.Entry(window)
-    role_entry = tk.Entry(window)
-    statement_entry = tk.Entry(window)
-
-    age_entry.insert(0, vic_wit["age"])
-    gender_entry.insert(0, vic_wit["gender"])
-    crime_entry.insert(0, vic_wit["crime"])
-    role_entry.insert(0, vic_wit["role"])
-    statement_entry.insert(0, vic_wit["statement"])
-
-    age_entry.grid(row=0, column=1)
-    gender_entry.grid(row=1, column=1)
-    crime_entry.grid(row=2, column=1)
-    role_entry.grid(row=3, column=1)
-    statement_entry.grid(row=4, column=1)
-
-    tk.Button(window, text="Submit", command=submit).grid(row=5, columnspan=2)
-
-def delete_victim_witness():
-    name = simpledialog.askstring("Input", "Enter name of victim/witness to delete")
-    result = db["victims_witnesses"].delete_one({"name": name})
-    if result.deleted_count:
-        messagebox.showinfo("Success", "Victim/Witness deleted")
-    else:
-        messagebox.showerror("Error", "Victim/Witness not found")
-
-def search_victim_witness():
-    name = simpledialog.askstring("Input", "Enter name to search")
-    vic_wit = db["victims_witnesses"].find_one({"name": name})
-    if vic_wit:
-        info = f"Name: {vic_wit['name']}\nAge: {vic_wit['age']}\nGender: {vic_wit['gender']}\nCrime: {vic_wit['crime']}\nRole: {vic_wit['role']}\nStatement: {vic_wit['statement']}"
-        messagebox.showinfo("Result", info)
-    else:
-        messagebox.showerror("Error", "Victim/Witness not found")
-
-def victim_witness_menu():
-    window = tk.Toplevel(root)
-    window.title("Victim & Witness Management")
-    options = [
-        ("Add Victim/Witness", add_victim_witness),
-        ("View Victims/Witnesses", view_victims_witnesses),
-        ("Update Victim/Witness", update_victim_witness),
-        ("Delete Victim/Witness", delete_victim_witness),
-        ("Search Victim/Witness", search_victim_witness)
-    ]
-    for text, cmd in options:
-        tk.Button(window, text=text, width=30, command=cmd).pack(pady=5)
-
-fs = gridfs.GridFS(db)
-
-# Function to add evidence
-def add_evidence():
-    def submit():
-        # Collect form data
-        evidence_type = type_entry.get()
-        description = description_entry.get()
-        case_id = case_id_entry.get()
-        
-        # Handle file upload
-        evidence_file = file_entry.get()  # This is just the filename or file path
-        file_data = None
-        if evidence_file:
-            with open(evidence_file, 'rb') as f:
-                file_data = fs.put(f, filename=evidence_file)
-
-        # Create evidence document
-        evidence_data = {
-            "type": evidence_type,
-            "description": description,
-            "case_id": case_id,
-            "file_id": file_data,  # Store file reference
-        }
-        db["evidence"].insert_one(evidence_data)
-        messagebox.showinfo("Success", "Evidence added successfully")
-        window.destroy()
-
-    window = tk.Toplevel(root)
-    window.title("Add Evidence")
-    
-    # Create form fields
-    tk.Label(window, text="Evidence Type").grid(row=0, column=0)
-    tk.Label(window, text="Description").grid(row=1, column=0)
-    tk.Label(window, text="Case ID").grid(row=2, column=0)
-    tk.Label(window, text="File (optional)").grid(row=3, column=0)
-
-    type_entry = tk.Entry(window)
-    description_entry = tk.Entry(window)
-    case_id_entry = tk.Entry(window)
-    file_entry = tk.Entry(window)  # For file input (path)
-
-    type_entry.grid(row=0, column=1)
-    description_entry.grid(row=1, column=1)
-    case_id_entry.grid(row=2, column=1)
-    file_entry.grid(row=3, column=1)
-
-    tk.Button(window, text="Submit", command=submit).grid(row=4, columnspan=2)
-
-# Function to view evidence
-def view_evidence():
-    window = tk.Toplevel(root)
-    window.title("View Evidence")
-    
-    tree = ttk.Treeview(window, columns=("type", "description", "case_id"), show="headings")
-    for col in tree["columns"]:
-        tree.heading(col, text=col)
-    
-    for evidence in db["evidence"].find():
-        # Retrieve file name for display (if present)
-        file_name = "None"
-        if evidence["file_id"]:
-            file_data = fs.get(evidence["file_id"])
-            file_name = file_data.filename
-        
-        tree.insert("", "end", values=(evidence["type"], evidence["description"], evidence["case_id"], file_name))
-    
-    tree.pack(fill="both", expand=True)
-
-# Function to update evidence
-def update_evidence():
-    evidence_id = simpledialog.askstring("Input", "Enter Evidence ID to update")
-    evidence = db["evidence"].find_one({"_id": ObjectId(evidence_id)})
-    
-    if not evidence:
-        messagebox.showerror("Error", "Evidence not found")
-        return
-
-    def submit():
-        updated_data = {
-            "type": type_entry.get(),
-            "description": description_entry.get(),
-            "case_id": case_id_entry.get(),
-        }
-
-        # Handle file update (if provided)
-        new_file = file_entry.get()
-        if new_file:
-            with open(new_file, 'rb') as f:
-                file_data = fs.put(f, filename=new_file)
-            updated_data["file_id"] = file_data
-
-        db["evidence"].update_one({"_id": ObjectId(evidence_id)}, {"$set": updated_data})
-        messagebox.showinfo("Success", "Evidence updated successfully")
-        window.destroy()
-
-    window = tk.Toplevel(root)
-    window.title("Update Evidence")
-    
-    tk.Label(window, text="Evidence Type").grid(row=0, column=0)
-    tk.Label(window, text="Description").grid(row=1, column=0)
-    tk.Label(window, text="Case ID").grid(row=2, column=0)
-    tk.Label(window, text="File (optional)").grid(row=3, column=0)
-
-    type_entry = tk.Entry(window)
-    description_entry = tk.Entry(window)
-    case_id_entry = tk.Entry(window)
-    file_entry = tk.Entry(window)
-
-    type_entry.insert(0, evidence["type"])
-    description_entry.insert(0, evidence["description"])
-    case_id_entry.insert(0, evidence["case_id"])
-
-    type_entry.grid(row=0, column=1)
-    description_entry.grid(row=1, column=1)
-    case_id_entry.grid(row=2, column=1)
-    file_entry.grid(row=3, column=1)
-
-    tk.Button(window, text="Submit", command=submit).grid(row=4, columnspan=2)
-
-# Function to delete evidence
-def delete_evidence():
-    evidence_id = simpledialog.askstring("Input", "Enter Evidence ID to delete")
-    result = db["evidence"].delete_one({"_id": ObjectId(evidence_id)})
-    if result.deleted_count:
-        messagebox.showinfo("Success", "Evidence deleted")
-    else:
-        messagebox.showerror("Error", "Evidence not found")
-
-# Function to search evidence
-def search_evidence():
-    search_term = simpledialog.askstring("Input", "Enter search term (Evidence Type, Case ID, or Description)")
-    evidence_list = db["evidence"].find({
-        "$or": [
-            {"type": {"$regex": search_term, "$options": "i"}},
-            {"case_id": {"$regex": search_term, "$options": "i"}},
-            {"description": {"$regex": search_term, "$options": "i"}},
-        ]
-    })
-    
-    if not evidence_list:
-        messagebox.showerror("Error", "No evidence found")
-        return
-
-    window = tk.Toplevel(root)
-    window.title("Search Results")
-    
-    tree = ttk.Treeview(window, columns=("type", "description", "case_id"), show="headings")
-    for col in tree["columns"]:
-        tree.heading(col, text=col)
-    
-    for evidence in evidence_list:
-        file_name = "None"
-        if evidence["file_id"]:
-            file_data = fs.get(evidence["file_id"])
-            file_name = file_data.filename
-        tree.insert("", "end", values=(evidence["type"], evidence["description"], evidence["case_id"], file_name))
-    
-    tree.pack(fill="both", expand=True)
-
-# Function to open Evidence Management menu
-def evidence_menu():
-    window = tk.Toplevel(root)
-    window.title("Evidence Management")
-    options = [
-        ("Add Evidence", add_evidence),
-        ("View Evidence", view_evidence),
-        ("Update Evidence", update_evidence),
-        ("Delete Evidence", delete_evidence),
-        ("Search Evidence", search_evidence)
-    ]
-    for text, cmd in options:
-        tk.Button(window, text=text, width=30, command=cmd).pack(pady=5)
-
-def assign_officer():
-    def submit():
-        case_id = case_id_entry.get()
-        officer_id = officer_id_entry.get()
-        # Add assignment data to the database
-        assignment_data = {
-            "case_id": case_id,
-            "officer_id": officer_id,
-        }
-        db["officer_assignments"].insert_one(assignment_data)
-        messagebox.showinfo("Success", "Officer assigned successfully")
-        window.destroy()
-
-    window = tk.Toplevel(root)
-    window.title("Assign Officer")
-    
-    # Create form fields
-    tk.Label(window, text="Case ID").grid(row=0, column=0)
-    tk.Label(window, text="Officer ID").grid(row=1, column=0)
-
-    case_id_entry = tk.Entry(window)
-    officer_id_entry = tk.Entry(window)
-
-    case_id_entry.grid(row=0, column=1)
-    officer_id_entry.grid(row=1, column=1)
-
-    tk.Button(window, text="Submit", command=submit).grid(row=2, columnspan=2)
-
-# Function to view officer assignments
-def view_assignments():
-    window = tk.Toplevel(root)
-    window.title("View Officer Assignments")
-    
-    tree = ttk.Treeview(window, columns=("case_id", "officer_id"), show="headings")
-    for col in tree["columns"]:
-        tree.heading(col, text=col)
-    
-    for assignment in db["officer_assignments"].find():
-        tree.insert("", "end", values=(assignment["case_id"], assignment["officer_id"]))
-    
-    tree.pack(fill="both", expand=True)
-
-# Function to update officer assignment
-def update_assignment():
-    assignment_id = simpledialog.askstring("Input", "Enter Assignment ID to update")
-    assignment = db["officer_assignments"].find_one({"_id": ObjectId(assignment_id)})
-    
-    if not assignment:
-        messagebox.showerror("Error", "Assignment not found")
-        return
-
-    def submit():
-        updated_data = {
-            "case_id": case_id_entry.get(),
-            "officer_id": officer_id_entry.get(),
-        }
-
-        db["officer_assignments"].update_one({"_id": ObjectId(assignment_id)}, {"$set": updated_data})
-        messagebox.showinfo("Success", "Assignment updated successfully")
-        window.destroy()
-
-    window = tk.Toplevel(root)
-    window.title("Update Officer Assignment")
-    
-    tk.Label(window, text="Case ID").grid(row=0, column=0)
-    tk.Label(window, text="Officer ID").grid(row=1, column=0)
-
-    case_id_entry = tk.Entry(window)
-    officer_id_entry = tk.Entry(window)
-
-    case_id_entry.insert(0, assignment["case_id"])
-    officer_id_entry.insert(0, assignment["officer_id"])
-
-    case_id_entry.grid(row=0, column=1)
-    officer_id_entry.grid(row=1, column=1)
-
-    tk.Button(window, text="Submit", command=submit).grid(row=2, columnspan=2)
-
-# Function to delete officer assignment
-def delete_assignment():
-    assignment_id = simpledialog.askstring("Input", "Enter Assignment ID to delete")
-    result = db["officer_assignments"].delete_one({"_id": ObjectId(assignment_id)})
-    if result.deleted_count:
-        messagebox.showinfo("Success", "Assignment deleted")
-    else:
-        messagebox.showerror("Error", "Assignment not found")
-
-# Function to search officer assignments
-def search_assignments():
-    search_term = simpledialog.askstring("Input", "Enter search term (Case ID or Officer ID)")
-    assignment_list = db["officer_assignments"].find({
-        "$or": [
-            {"case_id": {"$regex": search_term, "$options": "i"}},
-            {"officer_id": {"$regex": search_term, "$options": "i"}},
-        ]
-    })
-    
-    if not assignment_list:
-        messagebox.showerror("Error", "No assignments found")
-        return
-
-    window = tk.Toplevel(root)
-    window.title("Search Results")
-    
-    tree = ttk.Treeview(window, columns=("case_id", "officer_id"), show="headings")
-    for col in tree["columns"]:
-        tree.heading(col, text=col)
-    
-    for assignment in assignment_list:
-        tree.insert("", "end", values=(assignment["case_id"], assignment["officer_id"]))
-    
-    tree.pack(fill="both", expand=True)
-
-# Function to open Officer Assignment menu
-def officer_assignment_menu():
-    window = tk.Toplevel(root)
-    window.title("Officer Assignment Management")
-    options = [
-        ("Assign Officer", assign_officer),
-        ("View Assignments", view_assignments),
-        ("Update Assignment", update_assignment),
-        ("Delete Assignment", delete_assignment),
-        ("Search Assignments", search_assignments)
-    ]
-    for text, cmd in options:
-        tk.Button(window, text=text, width=30, command=cmd).pack(pady=5)
-
-def generate_criminal_report():
-    criminals_data = list(criminals.find())  # Convert cursor to list
-
-    if not criminals_data:
-        messagebox.showinfo("Report", "No criminals found.")
-        return
-
-    report_text = "Criminal Report:\n\n"
-    for criminal in criminals_data:
-        report_text += f"Custom ID: {criminal['custom_id']}\n"
-        report_text += f"Name: {criminal['name']}\n"
-        report_text += f"Age: {criminal['age']}\n"
-        report_text += f"Gender: {criminal['gender']}\n"
-        report_text += f"Crime: {criminal['crime']}\n"
-        report_text += f"Status: {criminal['status']}\n\n"
-
-    report_window = tk.Toplevel(root)
-    report_window.title("Criminal Report")
-    report_label = tk.Label(report_window, text=report_text, justify="left")
-    report_label.pack(padx=10, pady=10)
-
-def generate_case_report():
-    cases_data = []
-    for case in cases.find():
-        case_data = {
-            "case_id": case["case_id"],
-            "description": case["description"],
-            "status": case["status"],
-            "officer": case["officer"],
-        }
-        cases_data.append(case_data)
-
-    if not cases_data:
-        messagebox.showinfo("Report", "No cases found.")
-        return
-
-    report_text = "Case Report:\n\n"
-    for case in cases_data:
-        report_text += f"Case ID: {case['case_id']}\n"
-        report_text += f"Description: {case['description']}\n"
-        report_text += f"Status: {case['status']}\n"
-        report_text += f"Officer: {case['officer']}\n"
-        report_text += "\n"
-
-    report_window = tk.Toplevel(root)
-    report_window.title("Case Report")
-    report_label = tk.Label(report_window, text=report_text, justify="left")
-    report_label.pack(padx=10, pady=10)
-
-def generate_officer_report():
-    officer_assignments = db["officer_assignments"].find()
-    report_text = "Officer Report:\n\n"
-
-    for assignment in officer_assignments:
-        case = cases.find_one({"case_id": assignment["case_id"]})
-        if case:
-            report_text += f"Officer ID: {assignment['officer_id']}\n"
-            report_text += f"Assigned Case ID: {case['case_id']}\n"
-            report_text += f"Description: {case['description']}\n"
-            report_text += f"Status: {case['status']}\n\n"
-
-    if not report_text.strip():
-        messagebox.showinfo("Report", "No officer assignments found.")
-        return
-
-    report_window = tk.Toplevel(root)
-    report_window.title("Officer Report")
-    report_label = tk.Label(report_window, text=report_text, justify="left")
-    report_label.pack(padx=10, pady=10)
-
-def reports_legal_menu():
-    window = tk.Toplevel(root)
-    window.title("Reports & Legal")
-    options = [
-        ("Generate Criminal Report", generate_criminal_report),
-        ("Generate Case Report", generate_case_report),
-        ("Generate Officer Report", generate_officer_report),
-    ]
-    for text, cmd in options:
-        tk.Button(window, text=text, width=30, command=cmd).pack(pady=5)
-
-def reports_legal_menu():
-    window = tk.Toplevel(root)
-    window.title("Reports & Legal")
-    options = [
-        ("Generate Criminal Report", generate_criminal_report),
-        ("Generate Case Report", generate_case_report),
-        ("Generate Officer Report", generate_officer_report),
-    ]
-    for text, cmd in options:
-        tk.Button(window, text=text, width=30, command=cmd).pack(pady=5)
-
-def main_menu():
-    tk.Label(root, text="Crime Analysis System", font=("Arial", 18)).pack(pady=20)
-    tk.Button(root, text="Criminal Management", width=30, command=criminal_menu).pack(pady=10)
-    tk.Button(root, text="Case Management", width=30, command=case_menu).pack(pady=10)
-    tk.Button(root, text="Victim & Witness Management", width=30, command=victim_witness_menu).pack(pady=10)
-    tk.Button(root, text="Evidence Management", width=30, command=evidence_menu).pack(pady=10)
-    tk.Button(root, text="Officer Assignment", width=30, command=officer_assignment_menu).pack(pady=10)
-    tk.Button(root, text="Reports & Legal", width=30, command=reports_legal_menu).pack(pady=10)
-    tk.Button(root, text="Exit", width=30, command=root.quit).pack(pady=10)
-
-main_menu()
-root.mainloop()
\ No newline at end of file
+import time
+
+# Taken before the other imports so --profile-startup can report what they cost
+STARTED_AT = time.perf_counter()
+
+import tkinter as tk
+from tkinter import messagebox, simpledialog, ttk, filedialog
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import logging
+from connection import describe_error, load_settings
+from dossiers import EXPORT_FORMATS, export_dossiers
+from instrumentation import export_snapshot
+from reports import format_officer, format_record
+from services import REPORTS, RPC_TARGETS, CrimeService
+from tasks import TaskRunner, current_task
+from thumbnails import ThumbnailCache
+from widgets import DataGrid, VirtualList
+
+logger = logging.getLogger("crime_analysis")
+
+# Set up by main(); handlers reach the data only through the service layer
+service = None
+thumbnail_cache = None
+root = None
+tasks = None
+
+SEARCH_PAGE_SIZE = 20
+
+def show_search_results(title, columns, fetch, not_found, name="search"):
+    # fetch(page) runs in the background and returns (rows of values, has_more)
+    def first_page(result):
+        rows, has_more = result
+        if not rows:
+            messagebox.showerror("Error", not_found)
+            return
+
+        window = tk.Toplevel(root)
+        window.title(title)
+        tree = ttk.Treeview(window, columns=columns, show="headings")
+        for col in tree["columns"]:
+            tree.heading(col, text=col)
+        tree.pack(fill="both", expand=True)
+
+        nav = ttk.Frame(window)
+        nav.pack(fill="x")
+        prev_btn = ttk.Button(nav, text="< Prev")
+        page_label = ttk.Label(nav)
+        next_btn = ttk.Button(nav, text="Next >")
+        prev_btn.pack(side="left", padx=5, pady=5)
+        page_label.pack(side="left", padx=5)
+        next_btn.pack(side="left", padx=5, pady=5)
+        state = {"page": 0}
+
+        def render(page, rows, has_more):
+            state["page"] = page
+            tree.delete(*tree.get_children())
+            for values in rows:
+                tree.insert("", "end", values=values)
+            page_label.configure(text=f"Page {page + 1}")
+            prev_btn.state(["!disabled"] if page > 0 else ["disabled"])
+            next_btn.state(["!disabled"] if has_more else ["disabled"])
+
+        def go(page):
+            tasks.submit(lambda: fetch(page), lambda result: render(page, *result), owner=window, name=name)
+
+        prev_btn.configure(command=lambda: go(state["page"] - 1))
+        next_btn.configure(command=lambda: go(state["page"] + 1))
+        render(0, rows, has_more)
+
+    tasks.submit(lambda: fetch(0), first_page, name=name)
+
+def show_grid(title, target, name, on_activate=None):
+    """List ``service.<target>`` in a DataGrid that pages, sorts and filters on the server.
+
+    Loaded rows are kept current from the change feed.
+    """
+    repository = getattr(service, target)
+    spec = RPC_TARGETS[target]
+    window = tk.Toplevel(root)
+    window.title(title)
+
+    def fetch(sort, descending, filters, after, on_loaded, on_failed):
+        tasks.submit(lambda: repository.grid(sort, descending, filters, after), lambda result: on_loaded(*result),
+                     on_failed, owner=window, name=name)
+
+    grid = DataGrid(window, spec.grid_columns, fetch, spec.grid_sortable, on_activate=on_activate)
+    grid.pack(fill="both", expand=True)
+    unsubscribe = service.changes.subscribe([spec.collection_name],
+                                            lambda event: tasks.post(lambda: grid.apply_change(event), window))
+    window.bind("<Destroy>", lambda event: unsubscribe() if event.widget is window else None, add="+")
+
+def add_criminal():
+    def submit():
+        data = {
+            "custom_id": id_entry.get(),
+            "name": name_entry.get(),
+            "age": age_entry.get(),
+            "gender": gender_entry.get(),
+            "crime": crime_entry.get(),
+            "status": status_entry.get()
+        }
+
+        def done(saved):
+            if not saved:
+                messagebox.showerror("Error", "Criminal ID must be unique.")
+                return
+            messagebox.showinfo("Success", "Criminal added successfully")
+            window.destroy()
+
+        tasks.submit(lambda: service.criminals.add(data), done, name="add_criminal")
+
+    window = tk.Toplevel(root)
+    window.title("Add Criminal")
+    
+    # Create form fields
+    tk.Label(window, text="Criminal ID*").grid(row=0, column=0)
+    tk.Label(window, text="Name*").grid(row=1, column=0)
+    tk.Label(window, text="Age").grid(row=2, column=0)
+    tk.Label(window, text="Gender").grid(row=3, column=0)
+    tk.Label(window, text="Crime").grid(row=4, column=0)
+    tk.Label(window, text="Status").grid(row=5, column=0)
+
+    id_entry = tk.Entry(window)
+    name_entry = tk.Entry(window)
+    age_entry = tk.Entry(window)
+    gender_entry = ttk.Combobox(window, values=["Male", "Female", "Other"])
+    crime_entry = tk.Entry(window)
+    status_entry = ttk.Combobox(window, values=["Active", "Inactive", "Incarcerated", "Deceased"])
+
+    id_entry.grid(row=0, column=1)
+    name_entry.grid(row=1, column=1)
+    age_entry.grid(row=2, column=1)
+    gender_entry.grid(row=3, column=1)
+    crime_entry.grid(row=4, column=1)
+    status_entry.grid(row=5, column=1)
+
+    tk.Button(window, text="Submit", command=submit).grid(row=6, columnspan=2)
+
+def add_biometric():
+    selected_files = []
+
+    def browse_images():
+        files = filedialog.askopenfilenames(filetypes=[("Image Files", "*.png;*.jpg;*.jpeg")])
+        if files:
+            selected_files.clear()
+            selected_files.extend(files)
+            entry_path.delete(0, tk.END)
+            entry_path.insert(0, "; ".join(os.path.basename(f) for f in selected_files))
+
+    def submit():
+        criminal_id = entry_criminal_id.get().strip()
+        bio_type = entry_type.get()
+
+        if not all([criminal_id, bio_type, selected_files]):
+            messagebox.showwarning("Warning", "Please fill in all fields and select images.")
+            return
+
+        def upload():
+            task = current_task()
+            # Check the criminal exists before anything is uploaded
+            if not service.criminals.get(criminal_id):
+                return None, f"No criminal found with ID '{criminal_id}'"
+
+            # Stream all images in parallel, then record them (and their thumbnails) in one batch
+            results = service.files.upload_many(selected_files, {"criminal_id": criminal_id},
+                                                on_progress=task.report_progress, check=task.check)
+            failures = [f"Failed to upload {result.filename}: {result.error}" for result in results if result.error]
+            uploads = [result.to_dict() for result in results if not result.error]
+            error = service.biometrics.add(criminal_id, bio_type, uploads)
+            if error:
+                return None, error
+            return results, "\n".join(failures)
+
+        started = time.perf_counter()
+        progress_tree.delete(*progress_tree.get_children())
+        for image_path in selected_files:
+            progress_tree.insert("", "end", iid=image_path, values=(os.path.basename(image_path), "0%", "", "Queued"))
+
+        def progress(snapshot, total=None):
+            elapsed = max(time.perf_counter() - started, 1e-6)
+            for image_path, (sent, size) in snapshot.items():
+                if sent:
+                    progress_tree.item(image_path, values=(
+                        os.path.basename(image_path), f"{100 * sent // max(size, 1)}%",
+                        f"{sent / elapsed / 1e6:.1f} MB/s", "Uploading"))
+
+        def done(outcome):
+            results, error = outcome
+            for result in results or []:
+                status = "Failed" if result.error else ("Already stored" if result.deduplicated else "Stored")
+                progress_tree.item(result.path, values=(
+                    result.filename, "100%" if not result.error else "",
+                    f"{result.throughput / 1e6:.1f} MB/s", status))
+            if error:
+                messagebox.showerror("Error", error, parent=add_window)
+                return
+            messagebox.showinfo("Success", "Biometric data added successfully")
+            add_window.destroy()
+
+        tasks.submit(upload, done, name="add_biometric", on_progress=progress)
+
+    add_window = tk.Toplevel(root)
+    add_window.title("Add Biometric Data")
+
+    tk.Label(add_window, text="Criminal ID*:").grid(row=0, column=0)
+    tk.Label(add_window, text="Biometric Type*:").grid(row=1, column=0)
+    tk.Label(add_window, text="Images*:").grid(row=2, column=0)
+
+    entry_criminal_id = tk.Entry(add_window)
+    entry_type = ttk.Combobox(add_window, values=["Fingerprint", "Face", "DNA", "Other"])
+    entry_path = tk.Entry(add_window, width=40)
+
+    entry_criminal_id.grid(row=0, column=1)
+    entry_type.grid(row=1, column=1)
+    entry_path.grid(row=2, column=1)
+    tk.Button(add_window, text="Browse", command=browse_images).grid(row=2, column=2)
+
+    tk.Button(add_window, text="Submit", command=submit).grid(row=3, columnspan=3, pady=10)
+
+    progress_tree = ttk.Treeview(add_window, columns=("file", "progress", "speed", "status"), show="headings", height=5)
+    for col in progress_tree["columns"]:
+        progress_tree.heading(col, text=col)
+    progress_tree.grid(row=4, columnspan=3, padx=5, pady=5)
+
+CRIMINAL_PAGE_SIZE = 50
+CRIMINAL_ROW_HEIGHT = 200
+
+def warm_thumbnails(bios):
+    for bio in bios:
+        try:
+            thumbnail_cache.get(bio)
+        except Exception as e:
+            print(f"Error loading image: {e}")
+
+def load_criminal_page(after):
+    items, next_after = service.criminals.browse(after, CRIMINAL_PAGE_SIZE)
+    for _, bios in items:
+        current_task().check()
+        warm_thumbnails(bios)
+    return items, next_after
+
+def view_criminals():
+    view_window = tk.Toplevel(root)
+    view_window.title("View Criminals")
+    view_window.geometry("800x600")
+
+    # Each loaded page remembers the cursor it was fetched from so it can be reloaded on its own
+    pages = []
+    state = {"next_after": None, "done": False, "loading": False}
+    pending_thumbnails = set()
+
+    def make_row(parent):
+        criminal_frame = ttk.LabelFrame(parent)
+        criminal_frame.info_label = ttk.Label(criminal_frame)
+        criminal_frame.info_label.grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        criminal_frame.image_frames = []
+        return criminal_frame
+
+    def bind_row(criminal_frame, item):
+        criminal, bios = item
+        criminal_frame.configure(text=f"Criminal: {criminal.get('name', 'N/A')}")
+        criminal_frame.info_label.configure(text=(
+            f"ID: {criminal.get('custom_id', 'N/A')}\n"
+            f"Age: {criminal.get('age', 'N/A')}\n"
+            f"Gender: {criminal.get('gender', 'N/A')}\n"
+            f"Crime: {criminal.get('crime', 'N/A')}\n"
+            f"Status: {criminal.get('status', 'N/A')}"
+        ))
+
+        # Reuse the image slots of this row, creating more only when needed
+        while len(criminal_frame.image_frames) < len(bios):
+            img_frame = ttk.Frame(criminal_frame)
+            img_frame.img_label = ttk.Label(img_frame)
+            img_frame.img_label.pack()
+            img_frame.type_label = ttk.Label(img_frame, font=('Arial', 8))
+            img_frame.type_label.pack()
+            for widget in (img_frame, img_frame.img_label, img_frame.type_label):
+                listing.bind_wheel(widget)
+            criminal_frame.image_frames.append(img_frame)
+
+        for col, img_frame in enumerate(criminal_frame.image_frames, start=1):
+            if col > len(bios):
+                img_frame.grid_remove()
+                continue
+            bio = bios[col - 1]
+            image = thumbnail_cache.peek(bio)
+            if image is None:
+                photo = ""
+                request_thumbnail(bio)
+            else:
+                # The imaging stack is loaded with the first thumbnail, not at startup
+                from PIL import ImageTk
+                photo = ImageTk.PhotoImage(image)
+            img_frame.img_label.configure(image=photo, text="" if photo else "Loading...")
+            img_frame.img_label.image = photo  # Keep reference
+            img_frame.type_label.configure(text=f"Type: {bio.get('type', 'N/A')}")
+            img_frame.grid(row=0, column=col, padx=5, pady=5)
+
+    def request_thumbnail(bio):
+        # Thumbnails evicted from memory are reloaded off the UI thread
+        key = bio.get("_id")
+        if key in pending_thumbnails:
+            return
+        pending_thumbnails.add(key)
+
+        def on_done(image):
+            pending_thumbnails.discard(key)
+            listing.rebind()
+
+        def on_error(error):
+            pending_thumbnails.discard(key)
+            print(f"Error loading image: {error}")
+
+        tasks.submit(lambda: thumbnail_cache.get(bio), on_done, on_error,
+                     owner=view_window, name="load_thumbnail")
+
+    def load_page(after, on_loaded):
+        state["loading"] = True
+
+        def on_done(result):
+            state["loading"] = False
+            on_loaded(*result)
+
+        def on_error(error):
+            state["loading"] = False
+            messagebox.showerror("Error", f"Failed to load criminals: {error}", parent=view_window)
+
+        tasks.submit(lambda: load_criminal_page(after), on_done, on_error,
+                     owner=view_window, name="view_criminals")
+
+    def load_next_page():
+        if state["loading"] or state["done"]:
+            return
+        after = state["next_after"]
+
+        def on_loaded(items, next_after):
+            pages.append({"after": after, "count": len(items)})
+            state["next_after"] = next_after
+            state["done"] = next_after is None
+            listing.extend(items)
+
+        load_page(after, on_loaded)
+
+    def refresh_current_page():
+        if state["loading"] or not pages:
+            return
+        # Locate the page holding the first visible row
+        first, start = listing.first_visible(), 0
+        for index, page in enumerate(pages):
+            if first < start + page["count"] or index == len(pages) - 1:
+                break
+            start += page["count"]
+
+        def on_loaded(items, next_after):
+            end = start + page["count"]
+            page["count"] = len(items)
+            if index == len(pages) - 1 or next_after != pages[index + 1]["after"]:
+                # The page boundary moved, so the pages after it are stale; they will be refetched on scroll
+                del pages[index + 1:]
+                end = len(listing.items)
+                state["next_after"] = next_after
+                state["done"] = next_after is None
+            listing.replace(start, end, items)
+
+        load_page(page["after"], on_loaded)
+
+    toolbar = ttk.Frame(view_window)
+    toolbar.pack(side="top", fill="x")
+    ttk.Button(toolbar, text="Refresh", command=refresh_current_page).pack(side="left", padx=10, pady=5)
+
+    listing = VirtualList(view_window, CRIMINAL_ROW_HEIGHT, make_row, bind_row, on_near_end=load_next_page)
+    listing.pack(fill="both", expand=True)
+
+    load_next_page()
+
+
+def update_criminal():
+    custom_id = simpledialog.askstring("Input", "Enter Custom ID of criminal to update")
+    tasks.submit(lambda: service.criminals.get(custom_id),
+                 lambda crim: show_update_criminal(custom_id, crim), name="update_criminal")
+
+def show_update_criminal(custom_id, crim):
+    if not crim:
+        messagebox.showerror("Error", "Criminal not found")
+        return
+
+    def submit():
+        updated_data = {
+            "age": age_entry.get(),
+            "gender": gender_entry.get(),
+            "crime": crime_entry.get(),
+            "status": status_entry.get()
+        }
+
+        def done(updated):
+            if updated:
+                messagebox.showinfo("Success", "Criminal updated successfully")
+            else:
+                messagebox.showerror("Error", "Criminal not found")
+            window.destroy()
+
+        tasks.submit(lambda: service.criminals.update(custom_id, updated_data),
+                     done, name="update_criminal")
+
+    window = tk.Toplevel(root)
+    window.title("Update Criminal")
+    tk.Label(window, text="Age").grid(row=0, column=0)
+    tk.Label(window, text="Gender").grid(row=1, column=0)
+    tk.Label(window, text="Crime").grid(row=2, column=0)
+    tk.Label(window, text="Status").grid(row=3, column=0)
+
+    age_entry = tk.Entry(window)
+    gender_entry = tk.Entry(window)
+    crime_entry = tk.Entry(window)
+    status_entry = tk.Entry(window)
+
+    age_entry.insert(0, crim["age"])
+    gender_entry.insert(0, crim["gender"])
+    crime_entry.insert(0, crim["crime"])
+    status_entry.insert(0, crim["status"])
+
+    age_entry.grid(row=0, column=1)
+    gender_entry.grid(row=1, column=1)
+    crime_entry.grid(row=2, column=1)
+    status_entry.grid(row=3, column=1)
+
+    tk.Button(window, text="Submit", command=submit).grid(row=4, columnspan=2)
+
+
+
+def delete_criminal():
+    custom_id = simpledialog.askstring("Input", "Enter Custom ID of criminal to delete")
+
+    def done(deleted):
+        if deleted:
+            messagebox.showinfo("Success", "Criminal deleted successfully")
+        else:
+            messagebox.showerror("Error", "Criminal not found")
+
+    tasks.submit(lambda: service.criminals.delete(custom_id), done, name="delete_criminal")
+
+def search_criminal():
+    name = simpledialog.askstring("Input", "Enter name to search")
+
+    def fetch(page):
+        docs, has_more = service.criminals.search(name, page, SEARCH_PAGE_SIZE)
+        rows = [(crim.get("custom_id"), crim.get("name"), crim.get("age"), crim.get("gender"),
+                 crim.get("crime"), crim.get("status")) for crim in docs]
+        return rows, has_more
+
+    show_search_results("Search Results", ("custom_id", "name", "age", "gender", "crime", "status"),
+                        fetch, "Criminal not found", name="search_criminal")
+
+SIMILAR_TOP_K = 10
+
+def find_similar():
+    path = filedialog.askopenfilename(filetypes=[("Image Files", "*.png;*.jpg;*.jpeg")])
+    if not path:
+        return
+
+    def load():
+        with open(path, "rb") as f:
+            data = f.read()
+        return service.similarity.search(data, SIMILAR_TOP_K)
+
+    def show(matches):
+        if not matches:
+            messagebox.showinfo("Find Similar", "No similar biometric images found")
+            return
+        window = tk.Toplevel(root)
+        window.title(f"Similar to {os.path.basename(path)}")
+        tree = ttk.Treeview(window, columns=("custom_id", "name", "type", "similarity"), show="headings")
+        for col in tree["columns"]:
+            tree.heading(col, text=col)
+        tree.pack(fill="both", expand=True)
+        for match in matches:
+            tree.insert("", "end", values=(match["criminal_id"], match["name"], match["type"],
+                                           f"{match['similarity']:.0%}"))
+
+    tasks.submit(load, show, name="find_similar")
+
+def criminal_menu():
+    window = tk.Toplevel(root)
+    window.title("Criminal Management")
+    options = [
+        ("Add Criminal", add_criminal),
+        ("View Criminals", view_criminals),
+        ("Update Criminal", update_criminal),
+        ("Delete Criminal", delete_criminal),
+        ("Search Criminal", search_criminal),
+        ("Add Biometric", add_biometric),
+        ("Find Similar", find_similar)
+    ]
+    for text, cmd in options:
+        tk.Button(window, text=text, width=30, command=cmd).pack(pady=5)
+
+def add_case():
+    def submit():
+        data = {
+            "case_id": case_id_entry.get(),
+            "description": description_entry.get(),
+            "status": status_entry.get(),
+            "officer": officer_entry.get()
+        }
+
+        def done(saved):
+            if not saved:
+                messagebox.showerror("Error", "Case ID must be unique.")
+                return
+            messagebox.showinfo("Success", "Case added successfully")
+            window.destroy()
+
+        tasks.submit(lambda: service.cases.add(data), done, name="add_case")
+
+    window = tk.Toplevel(root)
+    window.title("Add Case")
+    tk.Label(window, text="Case ID").grid(row=0, column=0)
+    tk.Label(window, text="Description").grid(row=1, column=0)
+    tk.Label(window, text="Status").grid(row=2, column=0)
+    tk.Label(window, text="Officer Assigned").grid(row=3, column=0)
+
+    case_id_entry = tk.Entry(window)
+    description_entry = tk.Entry(window)
+    status_entry = tk.Entry(window)
+    officer_entry = tk.Entry(window)
+
+    case_id_entry.grid(row=0, column=1)
+    description_entry.grid(row=1, column=1)
+    status_entry.grid(row=2, column=1)
+    officer_entry.grid(row=3, column=1)
+
+    tk.Button(window, text="Submit", command=submit).grid(row=4, columnspan=2)
+
+def view_cases():
+    show_grid("View Cases", "cases", "view_cases")
+
+DOSSIER_SECTIONS = [
+    ("Evidence", "evidence", ("type", "description", "file_name")),
+    ("Assignments", "assignments", ("officer_id",)),
+    ("Criminals", "criminals", ("custom_id", "name", "age", "gender", "crime", "status")),
+    ("Victims/Witnesses", "victims_witnesses", ("name", "role", "crime", "statement")),
+]
+
+def view_case_dossier():
+    case_id = simpledialog.askstring("Input", "Enter Case ID")
+    if not case_id:
+        return
+
+    def show(dossier):
+        if dossier is None:
+            messagebox.showerror("Error", "Case not found")
+            return
+        window = tk.Toplevel(root)
+        window.title(f"Case Dossier {case_id}")
+        header = (f"{dossier['case_id']}: {dossier.get('description', '')}\n"
+                  f"Status: {dossier.get('status', 'N/A')}    Officers: {', '.join(dossier['officers']) or 'None'}\n"
+                  f"Crimes mentioned: {', '.join(dossier['crimes']) or 'None'}")
+        ttk.Label(window, text=header, justify="left").pack(anchor="w", padx=10, pady=10)
+        notebook = ttk.Notebook(window)
+        notebook.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        for title, key, columns in DOSSIER_SECTIONS:
+            frame = ttk.Frame(notebook)
+            notebook.add(frame, text=f"{title} ({len(dossier[key])})")
+            tree = ttk.Treeview(frame, columns=columns, show="headings")
+            for col in columns:
+                tree.heading(col, text=col)
+            tree.pack(fill="both", expand=True)
+            for record in dossier[key]:
+                tree.insert("", "end", values=[record.get(col, "") for col in columns])
+
+    tasks.submit(lambda: service.dossiers.get(case_id), show, name="view_case_dossier")
+
+def export_open_dossiers():
+    path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[
+        ("Text", "*.txt"), ("PDF", "*.pdf"), ("JSON Lines", "*.json")])
+    if not path:
+        return
+    fmt = os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in EXPORT_FORMATS:
+        messagebox.showerror("Error", f"Choose a .txt, .pdf or .json file, not .{fmt}")
+        return
+
+    window = tk.Toplevel(root)
+    window.title("Export Open Case Dossiers")
+    progress_bar = ttk.Progressbar(window, mode="determinate", length=300)
+    progress_label = ttk.Label(window, text="Finding open cases...")
+    progress_bar.pack(padx=10, pady=10)
+    progress_label.pack(padx=10)
+
+    def work():
+        task = current_task()
+        return export_dossiers(service, path, fmt, progress=task.report_progress, check=task.check)
+
+    def progress(done, total):
+        progress_bar.configure(maximum=max(total or done, 1), value=done)
+        progress_label.configure(text=f"{done} / {total}")
+
+    def done(count):
+        window.destroy()
+        messagebox.showinfo("Export", f"Exported {count} dossiers to {path}")
+
+    task = tasks.submit(work, done, owner=window, name="export_dossiers", on_progress=progress)
+    ttk.Button(window, text="Cancel", command=lambda: (task.cancel(), window.destroy())).pack(pady=10)
+
+def case_menu():
+    window = tk.Toplevel(root)
+    window.title("Case Management")
+    options = [
+        ("Add Case", add_case),
+        ("View Cases", view_cases),
+        ("Case Dossier", view_case_dossier),
+        ("Export Open Dossiers", export_open_dossiers)
+    ]
+    for text, cmd in options:
+        tk.Button(window, text=text, width=30, command=cmd).pack(pady=5)
+
+def add_victim_witness():
+    def submit():
+        data = {
+            "name": name_entry.get(),
+            "age": age_entry.get(),
+            "gender": gender_entry.get(),
+            "crime": crime_entry.get(),
+            "role": role_entry.get(),  # Victim or Witness
+            "statement": statement_entry.get()
+        }
+
+        def done(result):
+            messagebox.showinfo("Success", "Victim/Witness added successfully")
+            window.destroy()
+
+        tasks.submit(lambda: service.victims_witnesses.add(data), done, name="add_victim_witness")
+
+    window = tk.Toplevel(root)
+    window.title("Add Victim/Witness")
+    tk.Label(window, text="Name").grid(row=0, column=0)
+    tk.Label(window, text="Age").grid(row=1, column=0)
+    tk.Label(window, text="Gender").grid(row=2, column=0)
+    tk.Label(window, text="Crime").grid(row=3, column=0)
+    tk.Label(window, text="Role (Victim/Witness)").grid(row=4, column=0)
+    tk.Label(window, text="Statement").grid(row=5, column=0)
+
+    name_entry = tk.Entry(window)
+    age_entry = tk.Entry(window)
+    gender_entry = tk.Entry(window)
+    crime_entry = tk.Entry(window)
+    role_entry = tk.Entry(window)
+    statement_entry = tk.Entry(window)
+
+    name_entry.grid(row=0, column=1)
+    age_entry.grid(row=1, column=1)
+    gender_entry.grid(row=2, column=1)
+    crime_entry.grid(row=3, column=1)
+    role_entry.grid(row=4, column=1)
+    statement_entry.grid(row=5, column=1)
+
+    tk.Button(window, text="Submit", command=submit).grid(row=6, columnspan=2)
+
+def view_victims_witnesses():
+    show_grid("View Victims/Witnesses", "victims_witnesses", "view_victims_witnesses")
+
+def update_victim_witness():
+    name = simpledialog.askstring("Input", "Enter name of victim/witness to update")
+    tasks.submit(lambda: service.victims_witnesses.get(name),
+                 lambda vic_wit: show_update_victim_witness(name, vic_wit), name="update_victim_witness")
+
+def show_update_victim_witness(name, vic_wit):
+    if not vic_wit:
+        messagebox.showerror("Error", "Victim/Witness not found")
+        return
+
+    def submit():
+        updated_data = {
+            "age": age_entry.get(),
+            "gender": gender_entry.get(),
+            "crime": crime_entry.get(),
+            "role": role_entry.get(),
+            "statement": statement_entry.get()
+        }
+
+        def done(updated):
+            if updated:
+                messagebox.showinfo("Success", "Victim/Witness updated successfully")
+            else:
+                messagebox.showerror("Error", "Victim/Witness not found")
+            window.destroy()
+
+        tasks.submit(lambda: service.victims_witnesses.update(name, updated_data),
+                     done, name="update_victim_witness")
+
+    window = tk.Toplevel(root)
+    window.title("Update Victim/Witness")
+    tk.Label(window, text="Age").grid(row=0, column=0)
+    tk.Label(window, text="Gender").grid(row=1, column=0)
+    tk.Label(window, text="Crime").grid(row=2, column=0)
+    tk.Label(window, text="Role (Victim/Witness)").grid(row=3, column=0)
+    tk.Label(window, text="Statement").grid(row=4, column=0)
+
+    age_entry = tk.Entry(window)
+    gender_entry = tk.Entry(window)
+    crime_entry = tk.Entry(window)
+    role_entry = tk.Entry(window)
+    statement_entry = tk.Entry(window)
+
+    age_entry.insert(0, vic_wit["age"])
+    gender_entry.insert(0, vic_wit["gender"])
+    crime_entry.insert(0, vic_wit["crime"])
+    role_entry.insert(0, vic_wit["role"])
+    statement_entry.insert(0, vic_wit["statement"])
+
+    age_entry.grid(row=0, column=1)
+    gender_entry.grid(row=1, column=1)
+    crime_entry.grid(row=2, column=1)
+    role_entry.grid(row=3, column=1)
+    statement_entry.grid(row=4, column=1)
+
+    tk.Button(window, text="Submit", command=submit).grid(row=5, columnspan=2)
+
+def delete_victim_witness():
+    name = simpledialog.askstring("Input", "Enter name of victim/witness to delete")
+
+    def done(deleted):
+        if deleted:
+            messagebox.showinfo("Success", "Victim/Witness deleted")
+        else:
+            messagebox.showerror("Error", "Victim/Witness not found")
+
+    tasks.submit(lambda: service.victims_witnesses.delete(name), done, name="delete_victim_witness")
+
+def search_victim_witness():
+    name = simpledialog.askstring("Input", "Enter name to search")
+
+    def fetch(page):
+        docs, has_more = service.victims_witnesses.search(name, page, SEARCH_PAGE_SIZE)
+        rows = [(vic_wit.get("name"), vic_wit.get("age"), vic_wit.get("gender"), vic_wit.get("crime"),
+                 vic_wit.get("role"), vic_wit.get("statement")) for vic_wit in docs]
+        return rows, has_more
+
+    show_search_results("Search Results", ("name", "age", "gender", "crime", "role", "statement"),
+                        fetch, "Victim/Witness not found", name="search_victim_witness")
+
+def victim_witness_menu():
+    window = tk.Toplevel(root)
+    window.title("Victim & Witness Management")
+    options = [
+        ("Add Victim/Witness", add_victim_witness),
+        ("View Victims/Witnesses", view_victims_witnesses),
+        ("Update Victim/Witness", update_victim_witness),
+        ("Delete Victim/Witness", delete_victim_witness),
+        ("Search Victim/Witness", search_victim_witness)
+    ]
+    for text, cmd in options:
+        tk.Button(window, text=text, width=30, command=cmd).pack(pady=5)
+
+def upload_evidence_file(path):
+    # Streams the file in chunks, reporting progress to the running task
+    task = current_task()
+    size = os.path.getsize(path)
+    result = service.files.upload_file(path, on_chunk=lambda sent: task.report_progress(sent, size),
+                                       check=task.check)
+    if result.error:
+        raise result.error
+    return result.file_id
+
+def show_upload_progress(progress_bar):
+    def progress(sent, size):
+        progress_bar.configure(maximum=max(size, 1), value=sent)
+    return progress
+
+# Function to add evidence
+def add_evidence():
+    def submit():
+        # Collect form data
+        evidence_type = type_entry.get()
+        description = description_entry.get()
+        case_id = case_id_entry.get()
+        
+        evidence_file = file_entry.get()  # This is just the filename or file path
+
+        def save():
+            # Handle file upload
+            file_data = None
+            if evidence_file:
+                file_data = upload_evidence_file(evidence_file)
+
+            # Create evidence document
+            evidence_data = {
+                "type": evidence_type,
+                "description": description,
+                "case_id": case_id,
+            }
+            service.evidence.add(evidence_data, file_data)
+
+        def done(result):
+            messagebox.showinfo("Success", "Evidence added successfully")
+            window.destroy()
+
+        tasks.submit(save, done, name="add_evidence", on_progress=show_upload_progress(progress_bar))
+
+    window = tk.Toplevel(root)
+    window.title("Add Evidence")
+    
+    # Create form fields
+    tk.Label(window, text="Evidence Type").grid(row=0, column=0)
+    tk.Label(window, text="Description").grid(row=1, column=0)
+    tk.Label(window, text="Case ID").grid(row=2, column=0)
+    tk.Label(window, text="File (optional)").grid(row=3, column=0)
+
+    type_entry = tk.Entry(window)
+    description_entry = tk.Entry(window)
+    case_id_entry = tk.Entry(window)
+    file_entry = tk.Entry(window)  # For file input (path)
+
+    type_entry.grid(row=0, column=1)
+    description_entry.grid(row=1, column=1)
+    case_id_entry.grid(row=2, column=1)
+    file_entry.grid(row=3, column=1)
+
+    tk.Button(window, text="Submit", command=submit).grid(row=4, columnspan=2)
+    progress_bar = ttk.Progressbar(window, mode="determinate", length=200)
+    progress_bar.grid(row=5, columnspan=2, pady=5)
+
+# Function to view evidence
+def view_evidence():
+    show_grid("View Evidence", "evidence", "view_evidence", on_activate=open_evidence_file)
+
+def open_with_default_app(path):
+    if sys.platform == "win32":
+        os.startfile(path)
+    else:
+        subprocess.Popen(["open" if sys.platform == "darwin" else "xdg-open", path])
+
+def open_evidence_file(evidence_id):
+    # The listing only carries file metadata; the content is downloaded when opened
+    def download():
+        task = current_task()
+        evidence = service.evidence.get(evidence_id)
+        if not evidence or not evidence.get("file_id"):
+            return None
+        directory = os.path.join(tempfile.gettempdir(), "crime_analysis_evidence", str(evidence["file_id"]))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, os.path.basename(evidence.get("file_name") or str(evidence["file_id"])))
+        if not os.path.exists(path):
+            size = evidence.get("file_size") or 0
+            service.files.download(evidence["file_id"], path,
+                                   on_chunk=lambda received: task.report_progress(received, size), check=task.check)
+        return path
+
+    def done(path):
+        if path is None:
+            messagebox.showinfo("Evidence", "This evidence has no file attached")
+        else:
+            open_with_default_app(path)
+
+    tasks.submit(download, done, name="open_evidence_file")
+
+# Function to update evidence
+def update_evidence():
+    evidence_id = simpledialog.askstring("Input", "Enter Evidence ID to update")
+    tasks.submit(lambda: service.evidence.get(evidence_id),
+                 lambda evidence: show_update_evidence(evidence_id, evidence), name="update_evidence")
+
+def show_update_evidence(evidence_id, evidence):
+    if not evidence:
+        messagebox.showerror("Error", "Evidence not found")
+        return
+
+    def submit():
+        updated_data = {
+            "type": type_entry.get(),
+            "description": description_entry.get(),
+            "case_id": case_id_entry.get(),
+        }
+        new_file = file_entry.get()
+
+        def save():
+            # Handle file update (if provided)
+            file_id = upload_evidence_file(new_file) if new_file else None
+            return service.evidence.update(evidence_id, updated_data, file_id)
+
+        def done(updated):
+            if updated:
+                messagebox.showinfo("Success", "Evidence updated successfully")
+            else:
+                messagebox.showerror("Error", "Evidence not found")
+            window.destroy()
+
+        tasks.submit(save, done, name="update_evidence", on_progress=show_upload_progress(progress_bar))
+
+    window = tk.Toplevel(root)
+    window.title("Update Evidence")
+    
+    tk.Label(window, text="Evidence Type").grid(row=0, column=0)
+    tk.Label(window, text="Description").grid(row=1, column=0)
+    tk.Label(window, text="Case ID").grid(row=2, column=0)
+    tk.Label(window, text="File (optional)").grid(row=3, column=0)
+
+    type_entry = tk.Entry(window)
+    description_entry = tk.Entry(window)
+    case_id_entry = tk.Entry(window)
+    file_entry = tk.Entry(window)
+
+    type_entry.insert(0, evidence["type"])
+    description_entry.insert(0, evidence["description"])
+    case_id_entry.insert(0, evidence["case_id"])
+
+    type_entry.grid(row=0, column=1)
+    description_entry.grid(row=1, column=1)
+    case_id_entry.grid(row=2, column=1)
+    file_entry.grid(row=3, column=1)
+
+    tk.Button(window, text="Submit", command=submit).grid(row=4, columnspan=2)
+    progress_bar = ttk.Progressbar(window, mode="determinate", length=200)
+    progress_bar.grid(row=5, columnspan=2, pady=5)
+
+# Function to delete evidence
+def delete_evidence():
+    evidence_id = simpledialog.askstring("Input", "Enter Evidence ID to delete")
+
+    def done(deleted):
+        if deleted:
+            messagebox.showinfo("Success", "Evidence deleted")
+        else:
+            messagebox.showerror("Error", "Evidence not found")
+
+    tasks.submit(lambda: service.evidence.delete(evidence_id), done, name="delete_evidence")
+
+# Function to search evidence
+def search_evidence():
+    search_term = simpledialog.askstring("Input", "Enter search term (Evidence Type, Case ID, or Description)")
+
+    def fetch(page):
+        evidence_list, has_more = service.evidence.search(search_term, page, SEARCH_PAGE_SIZE)
+        rows = [(evidence["type"], evidence["description"], evidence["case_id"], evidence["file_name"])
+                for evidence in evidence_list]
+        return rows, has_more
+
+    show_search_results("Search Results", ("type", "description", "case_id", "file"), fetch, "No evidence found",
+                        name="search_evidence")
+
+# Function to open Evidence Management menu
+def evidence_menu():
+    window = tk.Toplevel(root)
+    window.title("Evidence Management")
+    options = [
+        ("Add Evidence", add_evidence),
+        ("View Evidence", view_evidence),
+        ("Update Evidence", update_evidence),
+        ("Delete Evidence", delete_evidence),
+        ("Search Evidence", search_evidence),
+        ("Reclaim File Storage", reclaim_file_storage)
+    ]
+    for text, cmd in options:
+        tk.Button(window, text=text, width=30, command=cmd).pack(pady=5)
+
+def format_storage_report(report):
+    verb = "Would reclaim" if report["dry_run"] else "Reclaimed"
+    return (f"Scanned {report['files_scanned']} files ({report['bytes_scanned'] / 2 ** 20:.1f} MB) "
+            f"in {report['seconds']:.1f}s, {report['files_per_second']:.0f} files/s\n"
+            f"{verb} {report['orphan_files']} unreferenced files ({report['orphan_bytes'] / 2 ** 20:.1f} MB)\n"
+            f"{verb} {report['orphan_chunks']} chunks of {report['orphan_chunk_sets']} incomplete files")
+
+def reclaim_file_storage():
+    window = tk.Toplevel(root)
+    window.title("Reclaim File Storage")
+    progress_bar = ttk.Progressbar(window, mode="determinate", length=300)
+    report_label = ttk.Label(window, text="Looking for files no record refers to...", justify="left")
+    progress_bar.pack(padx=10, pady=10)
+    report_label.pack(padx=10)
+    buttons = ttk.Frame(window)
+    buttons.pack(pady=10)
+
+    def sweep(delete):
+        task = current_task()
+        return service.storage.collect_orphans(delete, progress=task.report_progress, check=task.check)
+
+    def progress(done, total):
+        progress_bar.configure(maximum=max(total or done, 1), value=done)
+
+    def reclaim():
+        for button in buttons.winfo_children():
+            button.destroy()
+        report_label.configure(text="Deleting...")
+        tasks.submit(lambda: sweep(True), show, owner=window, name="reclaim_storage", on_progress=progress)
+
+    def show(report):
+        report_label.configure(text=format_storage_report(report))
+        if report["dry_run"] and (report["orphan_files"] or report["orphan_chunk_sets"]):
+            ttk.Button(buttons, text="Reclaim", command=reclaim).pack(side="left", padx=5)
+        ttk.Button(buttons, text="Close", command=window.destroy).pack(side="left", padx=5)
+
+    # Always a dry run first, so nothing is deleted before the user has seen the report
+    tasks.submit(lambda: sweep(False), show, owner=window, name="find_orphans", on_progress=progress)
+
+def assign_officer():
+    def submit():
+        case_id = case_id_entry.get()
+        officer_id = officer_id_entry.get()
+        # Add assignment data to the database
+        assignment_data = {
+            "case_id": case_id,
+            "officer_id": officer_id,
+        }
+
+        def done(result):
+            messagebox.showinfo("Success", "Officer assigned successfully")
+            window.destroy()
+
+        tasks.submit(lambda: service.officer_assignments.add(assignment_data), done, name="assign_officer")
+
+    window = tk.Toplevel(root)
+    window.title("Assign Officer")
+    
+    # Create form fields
+    tk.Label(window, text="Case ID").grid(row=0, column=0)
+    tk.Label(window, text="Officer ID").grid(row=1, column=0)
+
+    case_id_entry = tk.Entry(window)
+    officer_id_entry = tk.Entry(window)
+
+    case_id_entry.grid(row=0, column=1)
+    officer_id_entry.grid(row=1, column=1)
+
+    tk.Button(window, text="Submit", command=submit).grid(row=2, columnspan=2)
+
+# Function to view officer assignments
+def view_assignments():
+    show_grid("View Officer Assignments", "officer_assignments", "view_assignments")
+
+# Function to update officer assignment
+def update_assignment():
+    assignment_id = simpledialog.askstring("Input", "Enter Assignment ID to update")
+    tasks.submit(lambda: service.officer_assignments.get(assignment_id),
+                 lambda assignment: show_update_assignment(assignment_id, assignment), name="update_assignment")
+
+def show_update_assignment(assignment_id, assignment):
+    if not assignment:
+        messagebox.showerror("Error", "Assignment not found")
+        return
+
+    def submit():
+        updated_data = {
+            "case_id": case_id_entry.get(),
+            "officer_id": officer_id_entry.get(),
+        }
+
+        def done(updated):
+            if updated:
+                messagebox.showinfo("Success", "Assignment updated successfully")
+            else:
+                messagebox.showerror("Error", "Assignment not found")
+            window.destroy()
+
+        tasks.submit(lambda: service.officer_assignments.update(assignment_id, updated_data),
+                     done, name="update_assignment")
+
+    window = tk.Toplevel(root)
+    window.title("Update Officer Assignment")
+    
+    tk.Label(window, text="Case ID").grid(row=0, column=0)
+    tk.Label(window, text="Officer ID").grid(row=1, column=0)
+
+    case_id_entry = tk.Entry(window)
+    officer_id_entry = tk.Entry(window)
+
+    case_id_entry.insert(0, assignment["case_id"])
+    officer_id_entry.insert(0, assignment["officer_id"])
+
+    case_id_entry.grid(row=0, column=1)
+    officer_id_entry.grid(row=1, column=1)
+
+    tk.Button(window, text="Submit", command=submit).grid(row=2, columnspan=2)
+
+# Function to delete officer assignment
+def delete_assignment():
+    assignment_id = simpledialog.askstring("Input", "Enter Assignment ID to delete")
+
+    def done(deleted):
+        if deleted:
+            messagebox.showinfo("Success", "Assignment deleted")
+        else:
+            messagebox.showerror("Error", "Assignment not found")
+
+    tasks.submit(lambda: service.officer_assignments.delete(assignment_id), done, name="delete_assignment")
+
+# Function to search officer assignments
+def search_assignments():
+    search_term = simpledialog.askstring("Input", "Enter search term (Case ID or Officer ID)")
+
+    def fetch(page):
+        assignment_list, has_more = service.officer_assignments.search(search_term, page, SEARCH_PAGE_SIZE)
+        return [(assignment["case_id"], assignment["officer_id"]) for assignment in assignment_list], has_more
+
+    show_search_results("Search Results", ("case_id", "officer_id"), fetch, "No assignments found",
+                        name="search_assignments")
+
+# Function to open Officer Assignment menu
+def officer_assignment_menu():
+    window = tk.Toplevel(root)
+    window.title("Officer Assignment Management")
+    options = [
+        ("Assign Officer", assign_officer),
+        ("View Assignments", view_assignments),
+        ("Update Assignment", update_assignment),
+        ("Delete Assignment", delete_assignment),
+        ("Search Assignments", search_assignments)
+    ]
+    for text, cmd in options:
+        tk.Button(window, text=text, width=30, command=cmd).pack(pady=5)
+
+REPORT_PREVIEW_PAGE = 25
+REPORT_FORMATS = {"txt": "Text", "csv": "CSV", "pdf": "PDF"}
+
+def show_report(report, empty_message="No records found.", default_format="txt"):
+    title, _, fields, _, _ = REPORTS[report]
+    # Keyset cursors of the preview pages visited so far, so Prev can go back
+    pages = [None]
+
+    def fetch(page):
+        return service.reports.preview(report, pages[page], REPORT_PREVIEW_PAGE)
+
+    def first_page(result):
+        docs, next_after = result
+        if not docs:
+            messagebox.showinfo("Report", empty_message)
+            return
+
+        report_window = tk.Toplevel(root)
+        report_window.title(title)
+
+        preview = tk.Text(report_window, width=80, height=30, wrap="word")
+        preview.pack(fill="both", expand=True, padx=10, pady=10)
+
+        nav = ttk.Frame(report_window)
+        nav.pack(fill="x", padx=10)
+        prev_btn = ttk.Button(nav, text="< Prev")
+        page_label = ttk.Label(nav)
+        next_btn = ttk.Button(nav, text="Next >")
+        prev_btn.pack(side="left")
+        page_label.pack(side="left", padx=5)
+        next_btn.pack(side="left")
+
+        export_frame = ttk.Frame(report_window)
+        export_frame.pack(fill="x", padx=10, pady=10)
+        format_box = ttk.Combobox(export_frame, values=list(REPORT_FORMATS), width=6, state="readonly")
+        format_box.set(default_format)
+        export_btn = ttk.Button(export_frame, text="Export...")
+        progress_bar = ttk.Progressbar(export_frame, mode="determinate", length=200)
+        cancel_btn = ttk.Button(export_frame, text="Cancel", state="disabled")
+        progress_label = ttk.Label(export_frame)
+        format_box.pack(side="left")
+        export_btn.pack(side="left", padx=5)
+        progress_bar.pack(side="left", padx=5)
+        cancel_btn.pack(side="left")
+        progress_label.pack(side="left", padx=5)
+        state = {"page": 0}
+
+        def render(page, docs, next_after):
+            state["page"] = page
+            if next_after is not None and len(pages) == page + 1:
+                pages.append(next_after)
+            preview.configure(state="normal")
+            preview.delete("1.0", "end")
+            preview.insert("end", f"{title}:\n\n")
+            for doc in docs:
+                preview.insert("end", format_record(doc, fields) + "\n")
+            preview.configure(state="disabled")
+            page_label.configure(text=f"Page {page + 1}")
+            prev_btn.state(["!disabled"] if page > 0 else ["disabled"])
+            next_btn.state(["!disabled"] if next_after is not None else ["disabled"])
+
+        def go(page):
+            tasks.submit(lambda: fetch(page), lambda result: render(page, *result),
+                         owner=report_window, name=f"{report}_report")
+
+        def export_finished(message=None):
+            export_btn.state(["!disabled"])
+            cancel_btn.state(["disabled"])
+            progress_label.configure(text=message or "")
+
+        def export():
+            fmt = format_box.get()
+            path = filedialog.asksaveasfilename(parent=report_window, defaultextension=f".{fmt}",
+                                                filetypes=[(REPORT_FORMATS[fmt], f"*.{fmt}")])
+            if not path:
+                return
+
+            def work():
+                task = current_task()
+                return service.reports.export(report, fmt, path, progress=task.report_progress, check=task.check)
+
+            def progress(done, total):
+                progress_bar.configure(maximum=max(total or done, 1), value=done)
+                progress_label.configure(text=f"{done} / {total}" if total else str(done))
+
+            def done(count):
+                export_finished(f"Exported {count} records")
+                messagebox.showinfo("Report", f"Exported {count} records to {path}", parent=report_window)
+
+            def failed(error):
+                export_finished()
+                messagebox.showerror("Error", f"Export failed: {error}", parent=report_window)
+
+            def cancel():
+                task.cancel()
+                export_finished("Cancelled")
+
+            export_btn.state(["disabled"])
+            progress_bar.configure(value=0)
+            task = tasks.submit(work, done, failed, owner=report_window, name=f"export_{report}_report",
+                                on_progress=progress)
+            cancel_btn.configure(command=cancel)
+            cancel_btn.state(["!disabled"])
+
+        prev_btn.configure(command=lambda: go(state["page"] - 1))
+        next_btn.configure(command=lambda: go(state["page"] + 1))
+        export_btn.configure(command=export)
+        render(0, docs, next_after)
+
+    tasks.submit(lambda: fetch(0), first_page, name=f"{report}_report")
+
+def generate_criminal_report():
+    show_report("criminals", empty_message="No criminals found.")
+
+def generate_case_report():
+    show_report("cases", empty_message="No cases found.")
+
+def generate_closed_case_report():
+    show_report("closed_cases", empty_message="No closed cases found.", default_format="pdf")
+
+def generate_officer_report():
+    def show(summaries):
+        if not summaries:
+            messagebox.showinfo("Report", "No officer assignments found.")
+            return
+
+        report_window = tk.Toplevel(root)
+        report_window.title("Officer Report")
+        report_text = tk.Text(report_window, width=80, height=30, wrap="word")
+        report_text.insert("end", "Officer Report:\n\n")
+        for summary in summaries:
+            report_text.insert("end", format_officer(summary))
+        report_text.configure(state="disabled")
+        report_text.pack(fill="both", expand=True, padx=10, pady=10)
+
+    tasks.submit(service.reports.officer_report, show, name="generate_officer_report")
+
+def reports_legal_menu():
+    window = tk.Toplevel(root)
+    window.title("Reports & Legal")
+    options = [
+        ("Generate Criminal Report", generate_criminal_report),
+        ("Generate Case Report", generate_case_report),
+        ("Generate Closed Case Report (PDF)", generate_closed_case_report),
+        ("Generate Officer Report", generate_officer_report),
+    ]
+    for text, cmd in options:
+        tk.Button(window, text=text, width=30, command=cmd).pack(pady=5)
+
+DASHBOARD_TOP_OFFICERS = 20
+
+def analytics_dashboard():
+    window = tk.Toplevel(root)
+    window.title("Data Analysis")
+    window.geometry("900x600")
+
+    summary_label = ttk.Label(window, font=("Arial", 11))
+    summary_label.pack(anchor="w", padx=10, pady=5)
+
+    grid = ttk.Frame(window)
+    grid.pack(fill="both", expand=True, padx=5)
+    tables = {}
+    panels = [
+        ("crime", "Criminals by crime"), ("status", "Criminals by status"), ("gender", "Criminals by gender"),
+        ("age_band", "Criminals by age band"), ("case_status", "Cases by status"), ("workload", "Officer workload"),
+    ]
+    for index, (key, heading) in enumerate(panels):
+        frame = ttk.LabelFrame(grid, text=heading)
+        frame.grid(row=index // 3, column=index % 3, sticky="nsew", padx=5, pady=5)
+        tree = ttk.Treeview(frame, columns=("value", "count"), show="headings", height=8)
+        tree.heading("value", text="value")
+        tree.heading("count", text="count")
+        tree.column("value", width=160)
+        tree.column("count", width=70, anchor="e")
+        tree.pack(fill="both", expand=True)
+        tables[key] = tree
+    for column in range(3):
+        grid.columnconfigure(column, weight=1)
+
+    def fill(key, counts, limit=None):
+        tree = tables[key]
+        tree.delete(*tree.get_children())
+        for value, count in sorted((counts or {}).items(), key=lambda item: item[1], reverse=True)[:limit]:
+            if count:
+                tree.insert("", "end", values=(value, count))
+
+    def show(summary):
+        criminals, cases, officers = summary["criminals"], summary["cases"], summary["officers"]
+        if not criminals and not cases and not officers:
+            summary_label.configure(text="No statistics yet; press Rebuild to compute them.")
+        else:
+            total_cases = cases.get("total", 0)
+            closed_share = 100 * cases.get("closed", 0) / total_cases if total_cases else 0
+            summary_label.configure(text=(
+                f"Criminals: {criminals.get('total', 0)}    Cases: {total_cases} "
+                f"(open {cases.get('open', 0)}, closed {cases.get('closed', 0)}, {closed_share:.0f}% closed)    "
+                f"Assignments: {officers.get('total', 0)} across {len(officers.get('workload', {}))} officers"))
+        for dimension in ("crime", "status", "gender", "age_band"):
+            fill(dimension, criminals.get(dimension))
+        fill("case_status", cases.get("status"))
+        fill("workload", officers.get("workload"), DASHBOARD_TOP_OFFICERS)
+
+    buttons = ttk.Frame(window)
+    buttons.pack(fill="x", padx=10, pady=5)
+    ttk.Button(buttons, text="Refresh", command=lambda: tasks.submit(
+        service.stats.summary, show, owner=window, name="analytics_dashboard")).pack(side="left")
+    ttk.Button(buttons, text="Rebuild", command=lambda: tasks.submit(
+        service.stats.rebuild, show, owner=window, name="rebuild_stats")).pack(side="left", padx=5)
+
+    # Three small summary documents, kept current as records are written
+    tasks.submit(service.stats.summary, show, owner=window, name="analytics_dashboard")
+
+PERFORMANCE_REFRESH_MS = 2000
+
+def performance_panel():
+    window = tk.Toplevel(root)
+    window.title("Performance")
+    window.geometry("900x700")
+
+    columns = ("handler", "commands", "total_ms", "mean_ms", "max_ms", "kb_returned", "chunk_reads", "failures",
+               "retries")
+    handler_tree = ttk.Treeview(window, columns=columns, show="headings", height=12)
+    for col in columns:
+        handler_tree.heading(col, text=col)
+        handler_tree.column(col, width=150 if col == "handler" else 80, anchor="w" if col == "handler" else "e")
+    handler_tree.pack(fill="both", expand=True, padx=5, pady=5)
+
+    ttk.Label(window, text="Slowest recent commands").pack(anchor="w", padx=5)
+    slow_columns = ("handler", "command", "namespace", "ms")
+    slow_tree = ttk.Treeview(window, columns=slow_columns, show="headings", height=8)
+    for col in slow_columns:
+        slow_tree.heading(col, text=col)
+    slow_tree.pack(fill="both", expand=True, padx=5, pady=5)
+
+    ttk.Label(window, text="Record caches").pack(anchor="w", padx=5)
+    cache_columns = ("cache", "entries", "hits", "misses", "hit_rate", "revalidations", "stale", "invalidations",
+                     "evictions")
+    cache_tree = ttk.Treeview(window, columns=cache_columns, show="headings", height=3)
+    for col in cache_columns:
+        cache_tree.heading(col, text=col)
+        cache_tree.column(col, width=80, anchor="w" if col == "cache" else "e")
+    cache_tree.pack(fill="x", padx=5, pady=5)
+
+    ttk.Label(window, text="Connection pools").pack(anchor="w", padx=5)
+    pool_columns = ("pool", "open", "in_use", "max_in_use", "checkouts", "mean_wait_ms", "max_wait_ms",
+                    "checkout_failures", "clears")
+    pool_tree = ttk.Treeview(window, columns=pool_columns, show="headings", height=3)
+    for col in pool_columns:
+        pool_tree.heading(col, text=col)
+        pool_tree.column(col, width=120 if col == "pool" else 80, anchor="w" if col == "pool" else "e")
+    pool_tree.pack(fill="x", padx=5, pady=5)
+
+    def show(snapshot):
+        handler_tree.delete(*handler_tree.get_children())
+        for name, stats in snapshot["handlers"].items():
+            handler_tree.insert("", "end", values=(
+                name, stats["commands"], f"{stats['total_ms']:.1f}", f"{stats['mean_ms']:.2f}",
+                f"{stats['max_ms']:.1f}", f"{stats['bytes_returned'] / 1024:.1f}", stats["chunk_reads"],
+                stats["failures"], stats.get("retries", 0)))
+        slow_tree.delete(*slow_tree.get_children())
+        for entry in sorted(snapshot["slow"], key=lambda entry: entry["ms"], reverse=True):
+            slow_tree.insert("", "end", values=(entry["handler"], entry["command"], entry["namespace"],
+                                                f"{entry['ms']:.1f}"))
+        cache_tree.delete(*cache_tree.get_children())
+        for name, stats in snapshot.get("caches", {}).items():
+            lookups = stats["hits"] + stats["revalidations"] + stats["misses"]
+            hit_rate = (stats["hits"] + stats["revalidations"]) / lookups if lookups else 0
+            cache_tree.insert("", "end", values=(
+                name, stats["entries"], stats["hits"], stats["misses"], f"{hit_rate:.0%}", stats["revalidations"],
+                stats["stale"], stats["invalidations"], stats["evictions"]))
+        pool_tree.delete(*pool_tree.get_children())
+        for address, stats in snapshot.get("pools", {}).items():
+            pool_tree.insert("", "end", values=(
+                address, stats["open"], stats["in_use"], stats["max_in_use"], stats["checkouts"],
+                f"{stats['mean_wait_ms']:.2f}", f"{stats['max_wait_ms']:.1f}", stats["checkout_failures"],
+                stats["clears"]))
+
+    def load():
+        # A failed poll is simply retried on the next refresh
+        tasks.submit(service.metrics, show, lambda error: None, owner=window, name="performance", db=False)
+
+    def refresh():
+        if window.winfo_exists():
+            load()
+            window.after(PERFORMANCE_REFRESH_MS, refresh)
+
+    def export():
+        path = filedialog.asksaveasfilename(parent=window, defaultextension=".json",
+                                            filetypes=[("JSON", "*.json"), ("Prometheus text", "*.prom")])
+        if path:
+            tasks.submit(lambda: export_snapshot(service.metrics(), path),
+                         lambda result: messagebox.showinfo("Performance", f"Metrics written to {path}",
+                                                            parent=window),
+                         owner=window, name="export_metrics", db=False)
+
+    def reset():
+        tasks.submit(service.reset_metrics, lambda result: load(), owner=window, name="reset_metrics", db=False)
+
+    buttons = ttk.Frame(window)
+    buttons.pack(fill="x", padx=5, pady=5)
+    ttk.Button(buttons, text="Export...", command=export).pack(side="left")
+    ttk.Button(buttons, text="Reset", command=reset).pack(side="left", padx=5)
+
+    refresh()
+
+CONNECTION_CHECK_MS = 30000
+CONNECTION_RETRY_MS = 5000
+startup_marks = []
+
+def mark_startup(phase):
+    startup_marks.append((phase, time.perf_counter()))
+
+def report_startup():
+    print(f"{'phase':<20}{'took ms':>10}{'at ms':>10}")
+    previous = STARTED_AT
+    for phase, at in startup_marks:
+        print(f"{phase:<20}{(at - previous) * 1000:>10.1f}{(at - STARTED_AT) * 1000:>10.1f}")
+        previous = at
+
+def watch_connection(label, on_connected=None, on_first_check=None):
+    # Warms the connection up in the background, then re-checks it periodically
+    state = {"connected": False, "checked": False}
+
+    def checked(ms, error=None):
+        if error is None:
+            label.configure(text=f"Database: connected ({ms:.0f} ms)", foreground="dark green")
+        else:
+            label.configure(text=f"Database: unreachable ({type(error).__name__}), retrying...", foreground="red")
+        if error is None and not state["connected"]:
+            state["connected"] = True
+            if on_connected:
+                on_connected()
+        if not state["checked"]:
+            state["checked"] = True
+            if on_first_check:
+                on_first_check(error)
+        root.after(CONNECTION_RETRY_MS if error else CONNECTION_CHECK_MS, check)
+
+    def check():
+        # Not a query slot: the check must not queue behind slow work
+        tasks.submit(service.ping, checked, lambda error: checked(None, error), name="connection_check", db=False)
+
+    check()
+
+def main_menu():
+    tk.Label(root, text="Crime Analysis System", font=("Arial", 18)).pack(pady=20)
+    tk.Button(root, text="Criminal Management", width=30, command=criminal_menu).pack(pady=10)
+    tk.Button(root, text="Case Management", width=30, command=case_menu).pack(pady=10)
+    tk.Button(root, text="Victim & Witness Management", width=30, command=victim_witness_menu).pack(pady=10)
+    tk.Button(root, text="Evidence Management", width=30, command=evidence_menu).pack(pady=10)
+    tk.Button(root, text="Officer Assignment", width=30, command=officer_assignment_menu).pack(pady=10)
+    tk.Button(root, text="Reports & Legal", width=30, command=reports_legal_menu).pack(pady=10)
+    tk.Button(root, text="Data Analysis", width=30, command=analytics_dashboard).pack(pady=10)
+    tk.Button(root, text="Performance", width=30, command=performance_panel).pack(pady=10)
+    tk.Button(root, text="Exit", width=30, command=root.quit).pack(pady=10)
+    connection_label = ttk.Label(root, text="Database: connecting...")
+    connection_label.pack(side="bottom", anchor="w", padx=5)
+    tasks.attach_status(root).pack(side="bottom", fill="x")
+    return connection_label
+
+def report_schema(summary):
+    if summary["missing_indexes"] or summary["collection_scans"]:
+        logger.warning("Schema version %d has problems: %s", summary["version"], summary)
+
+def main(argv=None):
+    global service, thumbnail_cache, root, tasks
+    parser = argparse.ArgumentParser(description="Crime Analysis System")
+    parser.add_argument("--server", help="URL of a shared server.py instead of connecting to MongoDB directly")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Report how long each startup phase takes, then exit")
+    args = parser.parse_args(argv)
+    mark_startup("imports")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    root = tk.Tk()
+    root.title("Crime Analysis System")
+    root.geometry("600x450")
+    tasks = TaskRunner(root, describe_error=describe_error)
+    mark_startup("tk")
+
+    # Neither opens a connection here; the first check below does, off the UI thread
+    if args.server:
+        from remote import RemoteService
+        service = RemoteService(args.server, token=load_settings()["server_token"])
+    else:
+        service = CrimeService.connect()
+    thumbnail_cache = ThumbnailCache(service.biometrics.thumbnail)
+    mark_startup("service")
+
+    connection_label = main_menu()
+    root.update()
+    mark_startup("menu shown")
+
+    def first_check(error):
+        mark_startup("connected" if error is None else "unreachable")
+        if args.profile_startup:
+            report_startup()
+            root.quit()
+
+    def connected():
+        if not args.server and not args.profile_startup:
+            tasks.submit(service.bootstrap, report_schema, name="bootstrap_schema")
+
+    watch_connection(connection_label, connected, first_check)
+    root.mainloop()
+    tasks.shutdown()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,262 @@
+"""Reclaiming GridFS storage no record refers to any more.
+
+Files are referenced by ``FILE_REFERENCES``; thumbnail sidecars (``fs.files``
+documents with ``thumbnail_of``) are also kept for as long as their original
+is, since deduplicated uploads reuse them. Uploads are deduplicated by
+content, so one file can back several records and is only deleted once the
+last of them is gone.
+
+``release_files`` is called by the delete and update handlers for the files
+they stopped referencing. It decrements each file's reference count
+(``uploads.REFS_FIELD``) and deletes the files left with none, unless a
+record still refers to them: counts written before they were kept, or
+records saved behind the repositories' backs, can only make it keep a file
+too long, never delete one in use. A file is only deleted if its count is
+still the one that was read, so one an upload has just taken a reference to
+stays.
+
+``collect_orphans`` sweeps the whole store for anything those missed: files
+written before deletes cascaded, uploads whose record was never saved, and
+chunks left by interrupted uploads. It walks ``fs.files`` in ``_id`` order a
+batch at a time and takes the set difference against the indexed reference
+fields, so memory stays bounded by the batch.
+
+Usage:
+    python orphans.py              report what would be reclaimed
+    python orphans.py --delete     reclaim it
+"""
+import argparse
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from bson.objectid import ObjectId
+
+from paging import fetch_page
+from uploads import REFS_FIELD
+
+logger = logging.getLogger(__name__)
+
+# (collection, field) pairs holding GridFS file ids; each field is indexed (schema.FILE_REFERENCE_INDEXES)
+CONTENT_REFERENCES = [("evidence", "file_id"), ("biometric_data", "file_id")]
+THUMBNAIL_REFERENCES = [("biometric_data", "thumb_id")]
+FILE_REFERENCES = CONTENT_REFERENCES + THUMBNAIL_REFERENCES
+GC_BATCH_SIZE = 1000
+# Files younger than this may belong to an upload whose record has not been saved yet
+GC_GRACE_SECONDS = 3600
+GC_INTERVAL_SECONDS = 6 * 3600
+
+
+def referenced_ids(db, file_ids):
+    """The subset of ``file_ids`` that some record references."""
+    file_ids = list(file_ids)
+    referenced = set()
+    for collection, field in FILE_REFERENCES:
+        referenced.update(db[collection].distinct(field, {field: {"$in": file_ids}}))
+    return referenced
+
+
+def reference_counts(db, file_ids):
+    """``Counter`` of the records referring to each of ``file_ids``, by one indexed aggregation per field.
+
+    Thumbnail sidecars are not counted; they are kept for as long as their original is.
+    """
+    file_ids = list(file_ids)
+    counts = Counter()
+    for collection, field in CONTENT_REFERENCES:
+        for row in db[collection].aggregate([{"$match": {field: {"$in": file_ids}}},
+                                             {"$group": {"_id": f"${field}", "refs": {"$sum": 1}}}]):
+            counts[row["_id"]] += row["refs"]
+    return counts
+
+
+def _refs(file):
+    return (file.get("metadata") or {}).get("refs")
+
+
+def _live(db, files):
+    # ids of the given fs.files documents that are still needed
+    ids = {file["_id"] for file in files}
+    originals = {file["_id"]: file["thumbnail_of"] for file in files if file.get("thumbnail_of")}
+    live = referenced_ids(db, ids | set(originals.values()))
+    live |= {sidecar for sidecar, original in originals.items() if original in live}
+    return live
+
+
+def _delete(db, files):
+    # Originals go only if their reference count is unchanged since it was read, and sidecars only with them.
+    # The files documents go first, so a download started meanwhile fails cleanly instead of reading half a file.
+    if not files:
+        return {"files": 0, "chunks": 0, "bytes": 0}
+    fs_files = db["fs.files"]
+    originals = [file for file in files if not file.get("thumbnail_of")]
+    if originals:
+        fs_files.delete_many({"$or": [{"_id": file["_id"], REFS_FIELD: _refs(file)} for file in originals]})
+    kept = set(fs_files.distinct("_id", {"_id": {"$in": [file["_id"] for file in originals]}})) if originals else set()
+    sidecars = [file["_id"] for file in files if file.get("thumbnail_of") and file["thumbnail_of"] not in kept]
+    if sidecars:
+        fs_files.delete_many({"_id": {"$in": sidecars}})
+    deleted = [file for file in files if file["_id"] not in kept and (not file.get("thumbnail_of")
+                                                                     or file["thumbnail_of"] not in kept)]
+    ids = [file["_id"] for file in deleted]
+    chunks = db["fs.chunks"].delete_many({"files_id": {"$in": ids}}).deleted_count if ids else 0
+    return {"files": len(deleted), "chunks": chunks, "bytes": sum(file.get("length", 0) for file in deleted)}
+
+
+def release_files(db, file_ids):
+    """Drop a reference to each of ``file_ids`` and delete the files left with none, with their thumbnail sidecars.
+
+    An id given more than once drops as many references. Returns
+    ``{"files", "chunks", "bytes"}`` deleted.
+    """
+    counts = Counter(file_id for file_id in file_ids if file_id is not None)
+    if not counts:
+        return _delete(db, [])
+    by_count = {}
+    for file_id, count in counts.items():
+        by_count.setdefault(count, []).append(file_id)
+    for count, ids in by_count.items():
+        db["fs.files"].update_many({"_id": {"$in": ids}, "thumbnail_of": {"$exists": False}},
+                                   {"$inc": {REFS_FIELD: -count}})
+    projection = {"length": 1, "thumbnail_of": 1, REFS_FIELD: 1}
+    unreferenced = list(db["fs.files"].find({"_id": {"$in": list(counts)}, REFS_FIELD: {"$not": {"$gt": 0}},
+                                             "thumbnail_of": {"$exists": False}}, projection))
+    if not unreferenced:
+        return _delete(db, [])
+    sidecars = db["fs.files"].find({"thumbnail_of": {"$in": [file["_id"] for file in unreferenced]}}, projection)
+    candidates = unreferenced + list(sidecars)
+    live = _live(db, candidates)
+    released = _delete(db, [file for file in candidates if file["_id"] not in live])
+    if released["files"]:
+        logger.info("Released %d files (%d bytes)", released["files"], released["bytes"])
+    return released
+
+
+def collect_orphans(db, delete=False, batch_size=GC_BATCH_SIZE, grace_seconds=GC_GRACE_SECONDS,
+                    progress=None, check=None):
+    """Find, and with ``delete`` remove, GridFS files and chunks no record needs.
+
+    Returns a report of what was scanned and found (and deleted), with the
+    sweep's throughput. ``progress(done, total)`` is called after each batch
+    of files; ``check()`` may raise to stop between batches.
+    """
+    started = time.perf_counter()
+    # uploadDate is stored as naive UTC
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=grace_seconds)
+    report = {"dry_run": not delete, "files_scanned": 0, "bytes_scanned": 0, "orphan_files": 0, "orphan_bytes": 0,
+              "orphan_chunk_sets": 0, "orphan_chunks": 0, "deleted_files": 0, "deleted_chunks": 0}
+    files = db["fs.files"]
+    total = files.estimated_document_count()
+
+    after = None
+    while True:
+        if check:
+            check()
+        page, after = fetch_page(files, "_id", after=after, limit=batch_size,
+                                 projection={"length": 1, "uploadDate": 1, "thumbnail_of": 1, REFS_FIELD: 1})
+        live = _live(db, page) if page else set()
+        orphans = [file for file in page
+                   if file["_id"] not in live and file.get("uploadDate") and file["uploadDate"] < cutoff]
+        report["files_scanned"] += len(page)
+        report["bytes_scanned"] += sum(file.get("length", 0) for file in page)
+        report["orphan_files"] += len(orphans)
+        report["orphan_bytes"] += sum(file.get("length", 0) for file in orphans)
+        if delete:
+            deleted = _delete(db, orphans)
+            report["deleted_files"] += deleted["files"]
+            report["deleted_chunks"] += deleted["chunks"]
+        if progress:
+            progress(report["files_scanned"], total)
+        if after is None:
+            break
+
+    # Chunks whose files document is gone: interrupted uploads and half-finished deletes.
+    # $sort then $group on files_id is answered by a distinct scan of the (files_id, n) index.
+    chunk_owners = db["fs.chunks"].aggregate([
+        {"$match": {"files_id": {"$lt": ObjectId.from_datetime(cutoff.replace(tzinfo=timezone.utc))}}},
+        {"$sort": {"files_id": 1}},
+        {"$group": {"_id": "$files_id"}},
+    ], allowDiskUse=True, batchSize=batch_size)
+    batch = []
+    for owner in chunk_owners:
+        batch.append(owner["_id"])
+        if len(batch) >= batch_size:
+            _collect_chunks(db, batch, delete, report)
+            batch = []
+            if check:
+                check()
+    if batch:
+        _collect_chunks(db, batch, delete, report)
+
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    report["files_per_second"] = round(report["files_scanned"] / report["seconds"], 1) if report["seconds"] else 0.0
+    report["mb_scanned_per_second"] = (round(report["bytes_scanned"] / 2 ** 20 / report["seconds"], 1)
+                                       if report["seconds"] else 0.0)
+    logger.info("Orphan collection %s: %s", "deleted" if delete else "dry run", report)
+    return report
+
+
+def _collect_chunks(db, files_ids, delete, report):
+    existing = {file["_id"] for file in db["fs.files"].find({"_id": {"$in": files_ids}}, {"_id": 1})}
+    missing = [files_id for files_id in files_ids if files_id not in existing]
+    if not missing:
+        return
+    report["orphan_chunk_sets"] += len(missing)
+    if delete:
+        deleted = db["fs.chunks"].delete_many({"files_id": {"$in": missing}}).deleted_count
+        report["orphan_chunks"] += deleted
+        report["deleted_chunks"] += deleted
+    else:
+        report["orphan_chunks"] += db["fs.chunks"].count_documents({"files_id": {"$in": missing}})
+
+
+class OrphanCollector:
+    """Runs ``collect_orphans`` with ``delete`` every ``interval`` seconds on a daemon thread."""
+
+    def __init__(self, db, interval=GC_INTERVAL_SECONDS, **options):
+        self.db = db
+        self.interval = interval
+        self.options = options
+        self.last_report = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="orphan-collector", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.last_report = collect_orphans(self.db, delete=True, **self.options)
+            except Exception:
+                logger.exception("Orphan collection failed")
+
+
+def main(argv=None):
+    from services import CrimeService
+
+    parser = argparse.ArgumentParser(description="Reclaim GridFS storage no record refers to")
+    parser.add_argument("--delete", action="store_true", help="delete the orphans instead of only reporting them")
+    parser.add_argument("--batch-size", type=int, default=GC_BATCH_SIZE)
+    parser.add_argument("--grace-seconds", type=int, default=GC_GRACE_SECONDS,
+                        help="leave files younger than this alone")
+    parser.add_argument("--uri", help="default from the connection settings")
+    parser.add_argument("--database", help="default from the connection settings")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    service = CrimeService.connect(args.uri, args.database)
+    report = service.storage.collect_orphans(args.delete, args.batch_size, args.grace_seconds)
+    for key, value in report.items():
+        print(f"{key:<24}{value}")
+
+
+if __name__ == "__main__":
+    main()
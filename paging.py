@@ -0,0 +1,83 @@
+"""Keyset pagination helpers.
+
+Pages are fetched with a range query on an indexed key (``$gt`` the last key
+of the previous page) instead of ``skip()``, so the cost of fetching a page
+does not grow with how far into the collection the user has scrolled.
+"""
+import re
+
+
+def fetch_page(collection, key, after=None, limit=50, query=None, projection=None):
+    """Return ``(docs, next_after)`` for the page following ``after``.
+
+    ``next_after`` is the key of the last document on the page, or ``None``
+    when the collection has no more documents.
+    """
+    conditions = [query] if query else []
+    if after is not None:
+        conditions.append({key: {"$gt": after}})
+    if not conditions:
+        filt = {}
+    elif len(conditions) == 1:
+        filt = conditions[0]
+    else:
+        filt = {"$and": conditions}
+
+    docs = list(collection.find(filt, projection).sort(key, 1).limit(limit))
+    next_after = docs[-1].get(key) if len(docs) == limit else None
+    return docs, next_after
+
+
+def fetch_sorted_page(collection, key, direction=1, after=None, limit=50, query=None, projection=None):
+    """Like ``fetch_page`` for a key that need not be unique, in either direction.
+
+    Ties are broken by ``_id``, so pages are stable; an index on ``(key, _id)``
+    answers both directions. ``after`` and ``next_after`` are ``(value, _id)``
+    pairs. Missing values sort first ascending and last descending, as in MongoDB.
+    """
+    conditions = [query] if query else []
+    if after is not None:
+        value, last_id = after
+        beyond = "$gt" if direction == 1 else "$lt"
+        if value is None:
+            alternatives = [{key: None, "_id": {beyond: last_id}}]
+            if direction == 1:
+                alternatives.append({key: {"$ne": None}})
+        else:
+            alternatives = [{key: {beyond: value}}, {key: value, "_id": {beyond: last_id}}]
+            if direction == -1:
+                alternatives.append({key: None})
+        conditions.append({"$or": alternatives})
+    if not conditions:
+        filt = {}
+    elif len(conditions) == 1:
+        filt = conditions[0]
+    else:
+        filt = {"$and": conditions}
+
+    docs = list(collection.find(filt, projection).sort([(key, direction), ("_id", direction)]).limit(limit))
+    next_after = (docs[-1].get(key), docs[-1]["_id"]) if len(docs) == limit else None
+    return docs, next_after
+
+
+def prefix_variants(prefix):
+    """The forms of a filter prefix that match: as typed, upper or lower case, or capitalised.
+
+    Each one stays an anchored, indexed range; a blank prefix has none.
+    """
+    prefix = (prefix or "").strip()
+    return {prefix, prefix.upper(), prefix.lower(), prefix.capitalize()} if prefix else set()
+
+
+def prefix_query(column, prefix):
+    """Query condition for ``prefix`` on ``column``, or None for a blank prefix."""
+    variants = prefix_variants(prefix)
+    if not variants:
+        return None
+    return {column: {"$in": [re.compile(f"^{re.escape(variant)}") for variant in sorted(variants)]}}
+
+
+def matches_prefix(value, prefix):
+    """Whether ``prefix_query`` would match ``value``, for documents that did not come from the query."""
+    variants = prefix_variants(prefix)
+    return not variants or (isinstance(value, str) and value.startswith(tuple(variants)))
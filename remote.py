@@ -0,0 +1,283 @@
+"""Client for ``server.py`` with the same repository interface as ``CrimeService``.
+
+``RemoteService(url).criminals.search("smith")`` sends the call to the shared
+server and returns the same values the local service would. Each worker
+thread keeps its own persistent HTTP connection. ``token`` is the server's
+shared ``server_token``, sent with every request.
+"""
+import http.client
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlencode, urlsplit
+
+from bson import json_util
+
+from changes import LONG_POLL_SECONDS, RETRY_SECONDS, ChangeBus
+from dedupe import DEDUPE_BATCH_SIZE, DEDUPE_WORKERS
+from instrumentation import current_handler, tagged
+from orphans import GC_BATCH_SIZE, GC_GRACE_SECONDS
+from services import RPC_TARGETS
+from uploads import DEFAULT_CHUNK_SIZE, DEFAULT_CONCURRENCY, UploadResult
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 60
+
+
+class RemoteError(Exception):
+    pass
+
+
+class Connection:
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT, token=None):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port
+        self.https = parts.scheme == "https"
+        self.timeout = timeout
+        self.token = token
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = self._local.conn = conn_class(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def reset(self):
+        """Drop this thread's keep-alive connection so the next call reconnects."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        """Send a request and return the open response; the caller must read it fully."""
+        conn = self._connection()
+        headers = dict(headers or {})
+        # Lets the server attribute its queries to the handler that made the call
+        headers["X-Handler"] = current_handler()
+        if self.token is not None:
+            headers["Authorization"] = f"Bearer {self.token}"
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            self.reset()
+            raise
+        if response.status != 200:
+            payload = response.read()
+            try:
+                message = json_util.loads(payload)["error"]
+            except (ValueError, KeyError):
+                message = payload.decode("utf-8", "replace")
+            raise RemoteError(message)
+        return response
+
+    def call(self, method, path, body=None, headers=None):
+        response = self.request(method, path, body, headers)
+        return json_util.loads(response.read())["result"]
+
+
+class RemoteRepository:
+    def __init__(self, connection, name, methods):
+        self.connection = connection
+        self.name = name
+        self.methods = methods
+
+    def _call(self, method, *args, **kwargs):
+        body = json_util.dumps({"args": args, "kwargs": kwargs}).encode("utf-8")
+        return self.connection.call("POST", f"/rpc/{self.name}/{method}", body,
+                                    {"Content-Type": "application/json"})
+
+    def __getattr__(self, method):
+        if method not in self.methods:
+            raise AttributeError(f"{self.name} has no remote method {method}")
+
+        def call(*args, **kwargs):
+            return self._call(method, *args, **kwargs)
+        call.__name__ = method
+        return call
+
+
+class RemoteFiles:
+    def __init__(self, connection, chunk_size=DEFAULT_CHUNK_SIZE, concurrency=DEFAULT_CONCURRENCY):
+        self.connection = connection
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+
+    def upload_file(self, path, metadata=None, on_chunk=None, check=None):
+        """Stream a local file to the server's GridFS; returns an UploadResult."""
+        result = UploadResult(path)
+        query = {"filename": result.filename}
+        if metadata:
+            query["metadata"] = json_util.dumps(metadata)
+
+        def chunks(f):
+            sent = 0
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                if check:
+                    check()
+                sent += len(chunk)
+                yield chunk
+                if on_chunk:
+                    on_chunk(sent)
+
+        try:
+            size = os.path.getsize(path)
+            with open(path, "rb") as f:
+                uploaded = self.connection.call("POST", f"/files?{urlencode(query)}", chunks(f),
+                                                {"Content-Length": str(size),
+                                                 "Content-Type": "application/octet-stream"})
+            for field, value in uploaded.items():
+                setattr(result, field, value)
+        except Exception as e:
+            result.error = e
+        return result
+
+    def upload_many(self, paths, metadata=None, on_progress=None, check=None):
+        sizes = {path: os.path.getsize(path) for path in paths}
+        sent = {path: 0 for path in paths}
+        lock = threading.Lock()
+
+        def report(path, length):
+            with lock:
+                sent[path] = length
+                snapshot = {p: (sent[p], sizes[p]) for p in paths}
+            if on_progress:
+                on_progress(snapshot)
+
+        handler = current_handler()
+
+        def upload(path):
+            with tagged(handler):
+                return self.upload_file(path, metadata, on_chunk=lambda length: report(path, length), check=check)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="remote-upload") as pool:
+            return list(pool.map(upload, paths))
+
+    def download(self, file_id, path, on_chunk=None, check=None):
+        """Download a stored file into ``path``; returns its length."""
+        response = self.connection.request("GET", f"/files/{quote(str(file_id))}")
+        part_path = f"{path}.part"
+        received = 0
+        try:
+            with open(part_path, "wb") as f:
+                for chunk in iter(lambda: response.read(self.chunk_size), b""):
+                    if check:
+                        check()
+                    f.write(chunk)
+                    received += len(chunk)
+                    if on_chunk:
+                        on_chunk(received)
+            os.replace(part_path, path)
+        except BaseException:
+            # A partly read response leaves the keep-alive connection unusable
+            self.connection.reset()
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        return received
+
+
+class RemoteReports(RemoteRepository):
+    def export(self, name, fmt, path, progress=None, check=None):
+        """Download a report export into ``path``; returns the number of records."""
+        response = self.connection.request("GET", f"/reports/{quote(name)}.{quote(fmt)}")
+        total = int(response.getheader("Content-Length", 0))
+        part_path = f"{path}.part"
+        try:
+            received = 0
+            with open(part_path, "wb") as f:
+                for chunk in iter(lambda: response.read(DEFAULT_CHUNK_SIZE), b""):
+                    if check:
+                        check()
+                    f.write(chunk)
+                    received += len(chunk)
+                    if progress:
+                        progress(received, total)
+            os.replace(part_path, path)
+        except BaseException:
+            # A partly read response leaves the keep-alive connection unusable
+            self.connection.reset()
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        return int(response.getheader("X-Record-Count", 0))
+
+
+class RemoteStorage(RemoteRepository):
+    """Storage maintenance runs on the server, which cannot report progress or be cancelled once started."""
+
+    def collect_orphans(self, delete=False, batch_size=GC_BATCH_SIZE, grace_seconds=GC_GRACE_SECONDS,
+                        progress=None, check=None):
+        if check:
+            check()
+        return self._call("collect_orphans", delete, batch_size, grace_seconds)
+
+    def deduplicate(self, workers=DEDUPE_WORKERS, batch_size=DEDUPE_BATCH_SIZE, check=None):
+        if check:
+            check()
+        return self._call("deduplicate", workers, batch_size)
+
+
+class RemoteChangeFeed(ChangeBus):
+    """Long-polls the server's ``/changes`` and delivers the events to local subscribers."""
+
+    def __init__(self, connection):
+        super().__init__()
+        self.connection = connection
+        self._poller = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._poller is not None:
+                return
+            self._poller = threading.Thread(target=self._poll, name="remote-changes", daemon=True)
+        self._poller.start()
+
+    def _poll(self):
+        seq = None
+        while True:
+            path = "/changes" if seq is None else f"/changes?after={seq}&timeout={LONG_POLL_SECONDS}"
+            try:
+                feed = json_util.loads(self.connection.request("GET", path).read())
+            except Exception as e:
+                logger.warning("Polling for changes failed, retrying: %s", e)
+                time.sleep(RETRY_SECONDS)
+                continue
+            seq = feed["seq"]
+            for event in feed["events"]:
+                self._dispatch(event)
+
+
+class RemoteService:
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT, token=None):
+        self.connection = Connection(url, timeout, token)
+        for name, target_class in RPC_TARGETS.items():
+            repository_class = {"reports": RemoteReports, "storage": RemoteStorage}.get(name, RemoteRepository)
+            setattr(self, name, repository_class(self.connection, name, target_class.RPC_METHODS))
+        self.files = RemoteFiles(self.connection)
+        self.changes = RemoteChangeFeed(self.connection)
+
+    def bootstrap(self):
+        # The server bootstraps the schema when it starts
+        return None
+
+    def ping(self):
+        """Round trip through the server to its database, in milliseconds."""
+        started = time.perf_counter()
+        self.connection.call("GET", "/ping")
+        return (time.perf_counter() - started) * 1000
+
+    def metrics(self):
+        # Queries run on the server, so that is where they are measured
+        return json_util.loads(self.connection.request("GET", "/metrics.json").read())
+
+    def reset_metrics(self):
+        self.connection.request("POST", "/metrics/reset").read()
@@ -0,0 +1,232 @@
+"""Streaming report generation.
+
+Records are read through a projected cursor and written to the output file
+as they arrive, so memory use does not depend on the size of the collection.
+Reports can be exported as plain text, CSV or PDF.
+"""
+import csv
+import os
+
+CRIMINAL_FIELDS = [
+    ("Custom ID", "custom_id"),
+    ("Name", "name"),
+    ("Age", "age"),
+    ("Gender", "gender"),
+    ("Crime", "crime"),
+    ("Status", "status"),
+]
+CASE_FIELDS = [
+    ("Case ID", "case_id"),
+    ("Description", "description"),
+    ("Status", "status"),
+    ("Officer", "officer"),
+]
+CLOSED_CASES_QUERY = {"status": {"$in": ["Closed", "closed", "CLOSED"]}}
+
+REPORT_BATCH_SIZE = 1000
+PROGRESS_EVERY = 500
+
+
+def iter_records(collection, fields, query=None, sort_key=None, batch_size=REPORT_BATCH_SIZE):
+    """Yield report records from a projected cursor fetched in batches."""
+    projection = {key: 1 for _, key in fields}
+    projection["_id"] = 0
+    cursor = collection.find(query or {}, projection, batch_size=batch_size)
+    if sort_key:
+        cursor = cursor.sort(sort_key, 1)
+    yield from cursor
+
+
+def format_record(doc, fields):
+    return "".join(f"{label}: {doc.get(key, 'N/A')}\n" for label, key in fields)
+
+
+def _tracked(records, total, progress, check, counter):
+    for doc in records:
+        counter["written"] += 1
+        if counter["written"] % PROGRESS_EVERY == 0:
+            if check:
+                check()
+            if progress:
+                progress(counter["written"], total)
+        yield doc
+    if progress:
+        progress(counter["written"], total)
+
+
+def write_text(f, title, fields, records):
+    f.write(f"{title}:\n\n")
+    for doc in records:
+        f.write(format_record(doc, fields))
+        f.write("\n")
+
+
+def write_csv(f, title, fields, records):
+    writer = csv.writer(f)
+    writer.writerow([label for label, _ in fields])
+    for doc in records:
+        writer.writerow([doc.get(key, "") for _, key in fields])
+
+
+class PdfWriter:
+    """Minimal text-only PDF writer that streams one page at a time.
+
+    Only byte offsets and page object numbers are kept in memory, so the size
+    of the document does not affect memory use.
+    """
+
+    PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+    MARGIN = 50
+    FONT_SIZE = 10
+    LEADING = 13
+    LINE_CHARS = 100
+
+    CATALOG, PAGES, FONT = 1, 2, 3
+
+    def __init__(self, f):
+        self.f = f
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 4
+        self.lines = []
+        self.lines_per_page = (self.PAGE_HEIGHT - 2 * self.MARGIN) // self.LEADING
+        self.f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._object(self.FONT, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+                                b"/Encoding /WinAnsiEncoding >>")
+
+    def _object(self, number, body):
+        self.offsets[number] = self.f.tell()
+        self.f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+    @staticmethod
+    def _escape(text):
+        data = text.encode("cp1252", "replace")
+        return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+    def add_line(self, text=""):
+        # Wrap long values rather than letting them run off the page
+        for start in range(0, max(len(text), 1), self.LINE_CHARS):
+            self.lines.append(text[start:start + self.LINE_CHARS])
+            if len(self.lines) >= self.lines_per_page:
+                self._flush_page()
+
+    def _flush_page(self):
+        if not self.lines:
+            return
+        top = self.PAGE_HEIGHT - self.MARGIN
+        stream = b"BT /F1 %d Tf %d TL %d %d Td\n" % (self.FONT_SIZE, self.LEADING, self.MARGIN, top)
+        stream += b"".join(b"(" + self._escape(line) + b") Tj T*\n" for line in self.lines)
+        stream += b"ET"
+        self.lines = []
+
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self._object(content_id, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        self._object(page_id, b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] "
+                              b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+                     % (self.PAGES, self.PAGE_WIDTH, self.PAGE_HEIGHT, self.FONT, content_id))
+        self.page_ids.append(page_id)
+
+    def close(self):
+        self._flush_page()
+        if not self.page_ids:
+            self.add_line("")
+            self._flush_page()
+        kids = b" ".join(b"%d 0 R" % page_id for page_id in self.page_ids)
+        self._object(self.PAGES, b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(self.page_ids))
+        self._object(self.CATALOG, b"<< /Type /Catalog /Pages %d 0 R >>" % self.PAGES)
+
+        xref_offset = self.f.tell()
+        self.f.write(b"xref\n0 %d\n0000000000 65535 f \n" % self.next_id)
+        for number in range(1, self.next_id):
+            self.f.write(b"%010d 00000 n \n" % self.offsets[number])
+        self.f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                     % (self.next_id, self.CATALOG, xref_offset))
+
+
+def write_pdf(f, title, fields, records):
+    pdf = PdfWriter(f)
+    pdf.add_line(f"{title}:")
+    pdf.add_line()
+    for doc in records:
+        for label, key in fields:
+            pdf.add_line(f"{label}: {doc.get(key, 'N/A')}")
+        pdf.add_line()
+    pdf.close()
+
+
+# format: (writer, binary file)
+WRITERS = {
+    "txt": (write_text, False),
+    "csv": (write_csv, False),
+    "pdf": (write_pdf, True),
+}
+
+
+def export_report(path, fmt, title, fields, records, total=None, progress=None, check=None):
+    """Stream ``records`` into ``path`` and return the number written.
+
+    ``progress(done, total)`` is called periodically and ``check()`` is called
+    at the same points so a caller can abort by raising. The report is written
+    to a temporary file that only replaces ``path`` once it is complete.
+    """
+    writer, binary = WRITERS[fmt]
+    counter = {"written": 0}
+    records = _tracked(records, total, progress, check, counter)
+
+    part_path = f"{path}.part"
+    try:
+        if binary:
+            with open(part_path, "wb") as f:
+                writer(f, title, fields, records)
+        else:
+            with open(part_path, "w", encoding="utf-8", newline="") as f:
+                writer(f, title, fields, records)
+        os.replace(part_path, path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return counter["written"]
+
+
+def officer_report_pipeline(match=None):
+    """Aggregation grouping each officer's assigned cases with open/closed counts.
+
+    Run against ``officer_assignments``; the ``$lookup`` into ``cases`` is
+    answered from the unique ``case_id`` index.
+    """
+    is_closed = {"$eq": [{"$toLower": {"$ifNull": ["$case.status", ""]}}, "closed"]}
+    pipeline = [{"$match": match}] if match else []
+    pipeline += [
+        {"$lookup": {"from": "cases", "localField": "case_id", "foreignField": "case_id", "as": "case"}},
+        {"$unwind": "$case"},
+        {"$group": {
+            "_id": "$officer_id",
+            "cases": {"$push": {
+                "case_id": "$case.case_id",
+                "description": "$case.description",
+                "status": "$case.status",
+            }},
+            "open_cases": {"$sum": {"$cond": [is_closed, 0, 1]}},
+            "closed_cases": {"$sum": {"$cond": [is_closed, 1, 0]}},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+    return pipeline
+
+
+def officer_report(db, match=None, batch_size=REPORT_BATCH_SIZE):
+    """Yield one summary document per officer (see ``officer_report_pipeline``)."""
+    yield from db["officer_assignments"].aggregate(officer_report_pipeline(match), allowDiskUse=True,
+                                                   batchSize=batch_size)
+
+
+def format_officer(summary):
+    text = (f"Officer ID: {summary['_id']}\n"
+            f"Open cases: {summary['open_cases']}, Closed cases: {summary['closed_cases']}\n")
+    for case in summary["cases"]:
+        text += (f"  Assigned Case ID: {case.get('case_id')}\n"
+                 f"  Description: {case.get('description', 'N/A')}\n"
+                 f"  Status: {case.get('status', 'N/A')}\n\n")
+    return text
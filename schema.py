@@ -0,0 +1,286 @@
+"""Index bootstrap and versioned schema migrations for the crime_analysis database.
+
+``bootstrap_schema`` is run once at startup. It applies any migrations newer
+than the version recorded in the ``schema_migrations`` collection, verifies
+that every expected index exists, and explains the app's hot queries so that
+any query still answered by a collection scan is reported.
+"""
+import logging
+import re
+from datetime import datetime
+
+from pymongo import ASCENDING, TEXT, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from search import NAME_TERMS_FIELD, tokenize
+from stats import rebuild_stats
+from uploads import file_summaries
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+
+# (collection, keys, options)
+LOOKUP_INDEXES = [
+    ("criminals", [("custom_id", ASCENDING)], {"unique": True, "name": "custom_id_unique"}),
+    ("criminals", [("name", ASCENDING)], {"name": "name"}),
+    ("cases", [("case_id", ASCENDING)], {"unique": True, "name": "case_id_unique"}),
+    ("biometric_data", [("criminal_id", ASCENDING)], {"name": "criminal_id"}),
+    ("evidence", [("case_id", ASCENDING)], {"name": "case_id"}),
+    ("officer_assignments", [("case_id", ASCENDING)], {"name": "case_id"}),
+    ("officer_assignments", [("officer_id", ASCENDING)], {"name": "officer_id"}),
+    ("victims_witnesses", [("name", ASCENDING)], {"name": "name"}),
+]
+
+SEARCH_INDEXES = [
+    ("criminals", [(NAME_TERMS_FIELD, ASCENDING)], {"name": "name_terms"}),
+    ("victims_witnesses", [(NAME_TERMS_FIELD, ASCENDING)], {"name": "name_terms"}),
+    ("evidence", [("type", TEXT), ("description", TEXT), ("case_id", TEXT)],
+     {"name": "evidence_text", "weights": {"case_id": 10, "type": 5, "description": 1}}),
+]
+
+UPLOAD_INDEXES = [
+    ("fs.files", [("metadata.sha256", ASCENDING), ("length", ASCENDING)], {"name": "sha256_length"}),
+    ("fs.files", [("thumbnail_of", ASCENDING)], {"name": "thumbnail_of", "sparse": True}),
+]
+
+# Stored files are unique by content, so identical uploads racing each other share one file (uploads.UploadEngine).
+# Replaces the plain sha256_length index of UPLOAD_INDEXES once the existing duplicates are merged (dedupe.py).
+CONTENT_INDEXES = [
+    ("fs.files", [("metadata.sha256", ASCENDING), ("length", ASCENDING)],
+     {"name": "sha256_length_unique", "unique": True,
+      "partialFilterExpression": {"metadata.sha256": {"$exists": True}}}),
+]
+
+# Related criminals and victims/witnesses of a case dossier are found by crime
+DOSSIER_INDEXES = [
+    ("criminals", [("crime", ASCENDING)], {"name": "crime"}),
+    ("victims_witnesses", [("crime", ASCENDING)], {"name": "crime"}),
+]
+
+# Keyset pages of the grid views, for each column they can sort or filter by (Repository.grid_sortable)
+GRID_INDEXES = [
+    (collection, [(column, ASCENDING), ("_id", ASCENDING)], {"name": f"{column}_grid"})
+    for collection, columns in [
+        ("cases", ["case_id", "status", "officer"]),
+        ("victims_witnesses", ["name", "crime", "role"]),
+        ("evidence", ["case_id", "type"]),
+        ("officer_assignments", ["case_id", "officer_id"]),
+    ]
+    for column in columns
+]
+
+# Every field holding a GridFS file id, for reference checks before files are deleted (orphans.FILE_REFERENCES)
+FILE_REFERENCE_INDEXES = [
+    ("evidence", [("file_id", ASCENDING)], {"name": "file_id"}),
+    ("biometric_data", [("file_id", ASCENDING)], {"name": "file_id"}),
+    ("biometric_data", [("thumb_id", ASCENDING)], {"name": "thumb_id"}),
+]
+
+INDEXES = (LOOKUP_INDEXES + SEARCH_INDEXES
+           + [index for index in UPLOAD_INDEXES if index[2]["name"] != "sha256_length"] + CONTENT_INDEXES
+           + DOSSIER_INDEXES + GRID_INDEXES + FILE_REFERENCE_INDEXES)
+
+# Representative filters for the queries the handlers issue
+HOT_QUERIES = [
+    ("criminals", {"custom_id": ""}),
+    ("criminals", {"name": ""}),
+    ("cases", {"case_id": ""}),
+    ("biometric_data", {"criminal_id": {"$in": [""]}}),
+    ("evidence", {"case_id": ""}),
+    ("officer_assignments", {"case_id": ""}),
+    ("officer_assignments", {"officer_id": ""}),
+    ("victims_witnesses", {"name": ""}),
+    ("criminals", {NAME_TERMS_FIELD: {"$in": [""]}}),
+    ("victims_witnesses", {NAME_TERMS_FIELD: {"$in": [""]}}),
+    ("officer_assignments", {"$or": [{"case_id": {"$in": [re.compile("^a")]}},
+                                     {"officer_id": {"$in": [re.compile("^a")]}}]}),
+    ("criminals", {"crime": {"$in": [""]}}),
+    ("victims_witnesses", {"crime": {"$in": [""]}}),
+    ("evidence", {"file_id": {"$in": [""]}}),
+    ("biometric_data", {"file_id": {"$in": [""]}}),
+    ("biometric_data", {"thumb_id": {"$in": [""]}}),
+    ("fs.files", {"metadata.sha256": "", "length": 0}),
+]
+
+
+def create_indexes(db, indexes):
+    for collection, keys, options in indexes:
+        try:
+            db[collection].create_index(keys, **options)
+        except OperationFailure as e:
+            # Most likely duplicate keys blocking a unique index; keep starting up and report it
+            logger.error("Could not create index %s on %s: %s", options.get("name"), collection, e)
+
+
+def backfill_name_terms(collection, batch_size=1000):
+    cursor = collection.find({NAME_TERMS_FIELD: {"$exists": False}}, {"name": 1})
+    batch = []
+    for doc in cursor:
+        terms = sorted(set(tokenize(doc.get("name"))))
+        batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {NAME_TERMS_FIELD: terms}}))
+        if len(batch) >= batch_size:
+            collection.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.bulk_write(batch, ordered=False)
+
+
+def backfill_file_summaries(collection, batch_size=1000):
+    """Copy file metadata onto records that reference a GridFS file but predate storing it."""
+    cursor = collection.find({"file_id": {"$ne": None}, "file_name": {"$exists": False}}, {"file_id": 1})
+    batch = []
+
+    def flush():
+        summaries = file_summaries(collection.database, [doc["file_id"] for doc in batch])
+        updates = [UpdateOne({"_id": doc["_id"]}, {"$set": summaries[doc["file_id"]]})
+                   for doc in batch if doc["file_id"] in summaries]
+        if updates:
+            collection.bulk_write(updates, ordered=False)
+        batch.clear()
+
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+
+def _migration_1(db):
+    create_indexes(db, LOOKUP_INDEXES)
+
+
+def _migration_2(db):
+    backfill_name_terms(db["criminals"])
+    backfill_name_terms(db["victims_witnesses"])
+    create_indexes(db, SEARCH_INDEXES)
+
+
+def _migration_3(db):
+    create_indexes(db, UPLOAD_INDEXES)
+
+
+def _migration_4(db):
+    rebuild_stats(db)
+
+
+def _migration_5(db):
+    create_indexes(db, DOSSIER_INDEXES)
+
+
+def _migration_6(db):
+    create_indexes(db, GRID_INDEXES)
+
+
+def _migration_7(db):
+    backfill_file_summaries(db["evidence"])
+
+
+def _migration_8(db):
+    create_indexes(db, FILE_REFERENCE_INDEXES)
+
+
+def enforce_unique_content(db):
+    """Build the unique content index and drop the plain one it replaces; returns whether it exists."""
+    create_indexes(db, CONTENT_INDEXES)
+    indexes = db["fs.files"].index_information()
+    # Uploads still need an index to find duplicates by if the unique one could not be built
+    if "sha256_length_unique" not in indexes:
+        return False
+    if "sha256_length" in indexes:
+        db["fs.files"].drop_index("sha256_length")
+    return True
+
+
+def _migration_9(db):
+    # Merging existing duplicates streams the whole file store, so it is left to dedupe.py
+    if not enforce_unique_content(db):
+        logger.warning("Stored files hold duplicate content; run `python dedupe.py` to merge them "
+                       "and build the unique content index")
+
+
+# (version, description, function); append new migrations, never edit applied ones
+MIGRATIONS = [
+    (1, "Create lookup indexes", _migration_1),
+    (2, "Backfill name terms and create search indexes", _migration_2),
+    (3, "Index GridFS files by content hash", _migration_3),
+    (4, "Build dashboard statistics summaries", _migration_4),
+    (5, "Index criminals and victims/witnesses by crime", _migration_5),
+    (6, "Index the sortable columns of the grid views", _migration_6),
+    (7, "Store file metadata on evidence", _migration_7),
+    (8, "Index the fields referencing GridFS files", _migration_8),
+    (9, "Index stored files uniquely by content", _migration_9),
+]
+
+
+def current_version(db):
+    latest = db[MIGRATIONS_COLLECTION].find_one(sort=[("_id", -1)])
+    return latest["_id"] if latest else 0
+
+
+def run_migrations(db):
+    """Apply pending migrations in order and return the resulting version."""
+    version = current_version(db)
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        logger.info("Applying schema migration %d: %s", number, description)
+        migrate(db)
+        try:
+            db[MIGRATIONS_COLLECTION].insert_one({
+                "_id": number,
+                "description": description,
+                "applied_at": datetime.now(),
+            })
+        except DuplicateKeyError:
+            # Another workstation applied the same migration concurrently; migrations are idempotent
+            pass
+        version = number
+    return version
+
+
+def missing_indexes(db):
+    """Return the expected indexes that do not exist, as (collection, name) pairs."""
+    missing = []
+    for collection, keys, options in INDEXES:
+        if options["name"] not in db[collection].index_information():
+            missing.append((collection, options["name"]))
+    return missing
+
+
+def _plan_stages(plan):
+    yield plan.get("stage")
+    for child in ("inputStage", "queryPlan"):
+        if child in plan:
+            yield from _plan_stages(plan[child])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+def collection_scans(db, queries=HOT_QUERIES):
+    """Explain each query and return those whose winning plan is a collection scan."""
+    scans = []
+    for collection, filt in queries:
+        explain = db[collection].find(filt).explain()
+        winning = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in set(_plan_stages(winning)):
+            scans.append((collection, filt))
+    return scans
+
+
+def bootstrap_schema(db):
+    """Migrate, verify indexes and report collection scans; returns a summary dict."""
+    version = run_migrations(db)
+    missing = missing_indexes(db)
+    if missing:
+        logger.info("Recreating missing indexes: %s", missing)
+        create_indexes(db, [index for index in INDEXES if (index[0], index[2]["name"]) in missing])
+        missing = missing_indexes(db)
+    for collection, name in missing:
+        logger.warning("Index %s on %s is still missing", name, collection)
+
+    scans = collection_scans(db)
+    for collection, filt in scans:
+        logger.warning("Slow query: %s.find(%s) uses a collection scan", collection, filt)
+    return {"version": version, "missing_indexes": missing, "collection_scans": scans}
@@ -0,0 +1,195 @@
+"""Search over criminals, victims/witnesses, evidence and officer assignments.
+
+Names are tokenised into a ``name_terms`` array when a record is written, and
+that array carries a multikey index. A ``TermVocabulary`` of every distinct
+name term is kept in memory so that prefix and typo-tolerant matches can be
+expanded to exact terms before a single indexed ``$in`` query is sent.
+Evidence is searched through a MongoDB text index and assignments through
+anchored prefix regexes, both of which are answered from indexes.
+"""
+import bisect
+import re
+import threading
+import time
+import unicodedata
+
+from pymongo import DESCENDING
+from pymongo.errors import OperationFailure
+
+NAME_TERMS_FIELD = "name_terms"
+MAX_CANDIDATES = 1000
+INDEX_NOT_FOUND = 27  # server error code for a $text query without a text index
+VOCABULARY_TTL = 300  # seconds before terms written by other clients are picked up
+
+EXACT_SCORE = 3
+PREFIX_SCORE = 2
+FUZZY_SCORE = 1
+
+
+def tokenize(text):
+    """Lower-case, accent-fold and split text into search terms."""
+    folded = unicodedata.normalize("NFKD", str(text or ""))
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch)).lower()
+    return [term for term in re.split(r"[^0-9a-z]+", folded) if term]
+
+
+def with_name_terms(doc):
+    """Return ``doc`` with ``name_terms`` filled in from its ``name``."""
+    doc[NAME_TERMS_FIELD] = sorted(set(tokenize(doc.get("name"))))
+    return doc
+
+
+def _deletes(term):
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+class TermVocabulary:
+    """Distinct name terms of one collection, for prefix and fuzzy expansion.
+
+    Fuzzy matching uses single-character deletions (as in SymSpell): two
+    terms within one edit of each other share a deletion variant, so lookups
+    are hash probes rather than a scan of the vocabulary.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._terms = []
+        self._term_set = set()
+        self._deletes = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        pipeline = [
+            {"$project": {NAME_TERMS_FIELD: 1}},
+            {"$unwind": f"${NAME_TERMS_FIELD}"},
+            {"$group": {"_id": f"${NAME_TERMS_FIELD}"}},
+        ]
+        terms = [doc["_id"] for doc in self.collection.aggregate(pipeline, allowDiskUse=True)]
+        self._terms, self._term_set, self._deletes = [], set(), {}
+        self._add(terms)
+        self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > VOCABULARY_TTL:
+            self._load()
+
+    def _add(self, terms):
+        for term in terms:
+            if term in self._term_set:
+                continue
+            self._term_set.add(term)
+            bisect.insort(self._terms, term)
+            for variant in _deletes(term) | {term}:
+                self._deletes.setdefault(variant, set()).add(term)
+
+    def add(self, terms):
+        """Keep the vocabulary in sync with a write made by this process."""
+        with self._lock:
+            if self._loaded_at is not None:
+                self._add(terms)
+
+    def expand(self, term):
+        """Return ``{matching term: score}`` for exact, prefix and fuzzy matches."""
+        with self._lock:
+            self._ensure_loaded()
+            matches = {}
+            if len(term) >= 4:
+                for variant in _deletes(term) | {term}:
+                    for candidate in self._deletes.get(variant, ()):
+                        matches[candidate] = FUZZY_SCORE
+            start = bisect.bisect_left(self._terms, term)
+            for candidate in self._terms[start:start + MAX_CANDIDATES]:
+                if not candidate.startswith(term):
+                    break
+                matches[candidate] = PREFIX_SCORE
+            if term in self._term_set:
+                matches[term] = EXACT_SCORE
+            return matches
+
+
+def search_names(collection, vocabulary, query, page=0, page_size=20, projection=None):
+    """Ranked, paginated name search. Returns ``(docs, has_more)``."""
+    query_terms = tokenize(query)
+    if not query_terms:
+        return [], False
+
+    expansions = [vocabulary.expand(term) for term in query_terms]
+    all_terms = sorted({term for expansion in expansions for term in expansion})
+    if not all_terms:
+        return [], False
+
+    # Records with an exact term are fetched first, so a common name's exact hits are not crowded out
+    # by fuzzy ones; sorting by _id keeps the capped candidate set, and so the pages, stable
+    exact_terms = sorted({term for expansion in expansions for term, score in expansion.items()
+                          if score == EXACT_SCORE})
+    other_terms = sorted(set(all_terms) - set(exact_terms))
+    candidates = {}
+    for terms in (exact_terms, other_terms):
+        if not terms or len(candidates) >= MAX_CANDIDATES:
+            continue
+        cursor = (collection.find({NAME_TERMS_FIELD: {"$in": terms}}, projection)
+                  .sort("_id", 1)
+                  .limit(MAX_CANDIDATES))
+        for doc in cursor:
+            if len(candidates) >= MAX_CANDIDATES:
+                break
+            candidates.setdefault(doc["_id"], doc)
+
+    scored = []
+    for doc in candidates.values():
+        doc_terms = set(doc.get(NAME_TERMS_FIELD, []))
+        score = sum(max((s for t, s in expansion.items() if t in doc_terms), default=0)
+                    for expansion in expansions)
+        scored.append((-score, str(doc.get("name", "")), doc["_id"], doc))
+    scored.sort(key=lambda item: item[:3])
+
+    start = page * page_size
+    docs = [doc for _, _, _, doc in scored[start:start + page_size]]
+    return docs, len(scored) > start + page_size
+
+
+def search_evidence(collection, query, page=0, page_size=20, projection=None):
+    """Text-index search over evidence type, description and case ID.
+
+    Until the text index exists (it is built in the background at startup),
+    falls back to an unindexed case-insensitive substring match.
+    """
+    query = (query or "").strip()
+    if not query:
+        return [], False
+    text_projection = dict(projection or {})
+    text_projection["score"] = {"$meta": "textScore"}
+    cursor = (collection.find({"$text": {"$search": query}}, text_projection)
+              .sort([("score", {"$meta": "textScore"}), ("_id", DESCENDING)])
+              .skip(page * page_size)
+              .limit(page_size + 1))
+    try:
+        docs = list(cursor)
+    except OperationFailure as e:
+        if e.code != INDEX_NOT_FOUND:
+            raise
+        pattern = re.compile(re.escape(query), re.IGNORECASE)
+        cursor = (collection.find({"$or": [{field: pattern} for field in ("type", "case_id", "description")]},
+                                  projection)
+                  .sort("_id", DESCENDING)
+                  .skip(page * page_size)
+                  .limit(page_size + 1))
+        docs = list(cursor)
+    return docs[:page_size], len(docs) > page_size
+
+
+def search_assignments(collection, query, page=0, page_size=20, projection=None):
+    """Prefix search on case and officer IDs using their indexes."""
+    query = (query or "").strip()
+    if not query:
+        return [], False
+    escaped = re.escape(query)
+    prefixes = [re.compile(f"^{variant}") for variant in {escaped, escaped.upper(), escaped.lower()}]
+    cursor = (collection.find({"$or": [{"case_id": {"$in": prefixes}},
+                                       {"officer_id": {"$in": prefixes}}]}, projection)
+              .sort("_id", 1)
+              .skip(page * page_size)
+              .limit(page_size + 1))
+    docs = list(cursor)
+    return docs[:page_size], len(docs) > page_size
@@ -0,0 +1,273 @@
+"""HTTP front end over the service layer, shared by several workstations.
+
+Usage:
+    python server.py --host 127.0.0.1 --port 8765 --uri mongodb://db-host:27017/
+
+Connection settings (pool size, timeouts, read preferences, write concerns)
+come from the config file and environment described in ``connection``;
+``--uri``, ``--database`` and ``--max-pool-size`` override them. With
+``--gc-interval`` the server also reclaims unreferenced GridFS storage
+periodically (see ``orphans``).
+
+Every request is served from one ``CrimeService`` and therefore one pooled
+``MongoClient``, so analysts running ``python main.py --server URL`` do not
+each open their own connection pool. Endpoints:
+
+    POST /rpc/<repository>/<method>   JSON body {"args": [...], "kwargs": {...}}
+    POST /files?filename=...          request body streamed into GridFS
+    POST /metrics/reset               clear the query metrics
+    GET  /reports/<name>.<fmt>        report export streamed back
+    GET  /files/<file_id>             stored file streamed back
+    GET  /metrics[.json]              query metrics as Prometheus text or JSON
+    GET  /changes?after=<seq>         change events after seq, long polled
+    GET  /ping                        database round trip in milliseconds
+
+Bodies are Extended JSON (``bson.json_util``) so ObjectIds and dates survive
+the round trip.
+
+Every request must carry ``Authorization: Bearer <token>`` when a
+``server_token`` is configured (config file or ``CRIME_SERVER_TOKEN``), and
+the server refuses to listen beyond the loopback interface without one: the
+RPC endpoint can delete any record and reclaim storage.
+"""
+import argparse
+import hmac
+import logging
+import os
+import shutil
+import tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from bson import json_util
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from gridfs.errors import NoFile
+
+from changes import LONG_POLL_SECONDS
+from instrumentation import metrics, tagged
+from orphans import OrphanCollector
+from reports import WRITERS
+from connection import load_settings
+from services import REPORTS, RPC_TARGETS, CrimeService
+from uploads import DEFAULT_CHUNK_SIZE
+
+logger = logging.getLogger("server")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+SERVER_POOL_SIZE = 100
+CONTENT_TYPES = {"txt": "text/plain; charset=utf-8", "csv": "text/csv; charset=utf-8", "pdf": "application/pdf"}
+
+
+class RequestBody:
+    """File-like view of a request body that reads at most Content-Length bytes."""
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.read(size) if size else b""
+        self.remaining -= len(data)
+        return data
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service = None
+    token = None
+
+    def _send_json(self, status, value):
+        body = json_util.dumps(value).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, content_type, text):
+        body = text.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send_json(status, {"error": message})
+
+    def _authorized(self):
+        if self.token is None:
+            return True
+        supplied = self.headers.get("Authorization", "").encode("utf-8")
+        if hmac.compare_digest(supplied, f"Bearer {self.token}".encode("utf-8")):
+            return True
+        # The request body is left unread, so the connection cannot be reused
+        self.close_connection = True
+        self._send_error(401, "Missing or wrong server token")
+        return False
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            if len(parts) == 3 and parts[0] == "rpc":
+                self._rpc(parts[1], parts[2], self.rfile.read(length))
+            elif parts == ["metrics", "reset"]:
+                metrics.reset()
+                self._send_json(200, {"result": True})
+            elif parts == ["files"]:
+                self._upload(parse_qs(url.query), RequestBody(self.rfile, length))
+            else:
+                self._send_error(404, f"Unknown endpoint {url.path}")
+        except Exception as e:
+            logger.exception("%s failed", url.path)
+            # The request body may be partly unread, so the connection cannot be reused
+            self.close_connection = True
+            self._send_error(500, f"{type(e).__name__}: {e}")
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        try:
+            if len(parts) == 2 and parts[0] == "reports":
+                with tagged(self.headers.get("X-Handler")):
+                    self._report(*os.path.splitext(parts[1]))
+            elif parts == ["metrics"]:
+                self._send_text("text/plain; version=0.0.4", metrics.to_prometheus())
+            elif parts == ["metrics.json"]:
+                self._send_text("application/json", metrics.to_json())
+            elif len(parts) == 2 and parts[0] == "files":
+                with tagged(self.headers.get("X-Handler")):
+                    self._download(parts[1])
+            elif parts == ["changes"]:
+                self._changes(parse_qs(url.query))
+            elif parts == ["ping"]:
+                self._send_json(200, {"result": self.service.ping()})
+            else:
+                self._send_error(404, f"Unknown endpoint {url.path}")
+        except Exception as e:
+            logger.exception("%s failed", url.path)
+            self._send_error(500, f"{type(e).__name__}: {e}")
+
+    def _rpc(self, target, method, body):
+        if target not in RPC_TARGETS:
+            self._send_error(404, f"Unknown repository {target}")
+            return
+        repository = getattr(self.service, target)
+        if method not in repository.RPC_METHODS:
+            self._send_error(404, f"Unknown method {target}.{method}")
+            return
+        call = json_util.loads(body) if body else {}
+        # Attribute the queries to the client's handler rather than to the server thread
+        with tagged(self.headers.get("X-Handler")):
+            result = getattr(repository, method)(*call.get("args", []), **call.get("kwargs", {}))
+        self._send_json(200, {"result": result})
+
+    def _upload(self, query, body):
+        filename = query.get("filename", ["upload"])[0]
+        metadata = json_util.loads(query["metadata"][0]) if "metadata" in query else None
+        with tagged(self.headers.get("X-Handler")):
+            result = self.service.files.upload_stream(body, filename, metadata)
+        if result.error:
+            raise result.error
+        self._send_json(200, {"result": result.to_dict()})
+
+    def _download(self, file_id):
+        try:
+            grid_out = self.service.fs.get(ObjectId(file_id))
+        except (InvalidId, NoFile):
+            self._send_error(404, f"Unknown file {file_id}")
+            return
+        with grid_out:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(grid_out.length))
+            self.end_headers()
+            for chunk in iter(lambda: grid_out.read(DEFAULT_CHUNK_SIZE), b""):
+                self.wfile.write(chunk)
+
+    def _report(self, name, ext):
+        fmt = ext.lstrip(".")
+        if name not in REPORTS or fmt not in WRITERS:
+            self._send_error(404, f"Unknown report {name}{ext}")
+            return
+        # The PDF writer needs a seekable file, so export to disk first and then stream it back
+        fd, path = tempfile.mkstemp(suffix=ext)
+        os.close(fd)
+        try:
+            count = self.service.reports.export(name, fmt, path)
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPES[fmt])
+            self.send_header("Content-Length", str(os.path.getsize(path)))
+            self.send_header("X-Record-Count", str(count))
+            self.end_headers()
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile)
+        finally:
+            os.remove(path)
+
+    def _changes(self, query):
+        after = int(query["after"][0]) if "after" in query else None
+        timeout = min(float(query.get("timeout", [LONG_POLL_SECONDS])[0]), LONG_POLL_SECONDS)
+        self._send_json(200, self.service.changes.since(after, timeout))
+
+    def log_message(self, format, *args):
+        logger.info("%s %s", self.address_string(), format % args)
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, token=None):
+    handler = type("BoundServiceHandler", (ServiceHandler,), {"service": service, "token": token})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the crime_analysis service layer over HTTP")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--uri")
+    parser.add_argument("--database")
+    parser.add_argument("--max-pool-size", type=int)
+    parser.add_argument("--gc-interval", type=float, metavar="HOURS",
+                        help="delete GridFS files no record refers to every HOURS hours")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    settings = load_settings()
+    if settings["server_token"] is None and args.host not in LOOPBACK_HOSTS:
+        parser.error("set a server token (server_token in the config file, or CRIME_SERVER_TOKEN) "
+                     "before serving beyond this machine")
+    # One pool serves every workstation, so it defaults larger than a single GUI's
+    settings["max_pool_size"] = args.max_pool_size or max(settings["max_pool_size"], SERVER_POOL_SIZE)
+    service = CrimeService.connect(args.uri, args.database, settings)
+    summary = service.bootstrap()
+    if summary["missing_indexes"] or summary["collection_scans"]:
+        logger.warning("Schema version %d has problems: %s", summary["version"], summary)
+    # Follow the change stream from the start so clients can long-poll /changes
+    service.changes.start()
+    if args.gc_interval:
+        OrphanCollector(service.bulk_db, interval=args.gc_interval * 3600).start()
+
+    server = make_server(service, args.host, args.port, settings["server_token"])
+    logger.info("Serving on http://%s:%d/", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,771 @@
+"""Headless service layer over the crime_analysis collections.
+
+Every database and GridFS operation the app performs lives here, grouped into
+one repository per collection, so the same code paths can be driven by the
+Tk GUI, the HTTP front end in ``server.py``, scripts and benchmarks. Methods
+take and return plain JSON-friendly values (documents, lists, bools) so they
+can be called remotely through ``RemoteService`` as well.
+"""
+import functools
+import logging
+import time
+from datetime import datetime
+
+import gridfs
+from bson.objectid import ObjectId
+import pymongo
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import search
+from cache import VERSION_FIELD, RecordCache
+from changes import ChangeFeed
+from connection import DEFAULT_SETTINGS, RetryPolicy, database_for, load_settings, open_database
+from dedupe import DEDUPE_BATCH_SIZE, DEDUPE_WORKERS, dedupe_files
+from dossiers import OPEN_CASES_QUERY, DossierBuilder, DossierCache
+from biometrics import load_biometrics_for_page
+from instrumentation import metrics
+from orphans import GC_BATCH_SIZE, GC_GRACE_SECONDS, collect_orphans, release_files
+from paging import fetch_page, fetch_sorted_page, prefix_query
+from reports import (CASE_FIELDS, CLOSED_CASES_QUERY, CRIMINAL_FIELDS, export_report, iter_records,
+                     officer_report)
+from schema import bootstrap_schema
+from stats import (CASES_SUMMARY, CRIMINALS_SUMMARY, OFFICERS_SUMMARY, assignment_delta, case_delta,
+                   criminal_delta, load_stats, rebuild_stats, record_change)
+from thumbnails import make_thumbnail, store_thumbnail
+from uploads import UploadEngine, file_summaries
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URI = DEFAULT_SETTINGS["uri"]
+PING_TIMEOUT = 5  # seconds before a connection check gives up
+
+# Fields collected by each entry form
+CRIMINAL_FORM_FIELDS = ["custom_id", "name", "age", "gender", "crime", "status"]
+CASE_FORM_FIELDS = ["case_id", "description", "status", "officer"]
+VICTIM_WITNESS_FORM_FIELDS = ["name", "age", "gender", "crime", "role", "statement"]
+EVIDENCE_FORM_FIELDS = ["type", "description", "case_id"]
+ASSIGNMENT_FORM_FIELDS = ["case_id", "officer_id"]
+GRID_PAGE_SIZE = 100
+
+# name: (title, collection, fields, sort key, query)
+REPORTS = {
+    "criminals": ("Criminal Report", "criminals", CRIMINAL_FIELDS, "custom_id", None),
+    "cases": ("Case Report", "cases", CASE_FIELDS, "case_id", None),
+    "closed_cases": ("Closed Case Report", "cases", CASE_FIELDS, "case_id", CLOSED_CASES_QUERY),
+}
+
+
+def _object_id(value):
+    return value if isinstance(value, ObjectId) else ObjectId(value)
+
+
+def retried(method):
+    # Reads are safe to repeat, so transient failures are retried (see ``connection.RetryPolicy``)
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self.service.retry.call(method, self, *args, **kwargs)
+    return wrapper
+
+
+class Repository:
+    collection_name = None
+    # Methods that may be called through the HTTP front end
+    RPC_METHODS = ()
+    # Columns of the grid view; it sorts and filters only on grid_sortable, indexed with _id in schema
+    grid_columns = ()
+    grid_sortable = ()
+    # Unique field by which ``get`` reads through a ``RecordCache``, if any
+    cache_key = None
+    # Name of the unique index on cache_key (schema.LOOKUP_INDEXES)
+    unique_index = None
+
+    def __init__(self, service):
+        self.service = service
+        self.db = service.db
+        self.collection = service.db[self.collection_name]
+        # Heavy listing reads use the reports operation class, which may read from secondaries
+        self.listing = service.reports_db[self.collection_name]
+        self._cache = None
+        self._unique_enforced = False
+
+    @property
+    def cache(self):
+        # Created on first lookup, so only processes that read records follow the change feed for them
+        if self._cache is None:
+            self._cache = RecordCache(self.collection, self.cache_key)
+            self.service.changes.subscribe([self.collection_name], self._cache.on_change)
+            metrics.register_cache(self.collection_name, self._cache)
+        return self._cache
+
+    def _taken(self, value):
+        """Whether ``value`` of the unique key is in use, checked only while the unique index cannot tell.
+
+        The index is built in the background at startup and its build fails
+        (and is only logged) while legacy duplicates remain; until it exists,
+        an insert would not raise ``DuplicateKeyError``.
+        """
+        if not self._unique_enforced:
+            if self.unique_index in self.collection.index_information():
+                self._unique_enforced = True
+            else:
+                return self.collection.count_documents({self.cache_key: value}, limit=1) > 0
+        return False
+
+    def _uncache(self, value):
+        if self._cache is not None:
+            self._cache.invalidate(value)
+
+    def grid_projection(self):
+        return {column: 1 for column in self.grid_columns}
+
+    @retried
+    def grid(self, sort=None, descending=False, filters=None, after=None, limit=GRID_PAGE_SIZE):
+        """One page of the grid view: ``(docs, next_after)``.
+
+        ``filters`` maps sortable columns to prefixes, matched as typed, in
+        upper or lower case, or capitalised, so each stays an indexed range.
+        """
+        sort = sort or self.grid_sortable[0]
+        if sort not in self.grid_sortable:
+            raise ValueError(f"Cannot sort {self.collection_name} by {sort}")
+        conditions = []
+        for column, prefix in (filters or {}).items():
+            if column not in self.grid_sortable:
+                raise ValueError(f"Cannot filter {self.collection_name} by {column}")
+            condition = prefix_query(column, prefix)
+            if condition:
+                conditions.append(condition)
+        query = conditions[0] if len(conditions) == 1 else ({"$and": conditions} if conditions else None)
+        if after is not None:
+            after = (after[0], _object_id(after[1]))
+        return fetch_sorted_page(self.listing, sort, -1 if descending else 1, after, limit, query,
+                                 self.grid_projection())
+
+    def _changed(self, op, doc_id, doc=None):
+        # Tell open views about the write (see ``changes.ChangeFeed``)
+        self.service.changes.record(self.collection_name, op, doc_id, doc)
+
+
+class CriminalRepository(Repository):
+    collection_name = "criminals"
+    RPC_METHODS = ("add", "get", "update", "delete", "search", "browse")
+    cache_key = "custom_id"
+    unique_index = "custom_id_unique"
+
+    def __init__(self, service):
+        super().__init__(service)
+        self.terms = search.TermVocabulary(self.collection)
+
+    def add(self, record):
+        """Insert a criminal; returns False if the custom_id is already taken."""
+        data = search.with_name_terms({field: record.get(field, "") for field in CRIMINAL_FORM_FIELDS})
+        data[VERSION_FIELD] = 1
+        # Uniqueness is enforced by the unique index on custom_id, once it exists
+        if self._taken(data["custom_id"]):
+            return False
+        try:
+            self.collection.insert_one(data)
+        except DuplicateKeyError:
+            return False
+        self.terms.add(data[search.NAME_TERMS_FIELD])
+        self._uncache(data["custom_id"])
+        record_change(self.db, CRIMINALS_SUMMARY, criminal_delta, after=data)
+        self._changed("insert", data["_id"], data)
+        return True
+
+    @retried
+    def get(self, custom_id):
+        return self.cache.get(custom_id)
+
+    def update(self, custom_id, fields):
+        fields = search.with_name_terms(dict(fields)) if "name" in fields else fields
+        # The previous values are needed to move the dashboard counters
+        before = self.collection.find_one_and_update({"custom_id": custom_id},
+                                                     {"$set": fields, "$inc": {VERSION_FIELD: 1}},
+                                                     return_document=ReturnDocument.BEFORE)
+        if before is None:
+            return False
+        if search.NAME_TERMS_FIELD in fields:
+            self.terms.add(fields[search.NAME_TERMS_FIELD])
+        self._uncache(custom_id)
+        after = {**before, **fields, VERSION_FIELD: before.get(VERSION_FIELD, 0) + 1}
+        record_change(self.db, CRIMINALS_SUMMARY, criminal_delta, before, after)
+        self._changed("update", before["_id"], after)
+        return True
+
+    def delete(self, custom_id):
+        before = self.collection.find_one_and_delete({"custom_id": custom_id})
+        if before is None:
+            return False
+        self._uncache(custom_id)
+        record_change(self.db, CRIMINALS_SUMMARY, criminal_delta, before=before)
+        self._changed("delete", before["_id"])
+        self.service.biometrics.delete_for_criminal(custom_id)
+        return True
+
+    @retried
+    def search(self, query, page=0, page_size=20):
+        docs, has_more = search.search_names(self.collection, self.terms, query, page, page_size)
+        # Results are often opened for update next
+        self.cache.prime(docs)
+        return docs, has_more
+
+    @retried
+    def browse(self, after=None, limit=50):
+        """A page of criminals with their biometric metadata: ``([(criminal, bios)], next_after)``."""
+        page, next_after = fetch_page(self.listing, "custom_id", after=after, limit=limit)
+        # One query for the whole page's biometric metadata instead of one per criminal
+        bios_by_criminal, bio_queries = load_biometrics_for_page(self.db, [c.get("custom_id") for c in page])
+        logger.info("Criminal page after %r: %d rows, %d queries", after, len(page), 1 + bio_queries)
+        items = [(criminal, bios_by_criminal.get(criminal.get("custom_id"), [])) for criminal in page]
+        return items, next_after
+
+
+class CaseRepository(Repository):
+    collection_name = "cases"
+    RPC_METHODS = ("add", "get", "list", "grid")
+    grid_columns = ("case_id", "description", "status", "officer")
+    grid_sortable = ("case_id", "status", "officer")
+    cache_key = "case_id"
+    unique_index = "case_id_unique"
+
+    def add(self, record):
+        """Insert a case; returns False if the case_id is already taken."""
+        data = {field: record.get(field, "") for field in CASE_FORM_FIELDS}
+        data[VERSION_FIELD] = 1
+        if self._taken(data["case_id"]):
+            return False
+        try:
+            self.collection.insert_one(data)
+        except DuplicateKeyError:
+            return False
+        self._uncache(data["case_id"])
+        record_change(self.db, CASES_SUMMARY, case_delta, after=data)
+        self._changed("insert", data["_id"], data)
+        return True
+
+    @retried
+    def get(self, case_id):
+        return self.cache.get(case_id)
+
+    @retried
+    def list(self):
+        return list(self.listing.find())
+
+
+class VictimWitnessRepository(Repository):
+    collection_name = "victims_witnesses"
+    RPC_METHODS = ("add", "get", "update", "delete", "search", "list", "grid")
+    grid_columns = ("name", "age", "gender", "crime", "role", "statement")
+    grid_sortable = ("name", "crime", "role")
+
+    def __init__(self, service):
+        super().__init__(service)
+        self.terms = search.TermVocabulary(self.collection)
+
+    def add(self, record):
+        data = search.with_name_terms({field: record.get(field, "") for field in VICTIM_WITNESS_FORM_FIELDS})
+        self.collection.insert_one(data)
+        self.terms.add(data[search.NAME_TERMS_FIELD])
+        self._changed("insert", data["_id"], data)
+        return True
+
+    @retried
+    def get(self, name):
+        return self.collection.find_one({"name": name})
+
+    def update(self, name, fields):
+        fields = search.with_name_terms(dict(fields)) if "name" in fields else fields
+        after = self.collection.find_one_and_update({"name": name}, {"$set": fields},
+                                                    return_document=ReturnDocument.AFTER)
+        if after is None:
+            return False
+        if search.NAME_TERMS_FIELD in fields:
+            self.terms.add(fields[search.NAME_TERMS_FIELD])
+        self._changed("update", after["_id"], after)
+        return True
+
+    def delete(self, name):
+        before = self.collection.find_one_and_delete({"name": name}, projection={"_id": 1})
+        if before is None:
+            return False
+        self._changed("delete", before["_id"])
+        return True
+
+    @retried
+    def search(self, query, page=0, page_size=20):
+        return search.search_names(self.collection, self.terms, query, page, page_size)
+
+    @retried
+    def list(self):
+        return list(self.listing.find())
+
+
+class EvidenceRepository(Repository):
+    collection_name = "evidence"
+    RPC_METHODS = ("add", "get", "update", "delete", "search", "list", "grid")
+    grid_columns = ("type", "description", "case_id", "file_name")
+    grid_sortable = ("case_id", "type")
+
+    def _with_file_names(self, evidence_list):
+        # File metadata is stored on the evidence; only records written before that need a lookup
+        rows = list(evidence_list)
+        missing = [evidence["file_id"] for evidence in rows if evidence.get("file_id") and "file_name" not in evidence]
+        summaries = file_summaries(self.db, missing) if missing else {}
+        for evidence in rows:
+            evidence.update(summaries.get(evidence.get("file_id"), {}))
+            evidence.setdefault("file_name", "None")
+        return rows
+
+    def _file_fields(self, file_id):
+        file_id = _object_id(file_id)
+        return {"file_id": file_id, **file_summaries(self.db, [file_id]).get(file_id, {})}
+
+    def add(self, record, file_id=None):
+        data = {field: record.get(field, "") for field in EVIDENCE_FORM_FIELDS}
+        data["file_id"] = None
+        if file_id is not None:
+            data.update(self._file_fields(file_id))
+        self.collection.insert_one(data)
+        self._changed("insert", data["_id"], data)
+        return True
+
+    @retried
+    def get(self, evidence_id):
+        return self.collection.find_one({"_id": _object_id(evidence_id)})
+
+    def update(self, evidence_id, fields, file_id=None):
+        fields = dict(fields)
+        if file_id is not None:
+            fields.update(self._file_fields(file_id))
+        # The previous file_id is needed to release a replaced file
+        before = self.collection.find_one_and_update({"_id": _object_id(evidence_id)}, {"$set": fields},
+                                                     return_document=ReturnDocument.BEFORE)
+        if before is None:
+            if file_id is not None:
+                release_files(self.db, [fields["file_id"]])
+            return False
+        self._changed("update", before["_id"], {**before, **fields})
+        if file_id is not None:
+            # The upload took a reference for this record, so the old one goes even if the file is the same
+            release_files(self.db, [before.get("file_id")])
+        return True
+
+    def delete(self, evidence_id):
+        before = self.collection.find_one_and_delete({"_id": _object_id(evidence_id)}, projection={"file_id": 1})
+        if before is None:
+            return False
+        self._changed("delete", before["_id"])
+        release_files(self.db, [before.get("file_id")])
+        return True
+
+    @retried
+    def search(self, query, page=0, page_size=20):
+        evidence_list, has_more = search.search_evidence(self.collection, query, page, page_size)
+        return self._with_file_names(evidence_list), has_more
+
+    @retried
+    def list(self):
+        return self._with_file_names(self.listing.find())
+
+    def grid_projection(self):
+        return {"type": 1, "description": 1, "case_id": 1, "file_id": 1, "file_name": 1}
+
+    @retried
+    def grid(self, sort=None, descending=False, filters=None, after=None, limit=GRID_PAGE_SIZE):
+        docs, next_after = super().grid(sort, descending, filters, after, limit)
+        return self._with_file_names(docs), next_after
+
+
+class OfficerAssignmentRepository(Repository):
+    collection_name = "officer_assignments"
+    RPC_METHODS = ("add", "get", "update", "delete", "search", "list", "grid")
+    grid_columns = ("case_id", "officer_id")
+    grid_sortable = ("case_id", "officer_id")
+
+    def add(self, record):
+        data = {field: record.get(field, "") for field in ASSIGNMENT_FORM_FIELDS}
+        self.collection.insert_one(data)
+        record_change(self.db, OFFICERS_SUMMARY, assignment_delta, after=data)
+        self._changed("insert", data["_id"], data)
+        return True
+
+    @retried
+    def get(self, assignment_id):
+        return self.collection.find_one({"_id": _object_id(assignment_id)})
+
+    def update(self, assignment_id, fields):
+        before = self.collection.find_one_and_update({"_id": _object_id(assignment_id)}, {"$set": fields},
+                                                     return_document=ReturnDocument.BEFORE)
+        if before is None:
+            return False
+        record_change(self.db, OFFICERS_SUMMARY, assignment_delta, before, {**before, **fields})
+        self._changed("update", before["_id"], {**before, **fields})
+        return True
+
+    def delete(self, assignment_id):
+        before = self.collection.find_one_and_delete({"_id": _object_id(assignment_id)})
+        if before is None:
+            return False
+        record_change(self.db, OFFICERS_SUMMARY, assignment_delta, before=before)
+        self._changed("delete", before["_id"])
+        return True
+
+    @retried
+    def search(self, query, page=0, page_size=20):
+        return search.search_assignments(self.collection, query, page, page_size)
+
+    @retried
+    def list(self):
+        return list(self.listing.find())
+
+
+class BiometricRepository(Repository):
+    collection_name = "biometric_data"
+    RPC_METHODS = ("add", "thumbnail")
+
+    def delete_for_criminal(self, criminal_id):
+        """Delete a criminal's biometric records and the images only they used; returns the count."""
+        bios = list(self.collection.find({"criminal_id": criminal_id}, {"file_id": 1}))
+        if not bios:
+            return 0
+        self.collection.delete_many({"_id": {"$in": [bio["_id"] for bio in bios]}})
+        # Thumbnail sidecars go with their original
+        release_files(self.db, [bio.get("file_id") for bio in bios])
+        self.service.similarity.invalidate()
+        return len(bios)
+
+    def add(self, criminal_id, bio_type, uploads):
+        """Record uploaded images for a criminal; returns an error message or None.
+
+        ``uploads`` are ``UploadResult.to_dict()`` values for files already in GridFS.
+        """
+        # Check if criminal exists (using custom_id field)
+        if not self.service.criminals.get(criminal_id):
+            release_files(self.db, [_object_id(upload["file_id"]) for upload in uploads])
+            return f"No criminal found with ID '{criminal_id}'"
+
+        # numpy is only needed once images are actually hashed
+        from similarity import HASH_FIELD, image_hash, to_stored
+
+        fs = self.service.fs
+        bio_docs = []
+        for upload in uploads:
+            file_id = _object_id(upload["file_id"])
+            # Precompute the thumbnail so viewing never decodes the full image
+            sidecar = None
+            if upload.get("deduplicated"):
+                sidecar = self.db["fs.files"].find_one({"thumbnail_of": file_id}, {"_id": 1})
+            if sidecar:
+                thumb_id = sidecar["_id"]
+                thumbnail = fs.get(thumb_id).read()
+            else:
+                thumbnail = make_thumbnail(fs.get(file_id).read())
+                thumb_id = store_thumbnail(fs, thumbnail, file_id, upload["filename"])
+            bio_docs.append({
+                "criminal_id": criminal_id,
+                "type": bio_type,
+                "file_id": file_id,
+                "thumb_id": thumb_id,
+                "sha256": upload.get("sha256"),
+                # Hashed from the thumbnail, which is all the hash looks at anyway
+                HASH_FIELD: to_stored(image_hash(thumbnail)),
+                "timestamp": datetime.now()
+            })
+        if bio_docs:
+            self.collection.insert_many(bio_docs)
+            self.service.similarity.invalidate()
+        return None
+
+    @retried
+    def thumbnail(self, bio):
+        """Return thumbnail PNG bytes for a biometric record."""
+        fs = self.service.fs
+        if bio.get("thumb_id"):
+            return fs.get(_object_id(bio["thumb_id"])).read()
+        # Legacy record without a sidecar: decode the original once and backfill
+        file_id = _object_id(bio["file_id"])
+        thumbnail = make_thumbnail(fs.get(file_id).read())
+        thumb_id = store_thumbnail(fs, thumbnail, file_id, str(file_id))
+        self.collection.update_one({"_id": _object_id(bio["_id"])}, {"$set": {"thumb_id": thumb_id}})
+        return thumbnail
+
+
+class FileService:
+    """Streamed, deduplicating GridFS uploads (see ``uploads.UploadEngine``)."""
+
+    def __init__(self, service):
+        self.db = service.db
+        self._engine = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = UploadEngine(self.db)
+        return self._engine
+
+    def upload_stream(self, stream, filename, metadata=None, on_chunk=None, check=None):
+        return self.engine.upload_stream(stream, filename, metadata, on_chunk, check)
+
+    def upload_file(self, path, metadata=None, on_chunk=None, check=None):
+        return self.engine.upload_file(path, metadata, on_chunk, check)
+
+    def upload_many(self, paths, metadata=None, on_progress=None, check=None):
+        return self.engine.upload_many(paths, metadata, on_progress, check)
+
+    def download(self, file_id, path, on_chunk=None, check=None):
+        return self.engine.download(_object_id(file_id), path, on_chunk, check)
+
+
+class ReportService:
+    RPC_METHODS = ("officer_report", "count", "preview")
+
+    def __init__(self, service):
+        self.service = service
+        self.db = service.reports_db
+
+    @retried
+    def officer_report(self):
+        # One aggregation groups every officer's cases instead of a find_one per assignment
+        return list(officer_report(self.db))
+
+    @retried
+    def count(self, name):
+        _, collection, _, _, query = REPORTS[name]
+        if query:
+            return self.db[collection].count_documents(query)
+        return self.db[collection].estimated_document_count()
+
+    @retried
+    def preview(self, name, after=None, limit=25):
+        """One keyset-paginated page of a report; returns ``(docs, next_after)``."""
+        _, collection, fields, key, query = REPORTS[name]
+        projection = {field: 1 for _, field in fields}
+        return fetch_page(self.db[collection], key, after=after, limit=limit, query=query, projection=projection)
+
+    def export(self, name, fmt, path, progress=None, check=None):
+        """Stream a whole report into ``path``; returns the number of records written."""
+        title, collection, fields, key, query = REPORTS[name]
+        records = iter_records(self.db[collection], fields, query=query, sort_key=key)
+        return export_report(path, fmt, title, fields, records, self.count(name), progress=progress, check=check)
+
+
+class DossierService:
+    """Case dossiers built by one aggregation each and cached (see ``dossiers``)."""
+
+    RPC_METHODS = ("get", "open_cases", "cache_stats")
+
+    def __init__(self, service):
+        self.service = service
+        self.db = service.db
+        self._cache = None
+
+    @property
+    def cache(self):
+        # Created on first use so only processes that show dossiers follow the change feed for them
+        if self._cache is None:
+            self._cache = DossierCache(DossierBuilder(self.db, self.service.cases.get), self.service.changes)
+        return self._cache
+
+    @retried
+    def get(self, case_id):
+        return self.cache.get(case_id)
+
+    @retried
+    def open_cases(self):
+        return [case["case_id"] for case in self.db["cases"].find(OPEN_CASES_QUERY, {"case_id": 1, "_id": 0})
+                .sort("case_id", 1)]
+
+    def cache_stats(self):
+        return self.cache.stats()
+
+
+class StorageService:
+    """GridFS garbage collection and deduplication (see ``orphans`` and ``dedupe``)."""
+
+    RPC_METHODS = ("collect_orphans", "deduplicate")
+
+    def __init__(self, service):
+        self.service = service
+
+    def collect_orphans(self, delete=False, batch_size=GC_BATCH_SIZE, grace_seconds=GC_GRACE_SECONDS,
+                        progress=None, check=None):
+        """Report, and with ``delete`` reclaim, storage no record refers to."""
+        return collect_orphans(self.service.bulk_db, delete, batch_size, grace_seconds, progress, check)
+
+    def deduplicate(self, workers=DEDUPE_WORKERS, batch_size=DEDUPE_BATCH_SIZE, check=None):
+        """Merge stored files holding the same content; returns a report including the space saved."""
+        return dedupe_files(self.service.bulk_db, workers, batch_size, check)
+
+
+class StatsService:
+    RPC_METHODS = ("summary", "rebuild")
+
+    def __init__(self, service):
+        self.service = service
+        self.db = service.db
+
+    @retried
+    def summary(self):
+        """The dashboard's pre-aggregated counters: ``{"criminals": ..., "cases": ..., "officers": ...}``."""
+        return load_stats(self.db)
+
+    def rebuild(self):
+        return rebuild_stats(self.service.bulk_db)
+
+
+class AnalyticsService:
+    """Vectorised analysis over columnar snapshots (see ``columnar``); needs numpy."""
+
+    RPC_METHODS = ("refresh", "group_count", "crosstab", "age_distribution", "officer_case_ratios")
+
+    def __init__(self, service):
+        self.db = service.reports_db
+        self._engine = None
+
+    @property
+    def engine(self):
+        # numpy is only imported once analytics are actually used
+        if self._engine is None:
+            from columnar import AnalyticsEngine
+            self._engine = AnalyticsEngine(self.db)
+        return self._engine
+
+    def refresh(self, full=False):
+        return self.engine.refresh(full)
+
+    def group_count(self, table, column, where=None):
+        return self.engine.analytics.group_count(table, column, where)
+
+    def crosstab(self, table, row, column, where=None):
+        return self.engine.analytics.crosstab(table, row, column, where)
+
+    def age_distribution(self, bins=10, where=None):
+        return self.engine.analytics.age_distribution(bins, where)
+
+    def officer_case_ratios(self, period="M"):
+        return self.engine.analytics.officer_case_ratios(period)
+
+
+class SimilarityService:
+    """Perceptual-hash search over biometric images (see ``similarity``); needs numpy."""
+
+    RPC_METHODS = ("search", "reindex")
+
+    def __init__(self, service):
+        self.service = service
+        self.db = service.db
+        self._index = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            from similarity import SimilarityIndex
+            self._index = SimilarityIndex(self.service.reports_db[BiometricRepository.collection_name])
+        return self._index
+
+    def invalidate(self):
+        if self._index is not None:
+            self._index.invalidate()
+
+    @retried
+    def search(self, data, k=5, max_distance=10, bio_type=None):
+        """Criminals with an image closest to ``data``, nearest first."""
+        from similarity import HASH_BITS, image_hash
+        # Extra candidates make up for records whose criminal has since been deleted
+        matches = self.index.search(image_hash(bytes(data)), k * 2, max_distance, bio_type)
+        names = {doc["custom_id"]: doc.get("name", "") for doc in self.db["criminals"].find(
+            {"custom_id": {"$in": [match[0] for match in matches]}}, {"custom_id": 1, "name": 1})}
+        return [{
+            "criminal_id": criminal_id,
+            "name": names[criminal_id],
+            "bio_id": bio_id,
+            "type": bio_type,
+            "distance": distance,
+            "similarity": round(1 - distance / HASH_BITS, 3),
+        } for criminal_id, bio_id, bio_type, distance in matches if criminal_id in names][:k]
+
+    def reindex(self):
+        """Hash every biometric image without a hash, then rebuild the on-disk index."""
+        from similarity import hash_missing
+        hashed, failed = hash_missing(self.service.bulk_db[BiometricRepository.collection_name],
+                                      self.service.biometrics.thumbnail)
+        return {"hashed": hashed, "failed": failed, "indexed": self.index.rebuild()}
+
+
+class CrimeService:
+    def __init__(self, db, settings=None, change_stream=True):
+        # db serves the records operation class; with settings the others get their own options
+        self.db = db
+        self.reports_db = database_for(db, settings, "reports") if settings else db
+        self.bulk_db = database_for(db, settings, "bulk") if settings else db
+        self.retry = RetryPolicy.from_settings(settings) if settings else RetryPolicy()
+        self._fs = None
+        self.changes = ChangeFeed(db, stream=change_stream)
+        self.criminals = CriminalRepository(self)
+        self.cases = CaseRepository(self)
+        self.victims_witnesses = VictimWitnessRepository(self)
+        self.evidence = EvidenceRepository(self)
+        self.officer_assignments = OfficerAssignmentRepository(self)
+        self.biometrics = BiometricRepository(self)
+        self.files = FileService(self)
+        self.reports = ReportService(self)
+        self.dossiers = DossierService(self)
+        self.storage = StorageService(self)
+        self.stats = StatsService(self)
+        self.analytics = AnalyticsService(self)
+        self.similarity = SimilarityService(self)
+
+    @classmethod
+    def connect(cls, uri=None, database=None, settings=None, **client_options):
+        """A service configured by ``settings`` (see ``connection.load_settings``).
+
+        ``uri`` and ``database`` override the settings, and ``client_options``
+        go to ``MongoClient``. The client opens no connection until first used
+        (see ``ping``).
+        """
+        settings = settings or load_settings()
+        client_options.setdefault("event_listeners", [metrics, metrics.pools])
+        client_options.setdefault("connect", False)
+        return cls(open_database(settings, uri, database, "records", **client_options), settings)
+
+    @property
+    def fs(self):
+        if self._fs is None:
+            self._fs = gridfs.GridFS(self.db)
+        return self._fs
+
+    def ping(self):
+        """Round trip to the server in milliseconds; also warms up the connection pool."""
+        started = time.perf_counter()
+        with pymongo.timeout(PING_TIMEOUT):
+            self.db.command("ping")
+        return (time.perf_counter() - started) * 1000
+
+    def bootstrap(self):
+        return bootstrap_schema(self.bulk_db)
+
+    def metrics(self):
+        """Query metrics of this process (see ``instrumentation.QueryMetrics``)."""
+        return metrics.snapshot()
+
+    def reset_metrics(self):
+        metrics.reset()
+
+
+# Service attributes reachable through the HTTP front end, and the classes declaring their RPC_METHODS
+RPC_TARGETS = {
+    "criminals": CriminalRepository,
+    "cases": CaseRepository,
+    "victims_witnesses": VictimWitnessRepository,
+    "evidence": EvidenceRepository,
+    "officer_assignments": OfficerAssignmentRepository,
+    "biometrics": BiometricRepository,
+    "reports": ReportService,
+    "dossiers": DossierService,
+    "storage": StorageService,
+    "stats": StatsService,
+    "analytics": AnalyticsService,
+    "similarity": SimilarityService,
+}
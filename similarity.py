@@ -0,0 +1,330 @@
+"""Perceptual-hash similarity search over stored biometric images.
+
+Usage:
+    python similarity.py reindex        # hash any unhashed images and rebuild the index
+    python similarity.py search probe.jpg
+
+Every biometric image gets a 64-bit difference hash (dHash) of its thumbnail,
+stored on its ``biometric_data`` record as ``phash``. Images that are the same
+picture after resizing, re-compression or small edits have hashes a few bits
+apart, so the nearest stored images are those at the smallest Hamming
+distance.
+
+The index is a multi-index hash: the 64 bits are split into four 16-bit
+substrings, and each substring has a sorted table on disk. By the pigeonhole
+principle, any hash within distance ``r`` of the query matches it in at least
+one substring to within ``r // 4`` bits. So a query only probes a few hundred
+keys per table with ``searchsorted`` and then checks the distance of that
+candidate set exactly. Images indexed since the last rebuild are kept in a
+small in-memory delta that is scanned directly.
+"""
+import argparse
+import io
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from bson.objectid import ObjectId
+from PIL import Image
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+HASH_FIELD = "phash"
+HASH_BITS = 64
+SUBSTRINGS = 4
+SUBSTRING_BITS = HASH_BITS // SUBSTRINGS
+DEFAULT_MAX_DISTANCE = 10
+DEFAULT_TOP_K = 5
+REFRESH_TTL = 60  # seconds before images indexed by other clients are picked up
+DELTA_REBUILD_SIZE = 10_000  # fold the in-memory delta into the on-disk index beyond this
+REINDEX_BATCH_SIZE = 500
+REINDEX_WORKERS = 8
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "crime_analysis", "similarity")
+MANIFEST = "manifest.json"
+
+
+def index_dir():
+    return os.environ.get("CRIME_SIMILARITY_DIR", DEFAULT_INDEX_DIR)
+
+
+def image_hash(data):
+    """64-bit difference hash of image bytes, as an unsigned int."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("L", (SUBSTRING_BITS, SUBSTRING_BITS))
+        small = image.convert("L").resize((9, 8), Image.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int(np.packbits(bits.flatten()).view(">u8")[0])
+
+
+def to_stored(value):
+    # MongoDB integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def from_stored(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def _popcount(values):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def _substrings(hashes, table):
+    return ((hashes >> np.uint64(table * SUBSTRING_BITS)) & np.uint64((1 << SUBSTRING_BITS) - 1)).astype(np.uint16)
+
+
+def _probes(key, radius):
+    """Every 16-bit value within ``radius`` bits of ``key``."""
+    probes = [key]
+    for flips in range(1, radius + 1):
+        for bits in itertools.combinations(range(SUBSTRING_BITS), flips):
+            mask = 0
+            for bit in bits:
+                mask |= 1 << bit
+            probes.append(key ^ mask)
+    return np.array(probes, dtype=np.uint16)
+
+
+class HashIndex:
+    """Hashes with their record ids, plus one sorted lookup table per substring."""
+
+    def __init__(self, hashes, bio_ids, criminal_ids, types):
+        self.hashes = hashes
+        self.bio_ids = bio_ids
+        self.criminal_ids = criminal_ids
+        self.types = types
+        self.tables = None
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def build_tables(self):
+        self.tables = []
+        for table in range(SUBSTRINGS):
+            keys = _substrings(self.hashes, table)
+            order = np.argsort(keys, kind="stable").astype(np.int32)
+            self.tables.append((keys[order], order))
+
+    def candidates(self, query, max_distance):
+        """Row numbers that can be within ``max_distance`` of ``query``."""
+        if self.tables is None or max_distance >= HASH_BITS // 2:
+            return np.arange(len(self.hashes))
+        radius = max_distance // SUBSTRINGS
+        found = []
+        for table, (keys, rows) in enumerate(self.tables):
+            probes = _probes(int(_substrings(np.array([query], dtype=np.uint64), table)[0]), radius)
+            starts = np.searchsorted(keys, probes, side="left")
+            ends = np.searchsorted(keys, probes, side="right")
+            found.extend(rows[start:end] for start, end in zip(starts, ends) if end > start)
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int32)
+
+    def matches(self, query, max_distance, bio_type=None):
+        """``(rows, distances)`` of every hash within ``max_distance`` of ``query``."""
+        rows = self.candidates(query, max_distance)
+        if bio_type is not None and len(rows):
+            rows = rows[self.types[rows] == bio_type]
+        distances = _popcount(self.hashes[rows] ^ np.uint64(query)).astype(np.int32)
+        keep = distances <= max_distance
+        return rows[keep], distances[keep]
+
+    def save(self, directory, last_id):
+        os.makedirs(directory, exist_ok=True)
+        arrays = {"hashes": self.hashes, "bio_ids": self.bio_ids, "criminal_ids": self.criminal_ids,
+                  "types": self.types}
+        for table, (keys, rows) in enumerate(self.tables):
+            arrays[f"table_{table}_keys"] = keys
+            arrays[f"table_{table}_rows"] = rows
+        for name, array in arrays.items():
+            path = os.path.join(directory, f"{name}.npy")
+            np.save(f"{path}.tmp.npy", array)
+            os.replace(f"{path}.tmp.npy", path)
+        # Written last: a manifest always describes complete arrays
+        manifest_path = os.path.join(directory, MANIFEST)
+        with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"rows": len(self.hashes), "last_id": last_id}, f)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    @classmethod
+    def load(cls, directory):
+        """Memory-map a saved index; returns ``(index, last_id)`` or ``(None, None)``."""
+        manifest_path = os.path.join(directory, MANIFEST)
+        if not os.path.exists(manifest_path):
+            return None, None
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        rows = manifest["rows"]
+
+        def load(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")[:rows]
+
+        index = cls(load("hashes"), load("bio_ids"), load("criminal_ids"), load("types"))
+        index.tables = [(load(f"table_{table}_keys"), load(f"table_{table}_rows")) for table in range(SUBSTRINGS)]
+        return index, manifest["last_id"]
+
+    @classmethod
+    def from_records(cls, records):
+        records = list(records)
+        return cls(
+            np.array([from_stored(r[HASH_FIELD]) for r in records], dtype=np.uint64),
+            np.array([str(r["_id"]) for r in records], dtype="U24"),
+            np.array([str(r.get("criminal_id", "")) for r in records], dtype=str),
+            np.array([str(r.get("type", "")) for r in records], dtype=str),
+        )
+
+
+class SimilarityIndex:
+    """The on-disk index plus a delta of records hashed since it was built."""
+
+    PROJECTION = {HASH_FIELD: 1, "criminal_id": 1, "type": 1}
+
+    def __init__(self, collection, directory=None):
+        self.collection = collection
+        self.directory = directory or index_dir()
+        self._base = None
+        self._delta = []
+        self._delta_index = None
+        self._last_id = None
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._refreshed_at is None:
+            self._base, self._last_id = HashIndex.load(self.directory)
+            self._delta, self._delta_index = [], None
+            self._refresh()
+        elif time.monotonic() - self._refreshed_at > REFRESH_TTL:
+            self._refresh()
+
+    def _refresh(self):
+        query = {HASH_FIELD: {"$exists": True}}
+        if self._last_id:
+            query["_id"] = {"$gt": ObjectId(self._last_id)}
+        new = list(self.collection.find(query, self.PROJECTION).sort("_id", 1))
+        if new:
+            self._delta.extend(new)
+            self._last_id = str(new[-1]["_id"])
+            self._delta_index = None
+        if len(self._delta) > DELTA_REBUILD_SIZE:
+            self._rebuild()
+        self._refreshed_at = time.monotonic()
+
+    def _rebuild(self):
+        records = self.collection.find({HASH_FIELD: {"$exists": True}}, self.PROJECTION).sort("_id", 1)
+        index = HashIndex.from_records(records)
+        index.build_tables()
+        last_id = str(index.bio_ids[-1]) if len(index) else None
+        index.save(self.directory, last_id)
+        self._base, self._last_id = HashIndex.load(self.directory)
+        self._delta, self._delta_index = [], None
+        self._refreshed_at = time.monotonic()
+        logger.info("Similarity index rebuilt with %d images", len(index))
+
+    def invalidate(self):
+        """Pick up newly hashed records on the next search."""
+        with self._lock:
+            if self._refreshed_at is not None:
+                self._refreshed_at = 0
+
+    def rebuild(self):
+        with self._lock:
+            self._rebuild()
+            return len(self._base) if self._base is not None else 0
+
+    def search(self, query, k=DEFAULT_TOP_K, max_distance=DEFAULT_MAX_DISTANCE, bio_type=None):
+        """Best match per criminal, nearest first: ``[(criminal_id, bio_id, type, distance)]``."""
+        with self._lock:
+            self._ensure_loaded()
+            if self._delta and self._delta_index is None:
+                self._delta_index = HashIndex.from_records(self._delta)
+            parts = [index for index in (self._base, self._delta_index) if index is not None and len(index)]
+            best = {}
+            for index in parts:
+                rows, distances = index.matches(query, max_distance, bio_type)
+                for row, distance in zip(rows.tolist(), distances.tolist()):
+                    criminal_id = str(index.criminal_ids[row])
+                    if criminal_id not in best or distance < best[criminal_id][3]:
+                        best[criminal_id] = (criminal_id, str(index.bio_ids[row]), str(index.types[row]), distance)
+        return sorted(best.values(), key=lambda match: (match[3], match[0]))[:k]
+
+
+def hash_missing(collection, load_thumbnail, batch_size=REINDEX_BATCH_SIZE, workers=REINDEX_WORKERS, check=None):
+    """Hash every biometric record without a ``phash``; returns ``(hashed, failed)``.
+
+    ``load_thumbnail(bio)`` returns thumbnail bytes (backfilling sidecars as needed).
+    Records are processed in ``_id`` order in batches, hashed on a thread pool.
+    """
+    hashed = failed = 0
+    after = None
+
+    def compute(bio):
+        try:
+            return bio["_id"], image_hash(load_thumbnail(bio))
+        except Exception as e:
+            logger.warning("Could not hash biometric %s: %s", bio["_id"], e)
+            return bio["_id"], None
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="phash") as pool:
+        while True:
+            query = {HASH_FIELD: {"$exists": False}}
+            if after is not None:
+                query["_id"] = {"$gt": after}
+            batch = list(collection.find(query).sort("_id", 1).limit(batch_size))
+            if not batch:
+                break
+            after = batch[-1]["_id"]
+            if check:
+                check()
+            updates = []
+            for bio_id, value in pool.map(compute, batch):
+                if value is None:
+                    failed += 1
+                else:
+                    updates.append(UpdateOne({"_id": bio_id}, {"$set": {HASH_FIELD: to_stored(value)}}))
+            if updates:
+                collection.bulk_write(updates, ordered=False)
+                hashed += len(updates)
+            logger.info("Hashed %d biometric images (%d failed)", hashed, failed)
+    return hashed, failed
+
+
+def main(argv=None):
+    from services import CrimeService
+
+    parser = argparse.ArgumentParser(description="Biometric image similarity index")
+    parser.add_argument("command", choices=["reindex", "search"])
+    parser.add_argument("image", nargs="?", help="probe image for search")
+    parser.add_argument("-k", type=int, default=DEFAULT_TOP_K)
+    parser.add_argument("--max-distance", type=int, default=DEFAULT_MAX_DISTANCE)
+    parser.add_argument("--type", help="only match this biometric type")
+    parser.add_argument("--uri", help="default from the connection settings")
+    parser.add_argument("--database", help="default from the connection settings")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    service = CrimeService.connect(args.uri, args.database)
+    if args.command == "reindex":
+        print(service.similarity.reindex())
+        return
+    if not args.image:
+        parser.error("search needs an image")
+    with open(args.image, "rb") as f:
+        data = f.read()
+    started = time.perf_counter()
+    matches = service.similarity.search(data, args.k, args.max_distance, args.type)
+    print(f"{len(matches)} matches in {(time.perf_counter() - started) * 1000:.1f}ms")
+    for match in matches:
+        print(f"{match['criminal_id']:<12} {match.get('name', ''):<30} {match['type']:<12} "
+              f"distance {match['distance']}")
+
+
+if __name__ == "__main__":
+    main()
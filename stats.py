@@ -0,0 +1,146 @@
+"""Pre-aggregated crime statistics for the analytics dashboard.
+
+Counts live in a handful of summary documents in ``crime_stats`` so the
+dashboard reads three small documents instead of scanning ``criminals`` and
+``cases``. The service layer keeps them current with ``$inc`` deltas on every
+insert, update and delete; ``rebuild_stats`` recomputes them from scratch with
+one aggregation per collection, for the first run or to correct any drift.
+"""
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+STATS_COLLECTION = "crime_stats"
+CRIMINALS_SUMMARY = "criminals"
+CASES_SUMMARY = "cases"
+OFFICERS_SUMMARY = "officers"
+
+CRIMINAL_DIMENSIONS = ["crime", "status", "gender"]
+AGE_BANDS = [(0, 17, "Under 18"), (18, 25, "18-25"), (26, 35, "26-35"), (36, 50, "36-50"), (51, 65, "51-65"),
+             (66, 200, "Over 65")]
+UNKNOWN = "Unknown"
+
+
+def _key(value):
+    # Summary counters are stored under field names, which cannot contain dots or start with $
+    text = str(value).strip() if value is not None else ""
+    return text.replace(".", "_").lstrip("$") or UNKNOWN
+
+
+def age_band(age):
+    try:
+        age = int(str(age).strip())
+    except ValueError:
+        return UNKNOWN
+    for low, high, label in AGE_BANDS:
+        if low <= age <= high:
+            return label
+    return UNKNOWN
+
+
+def is_closed(status):
+    return str(status or "").strip().lower() == "closed"
+
+
+def _add(delta, field, amount):
+    delta[field] = delta.get(field, 0) + amount
+
+
+def criminal_delta(doc, sign, delta=None):
+    """``$inc`` counters for adding (sign 1) or removing (sign -1) one criminal."""
+    delta = {} if delta is None else delta
+    _add(delta, "total", sign)
+    for dimension in CRIMINAL_DIMENSIONS:
+        _add(delta, f"{dimension}.{_key(doc.get(dimension))}", sign)
+    _add(delta, f"age_band.{age_band(doc.get('age'))}", sign)
+    return delta
+
+
+def case_delta(doc, sign, delta=None):
+    delta = {} if delta is None else delta
+    _add(delta, "total", sign)
+    _add(delta, f"status.{_key(doc.get('status'))}", sign)
+    _add(delta, "closed" if is_closed(doc.get("status")) else "open", sign)
+    return delta
+
+
+def assignment_delta(doc, sign, delta=None):
+    delta = {} if delta is None else delta
+    _add(delta, "total", sign)
+    _add(delta, f"workload.{_key(doc.get('officer_id'))}", sign)
+    return delta
+
+
+def apply_delta(db, summary, delta):
+    """Apply counter changes to one summary document."""
+    delta = {field: amount for field, amount in delta.items() if amount}
+    if delta:
+        db[STATS_COLLECTION].update_one({"_id": summary}, {"$inc": delta}, upsert=True)
+
+
+def record_change(db, summary, delta_for, before=None, after=None):
+    """Update ``summary`` for a document going from ``before`` to ``after`` (either may be None)."""
+    delta = {}
+    if before:
+        delta_for(before, -1, delta)
+    if after:
+        delta_for(after, 1, delta)
+    apply_delta(db, summary, delta)
+
+
+def record_inserts(db, summary, delta_for, docs):
+    """Update ``summary`` for a batch of inserted documents with a single write."""
+    delta = {}
+    for doc in docs:
+        delta_for(doc, 1, delta)
+    apply_delta(db, summary, delta)
+
+
+def _nested_add(doc, dimension, key, count):
+    counts = doc.setdefault(dimension, {})
+    counts[key] = counts.get(key, 0) + count
+
+
+def _grouped(collection, fields):
+    group_id = {field: f"${field}" for field in fields}
+    pipeline = [{"$group": {"_id": group_id, "count": {"$sum": 1}}}]
+    for row in collection.aggregate(pipeline, allowDiskUse=True):
+        yield row["_id"], row["count"]
+
+
+def rebuild_stats(db):
+    """Recompute every summary document from the source collections."""
+    # Grouping by the combination of dimensions keeps this to one pass over each collection
+    criminals = {"total": 0}
+    for values, count in _grouped(db["criminals"], CRIMINAL_DIMENSIONS + ["age"]):
+        criminals["total"] += count
+        for dimension in CRIMINAL_DIMENSIONS:
+            _nested_add(criminals, dimension, _key(values.get(dimension)), count)
+        _nested_add(criminals, "age_band", age_band(values.get("age")), count)
+
+    cases = {"total": 0, "open": 0, "closed": 0}
+    for values, count in _grouped(db["cases"], ["status"]):
+        cases["total"] += count
+        _nested_add(cases, "status", _key(values.get("status")), count)
+        cases["closed" if is_closed(values.get("status")) else "open"] += count
+
+    officers = {"total": 0}
+    for values, count in _grouped(db["officer_assignments"], ["officer_id"]):
+        officers["total"] += count
+        _nested_add(officers, "workload", _key(values.get("officer_id")), count)
+
+    stats = db[STATS_COLLECTION]
+    for summary, doc in ((CRIMINALS_SUMMARY, criminals), (CASES_SUMMARY, cases), (OFFICERS_SUMMARY, officers)):
+        doc["rebuilt_at"] = datetime.now()
+        stats.replace_one({"_id": summary}, doc, upsert=True)
+    logger.info("Rebuilt statistics: %d criminals, %d cases, %d assignments",
+                criminals["total"], cases["total"], officers["total"])
+    return load_stats(db)
+
+
+def load_stats(db):
+    """Return ``{summary: document}`` for every summary (empty dicts if never built)."""
+    docs = {doc["_id"]: doc for doc in db[STATS_COLLECTION].find(
+        {"_id": {"$in": [CRIMINALS_SUMMARY, CASES_SUMMARY, OFFICERS_SUMMARY]}})}
+    return {summary: docs.get(summary, {}) for summary in (CRIMINALS_SUMMARY, CASES_SUMMARY, OFFICERS_SUMMARY)}
@@ -0,0 +1,191 @@
+"""Background task layer that keeps database and file I/O off the Tk main loop.
+
+Work runs on a thread pool; its result (or exception) is handed back to the
+main thread by a queue that is drained from ``root.after``, so callbacks are
+always free to touch Tk widgets. Database work additionally takes a slot from
+a semaphore that caps how many queries run at once.
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import messagebox, ttk
+
+from instrumentation import tagged
+
+_local = threading.local()
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+def current_task():
+    """Return the Task being run by this worker thread, if any."""
+    return getattr(_local, "task", None)
+
+
+class Task:
+    def __init__(self, name, owner):
+        self.name = name
+        self.owner = owner
+        self.future = None
+        self.callbacks = (None, None)
+        self.on_progress = None
+        self._progress = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def check(self):
+        """Raise TaskCancelled if the task was cancelled; call between steps of long work."""
+        if self.cancelled:
+            raise TaskCancelled(self.name)
+
+    def report_progress(self, done, total=None):
+        """Record progress from the worker; the latest value is delivered to ``on_progress``."""
+        self._progress = (done, total)
+
+
+class TaskRunner:
+    def __init__(self, root, max_workers=8, max_queries=4, poll_ms=50, describe_error=str):
+        self.root = root
+        self.poll_ms = poll_ms
+        # Turns an exception into the text shown when a task fails without an on_error
+        self.describe_error = describe_error
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crime-task")
+        self._query_slots = threading.BoundedSemaphore(max_queries)
+        self._results = queue.Queue()
+        self._posted = queue.Queue()
+        self._active = set()
+        self._status = None
+        self._busy = False
+        self.root.after(self.poll_ms, self._poll)
+
+    def attach_status(self, parent):
+        """Show a progress indicator in ``parent`` while tasks are running."""
+        frame = ttk.Frame(parent)
+        label = ttk.Label(frame, text="")
+        bar = ttk.Progressbar(frame, mode="indeterminate", length=120)
+        label.pack(side="left", padx=5)
+        self._status = (frame, label, bar)
+        return frame
+
+    def submit(self, work, on_done=None, on_error=None, owner=None, name=None, db=True, on_progress=None):
+        """Run ``work()`` in the background and pass its result to ``on_done``.
+
+        If ``owner`` (a Tk window) is destroyed before the task finishes, the
+        task is cancelled and its callbacks are skipped. ``db=False`` marks
+        work that does not talk to MongoDB and so does not need a query slot.
+        ``on_progress(done, total)`` receives what the work reports through
+        ``current_task().report_progress``.
+        """
+        task = Task(name or getattr(work, "__name__", "task"), owner)
+        task.callbacks = (on_done, on_error)
+        task.on_progress = on_progress
+        self._active.add(task)
+        task.future = self._executor.submit(self._run, task, work, db)
+        task.future.add_done_callback(lambda future: self._on_future_done(task, future))
+        self._update_status()
+        return task
+
+    def post(self, callback, owner=None):
+        """Run ``callback()`` on the main thread; safe to call from any thread.
+
+        Skipped if ``owner`` (a Tk window) has been destroyed by then.
+        """
+        self._posted.put((callback, owner))
+
+    def shutdown(self):
+        for task in list(self._active):
+            task.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _on_future_done(self, task, future):
+        # Tasks cancelled before they started never reach _run, so report them here
+        if future.cancelled():
+            self._results.put((task, None, TaskCancelled(task.name)))
+
+    def _run(self, task, work, db):
+        _local.task = task
+        try:
+            task.check()
+            # Queries issued by the work are attributed to the task's name
+            with tagged(task.name):
+                if db:
+                    with self._query_slots:
+                        task.check()
+                        result = work()
+                else:
+                    result = work()
+            self._results.put((task, result, None))
+        except BaseException as e:
+            self._results.put((task, None, e))
+        finally:
+            _local.task = None
+
+    def _poll(self):
+        while True:
+            try:
+                task, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._active.discard(task)
+            self._finish(task, result, error)
+        while True:
+            try:
+                callback, owner = self._posted.get_nowait()
+            except queue.Empty:
+                break
+            if owner is None or owner.winfo_exists():
+                try:
+                    callback()
+                except Exception as e:
+                    messagebox.showerror("Error", f"Update failed: {e}")
+        for task in list(self._active):
+            if task.owner is not None and not task.owner.winfo_exists():
+                task.cancel()
+            elif task.on_progress and task._progress is not None:
+                progress, task._progress = task._progress, None
+                task.on_progress(*progress)
+        self._update_status()
+        self.root.after(self.poll_ms, self._poll)
+
+    def _finish(self, task, result, error):
+        on_done, on_error = task.callbacks
+        if task.cancelled or isinstance(error, TaskCancelled):
+            return
+        if task.owner is not None and not task.owner.winfo_exists():
+            return
+        try:
+            if error is None:
+                if on_done:
+                    on_done(result)
+            elif on_error:
+                on_error(error)
+            else:
+                messagebox.showerror("Error", f"{task.name} failed: {self.describe_error(error)}")
+        except Exception as e:
+            messagebox.showerror("Error", f"{task.name} failed: {e}")
+
+    def _update_status(self):
+        if self._status is None:
+            return
+        frame, label, bar = self._status
+        if self._active:
+            label.configure(text=f"Working... ({len(self._active)} running)")
+            if not self._busy:
+                bar.pack(side="left", padx=5)
+                bar.start(10)
+        else:
+            label.configure(text="")
+            if self._busy:
+                bar.stop()
+                bar.pack_forget()
+        self._busy = bool(self._active)
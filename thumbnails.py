@@ -0,0 +1,95 @@
+"""Thumbnail generation and caching for biometric images stored in GridFS.
+
+Thumbnails are looked up in this order: an in-memory LRU, an on-disk store
+keyed by GridFS ``file_id`` and content hash, and finally ``load_sidecar``,
+which fetches the small thumbnail sidecar written to GridFS at upload time
+(see ``services.BiometricRepository.thumbnail``).
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+
+THUMBNAIL_SIZE = (150, 150)
+THUMBNAIL_FORMAT = "PNG"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "crime_analysis", "thumbnails")
+
+
+def make_thumbnail(data):
+    """Decode image bytes in memory and return PNG thumbnail bytes."""
+    # PIL is imported on first use so it stays out of application startup
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as image:
+        # draft() lets JPEG decoding skip straight to a reduced scale
+        image.draft("RGB", THUMBNAIL_SIZE)
+        image.thumbnail(THUMBNAIL_SIZE)
+        out = io.BytesIO()
+        image.save(out, THUMBNAIL_FORMAT)
+    return out.getvalue()
+
+
+def store_thumbnail(fs, thumbnail, file_id, filename):
+    """Write thumbnail bytes to GridFS as a sidecar of ``file_id``; return its id."""
+    return fs.put(thumbnail, filename=f"thumb_{filename}",
+                  contentType="image/png", thumbnail_of=file_id)
+
+
+class ThumbnailCache:
+    def __init__(self, load_sidecar, cache_dir=None, max_bytes=32 * 1024 * 1024):
+        self.load_sidecar = load_sidecar
+        self.cache_dir = cache_dir or os.environ.get("CRIME_THUMBNAIL_DIR", DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def _key(bio):
+        return f"{bio['file_id']}_{bio.get('sha256') or bio.get('md5') or 'nohash'}"
+
+    def peek(self, bio):
+        """Return the thumbnail if it is already in memory, without any I/O."""
+        with self._lock:
+            key = self._key(bio)
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            self._memory.move_to_end(key)
+            return entry[0]
+
+    def get(self, bio):
+        """Return a PIL thumbnail for a biometric record, loading it if needed."""
+        image = self.peek(bio)
+        if image is not None:
+            return image
+
+        key = self._key(bio)
+        path = os.path.join(self.cache_dir, f"{key}.png")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+        else:
+            data = self.load_sidecar(bio)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        from PIL import Image
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        self._remember(key, image)
+        return image
+
+    def _remember(self, key, image):
+        size = image.width * image.height * len(image.getbands())
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = (image, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+                _, (_, evicted_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+
@@ -0,0 +1,196 @@
+"""Parallel, streamed GridFS uploads with content-hash deduplication.
+
+Files are read and written to GridFS chunk by chunk, so a large evidence
+video is never held in memory, and several files are uploaded at once on a
+bounded thread pool. A SHA-256 of each file is computed as it streams; if a
+file with the same hash is already stored, the new copy is aborted (its
+chunks are removed) and the existing file id is returned instead. Stored
+files are unique by hash and length (``schema.CONTENT_INDEXES``), so two
+identical uploads racing each other still end up sharing one file.
+
+Each stored file counts the references to it in ``metadata.refs``. An upload
+takes one, atomically with finding a duplicate, and hands it to the record
+that saves the file id; ``orphans.release_files`` gives it back when the
+record is deleted or pointed at another file.
+
+Records that reference a file keep a copy of its display metadata
+(``file_summaries``), so listings never have to open GridFS; the content is
+only read by ``download`` when someone opens the file.
+"""
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gridfs import GridFSBucket
+from gridfs.errors import FileExists
+from pymongo import ReturnDocument
+
+from instrumentation import current_handler, tagged
+
+DEFAULT_CHUNK_SIZE = 255 * 1024
+DEFAULT_CONCURRENCY = 4
+FILE_SUMMARY_FIELDS = ("file_name", "file_size", "content_type", "file_sha256")
+REFS_FIELD = "metadata.refs"
+
+
+class UploadResult:
+    def __init__(self, path):
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.file_id = None
+        self.sha256 = None
+        self.length = 0
+        self.deduplicated = False
+        self.seconds = 0.0
+        self.error = None
+
+    @property
+    def throughput(self):
+        """Bytes per second."""
+        return self.length / self.seconds if self.seconds else 0.0
+
+    def to_dict(self):
+        return {"filename": self.filename, "file_id": self.file_id, "sha256": self.sha256,
+                "length": self.length, "deduplicated": self.deduplicated}
+
+
+class UploadEngine:
+    def __init__(self, db, chunk_size=DEFAULT_CHUNK_SIZE, concurrency=DEFAULT_CONCURRENCY):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.bucket = GridFSBucket(db, chunk_size_bytes=chunk_size)
+        self.files = db["fs.files"]
+        self._lock = threading.Lock()
+
+    def acquire_duplicate(self, sha256, length):
+        """Take a reference to the stored file with this content; returns its id, or None."""
+        doc = self.files.find_one_and_update({"metadata.sha256": sha256, "length": length},
+                                             {"$inc": {REFS_FIELD: 1}}, projection={"_id": 1},
+                                             return_document=ReturnDocument.AFTER)
+        return doc["_id"] if doc else None
+
+    def upload_stream(self, stream, filename, metadata=None, on_chunk=None, check=None, result=None):
+        """Stream a readable binary file object into GridFS; returns an UploadResult.
+
+        Errors are captured in ``result.error`` rather than raised.
+        """
+        result = result or UploadResult(filename)
+        started = time.perf_counter()
+        # The hash and reference count are filled in just before the stream is closed and the files document written
+        file_metadata = dict(metadata or {})
+        sha256 = hashlib.sha256()
+        try:
+            grid_in = self.bucket.open_upload_stream(result.filename, metadata=file_metadata)
+            try:
+                for chunk in iter(lambda: stream.read(self.chunk_size), b""):
+                    if check:
+                        check()
+                    sha256.update(chunk)
+                    grid_in.write(chunk)
+                    result.length += len(chunk)
+                    if on_chunk:
+                        on_chunk(result.length)
+                result.sha256 = sha256.hexdigest()
+                file_metadata.update(sha256=result.sha256, refs=1)
+                existing = self.acquire_duplicate(result.sha256, result.length)
+                if existing is None:
+                    try:
+                        grid_in.close()
+                        result.file_id = grid_in._id
+                    except FileExists:
+                        # An identical upload was stored first; share its file instead
+                        grid_in.abort()
+                        existing = self.acquire_duplicate(result.sha256, result.length)
+                        if existing is None:
+                            raise
+                if existing is not None:
+                    grid_in.abort()
+                    result.file_id = existing
+                    result.deduplicated = True
+            except BaseException:
+                grid_in.abort()
+                raise
+        except Exception as e:
+            result.error = e
+        result.seconds = time.perf_counter() - started
+        return result
+
+    def upload_file(self, path, metadata=None, on_chunk=None, check=None):
+        """Stream one local file into GridFS and return an UploadResult."""
+        result = UploadResult(path)
+        try:
+            with open(path, "rb") as f:
+                return self.upload_stream(f, result.filename, metadata, on_chunk, check, result)
+        except OSError as e:
+            result.error = e
+            return result
+
+    def upload_many(self, paths, metadata=None, on_progress=None, check=None):
+        """Upload ``paths`` in parallel; returns UploadResults in the same order.
+
+        ``on_progress(snapshot)`` receives ``{path: (bytes_sent, size)}`` for
+        every file whenever any of them makes progress.
+        """
+        sizes = {path: os.path.getsize(path) for path in paths}
+        sent = {path: 0 for path in paths}
+
+        def report(path, length):
+            with self._lock:
+                sent[path] = length
+                snapshot = {p: (sent[p], sizes[p]) for p in paths}
+            if on_progress:
+                on_progress(snapshot)
+
+        handler = current_handler()
+
+        def upload(path):
+            with tagged(handler):
+                return self.upload_file(path, metadata, on_chunk=lambda length: report(path, length), check=check)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="gridfs-upload") as pool:
+            return list(pool.map(upload, paths))
+
+    def download(self, file_id, path, on_chunk=None, check=None):
+        """Stream a stored file into ``path``; returns its length."""
+        grid_out = self.bucket.open_download_stream(file_id)
+        part_path = f"{path}.part"
+        received = 0
+        try:
+            with open(part_path, "wb") as f:
+                for chunk in iter(lambda: grid_out.read(self.chunk_size), b""):
+                    if check:
+                        check()
+                    f.write(chunk)
+                    received += len(chunk)
+                    if on_chunk:
+                        on_chunk(received)
+            os.replace(part_path, path)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        finally:
+            grid_out.close()
+        return received
+
+
+def file_summary(file_doc):
+    """The ``FILE_SUMMARY_FIELDS`` of an ``fs.files`` document."""
+    filename = file_doc.get("filename") or str(file_doc["_id"])
+    return {
+        "file_name": filename,
+        "file_size": file_doc.get("length", 0),
+        "content_type": mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        "file_sha256": (file_doc.get("metadata") or {}).get("sha256"),
+    }
+
+
+def file_summaries(db, file_ids):
+    """``{file_id: summary}`` for the given files, read with one query."""
+    cursor = db["fs.files"].find({"_id": {"$in": list(set(file_ids))}},
+                                 {"filename": 1, "length": 1, "metadata.sha256": 1})
+    return {doc["_id"]: file_summary(doc) for doc in cursor}
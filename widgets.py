@@ -0,0 +1,260 @@
+"""Reusable Tk widgets for large listings."""
+import tkinter as tk
+from tkinter import ttk
+
+from paging import matches_prefix
+
+
+class VirtualList(ttk.Frame):
+    """Scrollable list that only creates widgets for the rows on screen.
+
+    ``make_row(parent)`` builds one row widget and ``bind_row(widget, item)``
+    fills it with an item. Row widgets are kept in a small pool and re-bound
+    to whichever items are visible as the user scrolls. ``on_near_end`` is
+    called when the viewport gets within one screen of the last loaded item,
+    so the caller can fetch the next page.
+    """
+
+    def __init__(self, master, row_height, make_row, bind_row, on_near_end=None):
+        super().__init__(master)
+        self.row_height = row_height
+        self.make_row = make_row
+        self.bind_row = bind_row
+        self.on_near_end = on_near_end
+        self.items = []
+        self._pool = []
+
+        self.canvas = tk.Canvas(self, highlightthickness=0,
+                                yscrollincrement=max(1, row_height // 4))
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self._on_scroll)
+
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.canvas.bind("<Configure>", lambda e: self.refresh())
+        self.bind_wheel(self.canvas)
+
+    def bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", self._on_wheel)
+        widget.bind("<Button-4>", lambda e: self.canvas.yview_scroll(-1, "units"))
+        widget.bind("<Button-5>", lambda e: self.canvas.yview_scroll(1, "units"))
+
+    def _on_wheel(self, event):
+        self.canvas.yview_scroll(int(-event.delta / 120) or (-1 if event.delta > 0 else 1), "units")
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self._render()
+
+    def set_items(self, items):
+        self.items = list(items)
+        self.canvas.yview_moveto(0)
+        self.refresh()
+
+    def extend(self, items):
+        self.items.extend(items)
+        self.refresh()
+
+    def replace(self, start, end, items):
+        """Replace ``self.items[start:end]`` and re-bind the visible rows."""
+        self.items[start:end] = items
+        for slot in self._pool:
+            slot["index"] = None
+        self.refresh()
+
+    def rebind(self):
+        """Re-bind the visible rows, e.g. after data they display has arrived."""
+        for slot in self._pool:
+            slot["index"] = None
+        self._render()
+
+    def first_visible(self):
+        return int(self.canvas.canvasy(0) // self.row_height)
+
+    def refresh(self):
+        height = self.row_height * len(self.items)
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), height))
+        self._render()
+
+    def _render(self):
+        visible = self.canvas.winfo_height() // self.row_height + 2
+        first = max(0, self.first_visible())
+        width = self.canvas.winfo_width()
+
+        while len(self._pool) < visible:
+            widget = self.make_row(self.canvas)
+            self.bind_wheel(widget)
+            for child in widget.winfo_children():
+                self.bind_wheel(child)
+            window = self.canvas.create_window(0, 0, window=widget, anchor="nw",
+                                               height=self.row_height)
+            self._pool.append({"window": window, "widget": widget, "index": None})
+
+        for offset, slot in enumerate(self._pool):
+            index = first + offset
+            if index >= len(self.items):
+                self.canvas.itemconfigure(slot["window"], state="hidden")
+                slot["index"] = None
+                continue
+            self.canvas.coords(slot["window"], 0, index * self.row_height)
+            self.canvas.itemconfigure(slot["window"], state="normal", width=width)
+            if slot["index"] != index:
+                self.bind_row(slot["widget"], self.items[index])
+                slot["index"] = index
+
+        if self.on_near_end and first + 2 * visible >= len(self.items):
+            self.on_near_end()
+
+
+class DataGrid(ttk.Frame):
+    """Treeview over a server-side query, loaded a page at a time as the user scrolls.
+
+    ``fetch(sort, descending, filters, after, on_loaded, on_failed)`` starts
+    loading the page after ``after`` and later calls ``on_loaded(docs,
+    next_after)`` or ``on_failed(error)`` on the Tk thread. Clicking a ``sortable`` heading sorts by it (again to reverse),
+    and the filter bar matches a prefix of a sortable column; both are done by
+    the query, so only displayed rows are ever fetched. Rows are keyed by _id,
+    which lets ``apply_change`` patch them from change events; double-clicking
+    a row calls ``on_activate(_id)``.
+    """
+
+    LOAD_AHEAD = 0.8  # fetch the next page once the view is this far down the loaded rows
+
+    def __init__(self, master, columns, fetch, sortable=(), values=None, on_activate=None):
+        super().__init__(master)
+        self.columns = tuple(columns)
+        self.fetch = fetch
+        self.sortable = tuple(sortable)
+        self.values = values or (lambda doc: [doc.get(column, "") for column in self.columns])
+        self.sort = self.sortable[0] if self.sortable else None
+        self.descending = False
+        self.filters = {}
+        self._keys = {}  # iid -> sort key of the loaded rows
+        self._next_after = None
+        self._exhausted = False
+        self._loading = False
+        self._generation = 0
+
+        bar = ttk.Frame(self)
+        bar.pack(fill="x")
+        self.filter_column = ttk.Combobox(bar, values=self.sortable, width=14, state="readonly")
+        if self.sortable:
+            self.filter_column.set(self.sortable[0])
+        self.filter_text = ttk.Entry(bar, width=24)
+        self.filter_text.bind("<Return>", lambda e: self.apply_filter())
+        self.status = ttk.Label(bar)
+        ttk.Label(bar, text="Filter:").pack(side="left", padx=5, pady=5)
+        self.filter_column.pack(side="left")
+        self.filter_text.pack(side="left", padx=5)
+        ttk.Button(bar, text="Apply", command=self.apply_filter).pack(side="left")
+        ttk.Button(bar, text="Clear", command=self.clear_filter).pack(side="left", padx=5)
+        self.status.pack(side="right", padx=5)
+
+        body = ttk.Frame(self)
+        body.pack(fill="both", expand=True)
+        self.tree = ttk.Treeview(body, columns=self.columns, show="headings")
+        self.scrollbar = ttk.Scrollbar(body, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        for column in self.columns:
+            self.tree.heading(column, text=column,
+                              command=(lambda c=column: self.sort_by(c)) if column in self.sortable else "")
+        if on_activate:
+            self.tree.bind("<Double-1>", lambda e: self.tree.focus() and on_activate(self.tree.focus()))
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        self.reload()
+
+    def sort_by(self, column):
+        self.descending = not self.descending if column == self.sort else False
+        self.sort = column
+        self.reload()
+
+    def apply_filter(self):
+        text = self.filter_text.get().strip()
+        self.filters = {self.filter_column.get(): text} if text else {}
+        self.reload()
+
+    def clear_filter(self):
+        self.filter_text.delete(0, "end")
+        self.apply_filter()
+
+    def reload(self):
+        """Drop the loaded rows and fetch the first page with the current sort and filter."""
+        self._generation += 1
+        self.tree.delete(*self.tree.get_children())
+        self._keys.clear()
+        self._next_after = None
+        self._exhausted = False
+        self._loading = False
+        for column in self.columns:
+            arrow = (" ▼" if self.descending else " ▲") if column == self.sort else ""
+            self.tree.heading(column, text=column + arrow)
+        self._load_more()
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if float(last) >= self.LOAD_AHEAD:
+            self._load_more()
+
+    def _load_more(self):
+        if self._loading or self._exhausted:
+            return
+        self._loading = True
+        generation = self._generation
+
+        def on_loaded(docs, next_after):
+            # A reply for a sort or filter that has since changed is dropped
+            if generation != self._generation:
+                return
+            self._loading = False
+            for doc in docs:
+                iid = str(doc["_id"])
+                if not self.tree.exists(iid):
+                    self.tree.insert("", "end", iid=iid, values=self.values(doc))
+                    self._keys[iid] = self._sort_key(doc)
+            self._next_after = next_after
+            self._exhausted = next_after is None
+            self.status.configure(text=f"{len(self._keys)} rows" + ("" if self._exhausted else "+"))
+            # Keep going until the view is filled
+            if not self._exhausted and float(self.tree.yview()[1]) >= self.LOAD_AHEAD:
+                self._load_more()
+
+        def on_failed(error):
+            if generation == self._generation:
+                self._loading = False
+                self.status.configure(text=f"Loading failed: {error}")
+
+        self.fetch(self.sort, self.descending, dict(self.filters), self._next_after, on_loaded, on_failed)
+
+    def _sort_key(self, doc):
+        value = doc.get(self.sort) if self.sort else None
+        return (value is not None, "" if value is None else value, str(doc["_id"]))
+
+    def _matches(self, doc):
+        # The same rule as the repositories' grid query, so a live row is one a reload would return
+        return all(matches_prefix(doc.get(column), prefix) for column, prefix in self.filters.items())
+
+    def apply_change(self, event):
+        """Patch the loaded rows for a change event (see ``changes.ChangeFeed``)."""
+        if event["op"] == "reset":
+            self.reload()
+            return
+        iid = event["id"]
+        if self.tree.exists(iid):
+            self.tree.delete(iid)
+            del self._keys[iid]
+        doc = event["doc"]
+        if event["op"] == "delete" or doc is None or not self._matches(doc):
+            return
+        # Place the row where the query would have; rows past the loaded pages arrive when scrolled to
+        key = self._sort_key(doc)
+        try:
+            index = next((i for i, other in enumerate(self.tree.get_children())
+                          if (key > self._keys[other] if self.descending else key < self._keys[other])), None)
+        except TypeError:
+            return
+        if index is None and not self._exhausted:
+            return
+        self.tree.insert("", "end" if index is None else index, iid=iid, values=self.values(doc))
+        self._keys[iid] = key